@@ -1,7 +1,9 @@
+import asyncio
 import datetime
 import json
 import logging
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
@@ -10,6 +12,8 @@ from rich.logging import RichHandler
 
 from db.store import initialize_database
 from routers import primary_router
+from routers.nlq.async_helpers import run_product_index_refresher, run_replica_refresher
+from routers.nlq.cost_guard import ByteBudget, request_byte_budget
 from settings import get_settings
 
 settings = get_settings()
@@ -45,12 +49,28 @@ db_file = "conversations.db"
 
 if not os.path.exists(db_file):
     print(f"Database file '{db_file}' not found. Creating a new instance...")
-    initialize_database()
 else:
     print(f"Database file '{db_file}' already exists.")
+# Idempotent: also adds indexes introduced after the file was created
+initialize_database()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background_tasks = []
+    if settings.PRODUCT_INDEX_ENABLED:
+        background_tasks.append(
+            asyncio.create_task(run_product_index_refresher(settings.PRODUCT_INDEX_REFRESH_INTERVAL))
+        )
+    if settings.REPLICA_ENABLED:
+        background_tasks.append(asyncio.create_task(run_replica_refresher(settings.REPLICA_REFRESH_INTERVAL)))
+    yield
+    for task in background_tasks:
+        task.cancel()
 
 
 app = FastAPI(
+    lifespan=lifespan,
     swagger_ui_parameters={"syntaxHighlight": False},
     title="Red Lens API",
     description="RedLens API helps you find products. 🚀",
@@ -72,6 +92,7 @@ app = FastAPI(
 @app.middleware("http")
 async def log_structured_requests(request: Request, call_next):
     start_time = datetime.datetime.now()
+    request_byte_budget.set(ByteBudget(settings.BIGQUERY_MAX_BYTES_PER_REQUEST))
 
     if settings.APP_ENV == "dev" and LOG_ENABLED:
         from pyinstrument import Profiler
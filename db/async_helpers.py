@@ -0,0 +1,100 @@
+import json
+import uuid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+
+from db.store import AsyncSessionLocal, Conversation, Summary
+
+
+# Create a new conversation
+async def create_conversation(user_content: str, ai_content: str) -> Conversation:
+    async with AsyncSessionLocal() as session:
+        conversation = Conversation(
+            id=str(uuid.uuid4()),
+            chat_id=str(uuid.uuid4()),
+            user_content=user_content,
+            ai_content=ai_content,
+        )
+        session.add(conversation)
+        await session.commit()
+        return conversation
+
+
+# Retrieve conversation history
+async def get_conversation(chat_id: Optional[str]) -> Optional[List[Conversation]]:
+    if not chat_id:
+        return None
+    async with AsyncSessionLocal() as session:
+        # Served by ix_conversations_chat_id_created_at, no sort step needed
+        result = await session.execute(
+            select(Conversation)
+            .where(Conversation.chat_id == chat_id)
+            .order_by(Conversation.created_at.desc())
+            .limit(10)
+        )
+        conversation = list(result.scalars())
+        if conversation:
+            return conversation
+        return None
+
+
+# Save a message to the conversation, returning its id
+async def save_message(chat_id: str, user_content: str, ai_content: str) -> Optional[str]:
+    async with AsyncSessionLocal() as session:
+        existing = await session.scalar(
+            select(Conversation.id).where(Conversation.chat_id == chat_id).limit(1)
+        )
+        if not existing:
+            return None
+        message_id = str(uuid.uuid4())
+        session.add(
+            Conversation(
+                id=message_id,
+                chat_id=chat_id,
+                user_content=user_content,
+                ai_content=ai_content,
+            )
+        )
+        await session.commit()
+        return message_id
+
+
+# Replace the AI reply of a message
+async def update_message(message_id: str, ai_content: str):
+    async with AsyncSessionLocal() as session:
+        conversation = await session.get(Conversation, message_id)
+        if conversation:
+            conversation.ai_content = ai_content
+            await session.commit()
+
+
+# Create or update a background summary
+async def save_summary(summary_id: str, summary: Dict[str, Any]):
+    async with AsyncSessionLocal() as session:
+        await session.merge(
+            Summary(
+                id=summary_id,
+                status=summary["status"],
+                message=summary.get("message"),
+                result_analysis=summary.get("result_analysis"),
+                analytics_queries=json.dumps(summary.get("analytics_queries")),
+                conversation_id=summary.get("conversation_id"),
+            )
+        )
+        await session.commit()
+
+
+# Retrieve a background summary
+async def get_summary(summary_id: str) -> Optional[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        summary = await session.get(Summary, summary_id)
+        if summary is None:
+            return None
+        return {
+            "status": summary.status,
+            "message": summary.message,
+            "result_analysis": summary.result_analysis,
+            "analytics_queries": json.loads(summary.analytics_queries) if summary.analytics_queries else None,
+            "conversation_id": summary.conversation_id,
+        }
@@ -1,14 +1,52 @@
-from sqlalchemy import Column, DateTime, String, Text, create_engine
+from sqlalchemy import Column, DateTime, Index, String, Text, create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.sql import func
 
+from settings import get_settings
+
+settings = get_settings()
+
 # Database URL (SQLite in this case)
 DATABASE_URL = "sqlite:///./conversations.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./conversations.db"
+
+# WAL lets readers proceed while another worker writes; the rest trades a little durability
+# on power loss (never corruption) for far fewer fsyncs.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -16000,
+    "temp_store": "MEMORY",
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
 
 # Create engine and session
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+event.listen(engine, "connect", _apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
 
+# Async engine and session, with a bounded connection pool per worker
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.CONVERSATION_DB_POOL_SIZE,
+    max_overflow=settings.CONVERSATION_DB_MAX_OVERFLOW,
+    pool_timeout=settings.CONVERSATION_DB_POOL_TIMEOUT,
+)
+event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 # Base for models
 Base = declarative_base()
 
@@ -16,6 +54,9 @@ Base = declarative_base()
 # Conversation model
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_chat_id_created_at", "chat_id", "created_at"),
+    )
 
     id = Column(String, primary_key=True, index=True)
     chat_id = Column(String)
@@ -24,6 +65,23 @@ class Conversation(Base):
     created_at = Column(DateTime, server_default=func.now())
 
 
+# Background summary model, polled by its id
+class Summary(Base):
+    __tablename__ = "summaries"
+
+    id = Column(String, primary_key=True, index=True)
+    status = Column(String, nullable=False)
+    message = Column(Text)
+    result_analysis = Column(Text)
+    analytics_queries = Column(Text)
+    conversation_id = Column(String)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
 # Initialize the database
 def initialize_database():
     Base.metadata.create_all(bind=engine)
+    # create_all skips indexes of tables that already exist
+    for index in Conversation.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
@@ -13,3 +13,4 @@ class CategoryRequest(BaseModel):
 class CategoryResponse(BaseModel):
     category: Optional[str] = None
     results: List[MarketplaceProductNigeria]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,1058 @@
+import asyncio
+import json
+import os
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple, Type
+
+import httpx
+import pandas as pd
+from openai import AsyncOpenAI
+
+from db.async_helpers import (  # noqa: F401
+    create_conversation,
+    get_conversation,
+    get_summary,
+    save_message,
+    save_summary,
+    update_message,
+)
+from db.store import Conversation
+from routers.nlq import helpers
+from routers.nlq.bigquery_cache import BigQueryResultCache, CachedQueryJob
+from routers.nlq.helpers import (
+    CATEGORIES,
+    build_context_analytics,
+    build_context_chat,
+    build_context_nlq,
+    build_context_nlq_sku,
+    build_context_query_plan,
+    build_whatsapp_context_nlq_sku,
+    console,
+    format_conversations,
+    settings,
+)
+from routers.nlq.intent import Intent, IntentClassifier
+from routers.nlq.local_summary import SummaryMode, analyze_results, no_products_reply, render_summary
+from routers.nlq.metrics import CompletionUsageStats, register_stats
+from routers.nlq.pagination import CURSOR_MISMATCH, PageCursor, encode_cursor, snapshot_label
+from routers.nlq.product_index import ProductNameIndex
+from routers.nlq.projection import PRODUCT_RESPONSE_COLUMNS
+from routers.nlq.query_builder import (
+    PRODUCT_TABLE_NG,
+    PRODUCT_TABLE_NON_NG,
+    SKU_TABLE_NG,
+    SKU_TABLE_NON_NG,
+    category_page_query,
+    sku_table,
+)
+from routers.nlq.query_shapes import QueryShapeParser
+from routers.nlq.scheduler import QueryRejected
+from routers.nlq.schemas import DataAnalysis, QueryPlan, Text2SQL
+from routers.nlq.single_flight import SingleFlight, text_digest
+from routers.nlq.summary_input import build_summary_input
+from routers.nlq.summary_store import SummaryStore
+from routers.nlq.text2sql_cache import Text2SQLCache
+
+async_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+http_client = httpx.AsyncClient(timeout=30)
+completion_usage = CompletionUsageStats()
+register_stats("completion_usage", completion_usage.stats)
+# Identical requests arriving together, e.g. the same photo during a promotion, share each stage's work
+single_flight = SingleFlight(enabled=settings.SINGLE_FLIGHT_ENABLED)
+register_stats("single_flight", single_flight.stats)
+# Summaries answered locally or by the model, and the background rewrites of local ones
+summary_counts = Counter()
+polish_tasks: Set[asyncio.Task] = set()
+register_stats("summaries", lambda: {**summary_counts, "polishing": len(polish_tasks)})
+# Summaries deferred by /web, polled from /web/summary/{summary_id}
+summary_store = SummaryStore(max_entries=settings.SUMMARY_STORE_MAX_ENTRIES, saver=save_summary, loader=get_summary)
+register_stats("summary_store", summary_store.stats)
+
+
+async def embed_text(text: str) -> List[float]:
+    """Embeds a short text for semantic lookups.
+
+    Args:
+        text: The text to embed.
+
+    Returns:
+        List[float]: The embedding vector.
+    """
+    response = await async_client.embeddings.create(model="text-embedding-3-small", input=text)
+    return response.data[0].embedding
+
+
+text2sql_cache = Text2SQLCache(
+    max_entries=settings.TEXT2SQL_CACHE_MAX_ENTRIES,
+    ttl=settings.TEXT2SQL_CACHE_TTL,
+    similarity_threshold=settings.TEXT2SQL_CACHE_SIMILARITY,
+    embedder=embed_text if settings.TEXT2SQL_CACHE_SEMANTIC else None,
+)
+register_stats("text2sql_cache", text2sql_cache.stats)
+
+product_indexes = {table: ProductNameIndex() for table in (SKU_TABLE_NG, SKU_TABLE_NON_NG)}
+for _table, _index in product_indexes.items():
+    register_stats(f"product_index.{_table}", _index.stats)
+
+
+def product_name_exists(phrase: str, country: Optional[str]) -> bool:
+    """Tells whether a product name of the country contains a phrase, from the local index.
+
+    Args:
+        phrase: The lowercase phrase.
+        country: The country to search for.
+
+    Returns:
+        bool: True if a product name contains the phrase; False as well when the index is disabled or
+            not built yet.
+    """
+    index = product_indexes[sku_table(country)]
+    return settings.PRODUCT_INDEX_ENABLED and index.ready and index.contains(phrase)
+
+
+# Known brands are filled in from the catalog by every replica refresh
+query_shape_parser = QueryShapeParser(
+    categories=[line.strip().rstrip(",") for line in CATEGORIES.splitlines() if line.strip()],
+    products=product_name_exists,
+)
+register_stats("query_fast_path", query_shape_parser.stats)
+
+
+def is_catalog_word(word: str) -> bool:
+    """Tells whether a word is part of a category, brand or product name.
+
+    Args:
+        word: The lowercase word.
+
+    Returns:
+        bool: True if the query shape vocabulary or a product name index has the word.
+    """
+    if query_shape_parser.has_word(word):
+        return True
+    return settings.PRODUCT_INDEX_ENABLED and any(
+        index.ready and index.has_token(word) for index in product_indexes.values()
+    )
+
+
+intent_classifier = IntentClassifier(min_confidence=settings.INTENT_MIN_CONFIDENCE, catalog_word=is_catalog_word)
+register_stats("intent_router", intent_classifier.stats)
+
+
+@single_flight.coalesce("detect_text", lambda base64_encoded_image: text_digest(base64_encoded_image), copy_result=True)
+async def detect_text(base64_encoded_image: str) -> Optional[Dict]:
+    """Detects text in a base64 encoded image using Google Cloud Vision API without blocking the event loop.
+
+    Args:
+        base64_encoded_image (str): The base64 encoded image to analyze.
+
+    Returns:
+        Dict: The response from the Vision API containing detected text annotations.
+            On failure, returns None.
+    """
+    request_body = {
+        "requests": [
+            {
+                "image": {"content": base64_encoded_image},
+                "features": [{"type": "TEXT_DETECTION"}],
+            }
+        ]
+    }
+    headers = {
+        "X-goog-api-key": os.environ.get("GCP_API_KEY", None),
+        "Content-Type": "application/json; charset=utf-8",
+    }
+
+    url = "https://vision.googleapis.com/v1/images:annotate"
+
+    response = await http_client.post(url, headers=headers, json=request_body)
+    if response.status_code == 200:
+        return response.json()
+    return None
+
+
+@single_flight.coalesce("image_inference", lambda product_image: text_digest(product_image))
+async def request_image_inference(product_image: str) -> Optional[str]:
+    """Requests image inference from a remote API without blocking the event loop.
+
+    Args:
+        product_image: The base64 encoded image to analyze.
+
+    Returns:
+        Optional[str]: The inferred product name.
+    """
+    product_name = None
+    api_token = os.environ.get("INFERENCE_API_TOKEN", None)
+
+    url = "https://redcloud-inference-8cae8b3-v27.app.beam.cloud"
+    headers = {
+        "Authorization": f"Bearer {api_token}",
+        "Content-Type": "application/json",
+    }
+
+    response = await http_client.post(url, headers=headers, json={"image": product_image})
+    result = response.json()
+    if result["status"] != "error":
+        product_name = result.get("result")
+    return product_name
+
+
+@single_flight.coalesce("azure_vision", lambda base64_image: text_digest(base64_image), copy_result=True)
+async def azure_vision_service(base64_image: str) -> Optional[Dict]:
+    """Processes an image using Azure Vision API on a worker thread.
+
+    Args:
+        base64_image: The base64 encoded image to process.
+
+    Returns:
+        Dict: The response from the Azure Vision API containing the inference results.
+    """
+    return await asyncio.to_thread(helpers.azure_vision_service, base64_image)
+
+
+async def recognize_image(
+    image: str,
+    steps: List[Tuple[Callable[[str], Awaitable[Any]], Callable[[Any], Any]]],
+    mode: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Any:
+    """Runs image recognizers and returns the first result accepted by its callback.
+
+    In "concurrent" mode every recognizer starts at once and the first accepted result wins;
+    the remaining recognizers are cancelled. In "sequential" mode they run one after the other
+    in the given order.
+
+    Args:
+        image: The base64 encoded image to recognize.
+        steps: Pairs of recognizer and callback. The callback maps a raw recognizer result to
+            the accepted value, or to a falsy value when the result is rejected.
+        mode: "concurrent" or "sequential", defaults to settings.IMAGE_RECOGNITION_MODE.
+        timeout: Overall time budget in seconds, defaults to settings.IMAGE_RECOGNITION_TIMEOUT.
+
+    Returns:
+        Any: The first accepted callback value, or None if nothing was accepted in time.
+    """
+    mode = mode or settings.IMAGE_RECOGNITION_MODE
+    timeout = settings.IMAGE_RECOGNITION_TIMEOUT if timeout is None else timeout
+
+    async def run_step(index: int, recognizer: Callable[[str], Awaitable[Any]], callback: Callable[[Any], Any]):
+        try:
+            result = await recognizer(image)
+            return callback(result) if result else None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            console.log(f"[bold red]error happened in recognizer {index}: {e}")
+            return None
+
+    if mode == "sequential":
+        async def run_in_order():
+            for index, (recognizer, callback) in enumerate(steps):
+                accepted = await run_step(index, recognizer, callback)
+                if accepted:
+                    return accepted
+            return None
+
+        try:
+            return await asyncio.wait_for(run_in_order(), timeout)
+        except asyncio.TimeoutError:
+            console.log(f"[bold red]image recognition timed out after {timeout}s")
+            return None
+
+    tasks = [
+        asyncio.create_task(run_step(index, recognizer, callback))
+        for index, (recognizer, callback) in enumerate(steps)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=timeout):
+            accepted = await next_done
+            if accepted:
+                return accepted
+    except asyncio.TimeoutError:
+        console.log(f"[bold red]image recognition timed out after {timeout}s")
+    finally:
+        for task in tasks:
+            task.cancel()
+    return None
+
+
+def _record_usage(prompt: str, completion) -> None:
+    """Records the token usage of a completion, logging the prompt tokens served from cache.
+
+    Args:
+        prompt: The name of the prompt.
+        completion: The finished completion.
+    """
+    usage = completion.usage
+    cached_tokens = completion_usage.record(prompt, usage)
+    if usage is not None:
+        console.log(f"[{prompt}] prompt_tokens={usage.prompt_tokens} cached_tokens={cached_tokens}")
+
+
+async def _parse_completion(context: str, natural_query: Optional[str], response_format, prompt: str) -> Dict:
+    """Runs a structured-output completion and decodes its JSON content.
+
+    Args:
+        context: The system prompt.
+        natural_query: The user's natural language query.
+        response_format: The pydantic model describing the structured output.
+        prompt: The name the completion's token usage is recorded under.
+
+    Returns:
+        Dict: The decoded completion content.
+    """
+    completion = await async_client.beta.chat.completions.parse(
+        model="gpt-4o-2024-08-06",
+        messages=[
+            {"role": "system", "content": context},
+            {"role": "user", "content": natural_query or ""},
+        ],
+        response_format=response_format,
+    )
+    _record_usage(prompt, completion)
+    return json.loads(completion.choices[0].message.content)
+
+
+def classify_intent(natural_query: Optional[str]) -> Intent:
+    """Decides locally whether a text query is a catalog search, chit-chat or malicious.
+
+    Routing on the intent spares chit-chat the Text2SQL call that would come back without SQL, and
+    malicious queries every LLM call.
+
+    Args:
+        natural_query: The natural language query.
+
+    Returns:
+        Intent: The intent, always SEARCH when the intent router is disabled.
+    """
+    if not settings.INTENT_ROUTER_ENABLED:
+        return Intent.SEARCH
+    return intent_classifier.classify(natural_query)
+
+
+@single_flight.coalesce(
+    "nlq",
+    lambda natural_query, product_name, amount, country: text2sql_cache.make_key(
+        natural_query, country, amount, "nlq", product_name
+    ),
+    copy_result=True,
+)
+async def parse_nlq_search_query(
+    natural_query: Optional[str],
+    product_name: Optional[str],
+    amount: Optional[int],
+    country: Optional[str] = None,
+) -> Optional[Dict[str, str | List[str]]]:
+    """Parses a natural language query for search.
+
+    Args:
+        natural_query: The natural language query string to process.
+        product_name: Optional product name to include in context.
+        amount: Optional result limit, defaults to 10.
+        country: Optional country filter, defaults to None.
+
+    Returns:
+        Optional[Dict[str, str | List[str]]]: A dictionary containing the parsed query results. Queries of
+            a common shape are compiled locally and also carry their query_parameters.
+    """
+    if not natural_query and not product_name:
+        return None
+
+    if settings.QUERY_FAST_PATH_ENABLED and not product_name:
+        parsed = query_shape_parser.parse(natural_query, country, amount or 10)
+        if parsed:
+            return parsed
+
+    cache_key = dict(country=country, limit=amount, kind="nlq", product_name=product_name)
+    if settings.TEXT2SQL_CACHE_ENABLED:
+        cached = await text2sql_cache.get(natural_query, **cache_key)
+        if cached:
+            return cached
+
+    context = build_context_nlq(product_name, country=country, total=amount)
+    try:
+        extracted_data = await _parse_completion(context, natural_query, Text2SQL, "nlq")
+    except (KeyError, json.JSONDecodeError) as e:
+        console.log(f"Error parsing query: {e}")
+        return None
+
+    if settings.TEXT2SQL_CACHE_ENABLED:
+        await text2sql_cache.set(natural_query, value=extracted_data, **cache_key)
+    return extracted_data
+
+
+# Plans that continue a conversation are never shared
+@single_flight.coalesce(
+    "plan",
+    lambda natural_query, amount, country, conversations: None if conversations else text2sql_cache.make_key(
+        natural_query, country, amount, "plan"
+    ),
+    copy_result=True,
+)
+async def plan_query(
+    natural_query: Optional[str],
+    amount: Optional[int],
+    country: Optional[str] = None,
+    conversations: Optional[List[Conversation]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Plans a text query: its intent, its SQL, a reply for when there are no results and suggested queries.
+
+    One completion replaces the Text2SQL call and the regular_chat call that followed it whenever
+    the query had no SQL or its SQL found nothing. Queries of a common shape are compiled locally
+    with a templated reply, and all queries go to parse_nlq_search_query, without a reply, when the
+    query plan is disabled.
+
+    Args:
+        natural_query: The natural language query string to process.
+        amount: Optional result limit, defaults to 10.
+        country: Optional country filter, defaults to None.
+        conversations: Optional list of Conversation objects.
+
+    Returns:
+        Optional[Dict[str, Any]]: The plan, shaped like the result of parse_nlq_search_query plus the
+            intent, the reply as data_summary and the user_message, or None when the query cannot be planned.
+    """
+    if not natural_query:
+        return None
+    if not settings.QUERY_PLAN_ENABLED:
+        return await parse_nlq_search_query(natural_query, None, amount, country=country)
+
+    if settings.QUERY_FAST_PATH_ENABLED:
+        parsed = query_shape_parser.parse(natural_query, country, amount or 10)
+        if parsed:
+            # The subject is in the catalog, so only its price or stock filter can leave no results
+            parsed.update(
+                intent="search",
+                data_summary=no_products_reply(country),
+                user_message={"role": "user", "content": natural_query},
+            )
+            return parsed
+
+    # The reply may draw on the conversation, so only plans made without one are cached
+    use_cache = settings.TEXT2SQL_CACHE_ENABLED and not conversations
+    cache_key = dict(country=country, limit=amount, kind="plan")
+    plan = await text2sql_cache.get(natural_query, **cache_key) if use_cache else None
+    if not plan:
+        context = build_context_query_plan(country=country, total=amount)
+        try:
+            plan = await _chat_completion(context, natural_query, conversations, "plan", QueryPlan)
+        except (KeyError, json.JSONDecodeError) as e:
+            console.log(f"Error planning query: {e}")
+            return None
+        del plan["ai_context"], plan["user_message"]
+        if plan.get("intent") != "search":
+            plan["sql_query"] = None
+        if use_cache:
+            await text2sql_cache.set(natural_query, value=plan, **cache_key)
+
+    # A cached plan may have been made for a similar query, so the user's own words are attached afresh
+    plan["user_message"] = {"role": "user", "content": natural_query}
+    return plan
+
+
+@single_flight.coalesce(
+    "sku",
+    lambda natural_query, product_name, country: text2sql_cache.make_key(
+        natural_query, country, None, "sku", product_name
+    ),
+    copy_result=True,
+)
+async def parse_sku_clause(
+    natural_query: Optional[str],
+    product_name: Optional[str],
+    country: Optional[str] = None,
+) -> Optional[Dict[str, str | List[str]]]:
+    """Generates the Text2SQL clause that refines a SKU search.
+
+    The clause does not depend on the SKU rows, so it can be requested while the SKU mapping
+    query is still running. The SKU query itself comes from query_builder.sku_query.
+
+    Args:
+        natural_query: The natural language query string to process.
+        product_name: Optional product name recognized from an image.
+        country: Optional country filter, defaults to None.
+
+    Returns:
+        Optional[Dict[str, str | List[str]]]: A dictionary containing the parsed clause.
+    """
+    if not natural_query and not product_name:
+        return None
+
+    cache_key = dict(country=country, limit=None, kind="sku", product_name=product_name)
+    if settings.TEXT2SQL_CACHE_ENABLED:
+        cached = await text2sql_cache.get(natural_query, **cache_key)
+        if cached:
+            return cached
+
+    context = build_context_nlq_sku(country=country)
+    try:
+        extracted_data = await _parse_completion(context, natural_query, Text2SQL, "sku")
+    except (KeyError, json.JSONDecodeError) as e:
+        console.log(f"Error parsing query: {e}")
+        return None
+
+    if settings.TEXT2SQL_CACHE_ENABLED:
+        await text2sql_cache.set(natural_query, value=extracted_data, **cache_key)
+    return extracted_data
+
+
+@single_flight.coalesce(
+    "whatsapp_sku",
+    lambda natural_query, product_name, country: text2sql_cache.make_key(
+        natural_query, country, None, "whatsapp_sku", product_name
+    ),
+    copy_result=True,
+)
+async def parse_whatsapp_sku_clause(
+    natural_query: Optional[str],
+    product_name: Optional[str],
+    country: Optional[str] = None,
+) -> Optional[Dict[str, str | List[str]]]:
+    """Generates the Text2SQL clause that refines a WhatsApp SKU search.
+
+    The clause does not depend on the SKU rows, so it can be requested while the SKU lookup
+    is still running. The SKU query itself comes from query_builder.external_mapping_query.
+
+    Args:
+        natural_query: The natural language query string to process.
+        product_name: Optional product name recognized from an image.
+        country: Optional country filter, defaults to None.
+
+    Returns:
+        Optional[Dict[str, str | List[str]]]: A dictionary containing the parsed clause.
+    """
+    if not natural_query and not product_name:
+        return None
+
+    cache_key = dict(country=country, limit=None, kind="whatsapp_sku", product_name=product_name)
+    if settings.TEXT2SQL_CACHE_ENABLED:
+        cached = await text2sql_cache.get(natural_query, **cache_key)
+        if cached:
+            return cached
+
+    context = build_whatsapp_context_nlq_sku(country=country)
+    try:
+        # incase open ai is down / or rate limited
+        extracted_data = await _parse_completion(context, natural_query, Text2SQL, "whatsapp_sku")
+    except Exception as e:
+        console.log(f"Error parsing query: {e}")
+        return {
+            "sql_query": "",
+            "suggested_queries": [natural_query]
+        }
+
+    if settings.TEXT2SQL_CACHE_ENABLED:
+        await text2sql_cache.set(natural_query, value=extracted_data, **cache_key)
+    return extracted_data
+
+
+async def run_admitted(function: Callable[..., Any], *args: Any) -> Any:
+    """Runs a blocking BigQuery job on a worker thread once the scheduler has admitted it.
+
+    The job waits for its slot on the event loop, so queued jobs hold no thread of the default
+    executor, which the image recognizers, vector searches and WhatsApp sends share.
+
+    Args:
+        function: The blocking function that runs the job.
+        *args: Its arguments.
+
+    Returns:
+        Any: The function's result, or None if the job could not start before the request's deadline.
+    """
+    try:
+        async with helpers.query_scheduler.admit_async():
+            return await asyncio.to_thread(function, *args)
+    except QueryRejected as e:
+        console.log(f"[bold yellow]BigQuery job rejected: {e}")
+        return None
+
+
+# Exports and index loads bypass the cache and are not coalesced either
+@single_flight.coalesce(
+    "bigquery",
+    lambda sql_query, query_parameters, columns, use_cache, use_replica: (
+        BigQueryResultCache.make_key(sql_query, query_parameters), tuple(columns or ()), use_replica
+    ) if use_cache else None,
+)
+async def execute_bigquery(
+    sql_query: str,
+    query_parameters: Optional[Sequence[Any]] = None,
+    columns: Optional[Sequence[str]] = None,
+    use_cache: bool = True,
+    use_replica: bool = True,
+) -> CachedQueryJob | None:
+    """Executes a SQL query, locally when possible and otherwise on BigQuery on a worker thread.
+
+    Args:
+        sql_query: The SQL query to execute.
+        query_parameters: Optional BigQuery query parameters referenced by the query.
+        columns: Optional columns the caller reads; SELECT * is narrowed to them.
+        use_cache: Whether to read from and write to the result cache.
+        use_replica: Whether the local product replica may answer the query.
+
+    Returns:
+        CachedQueryJob: The materialized results of the query, or None if the query failed.
+    """
+    # Cache and replica hits skip the scheduler's queue
+    sql_query, local_job = await asyncio.to_thread(
+        helpers.local_query_result, sql_query, query_parameters, use_cache, use_replica, columns
+    )
+    if local_job is not None:
+        return local_job
+    return await run_admitted(helpers.run_bigquery_job, sql_query, query_parameters, use_cache)
+
+
+async def refresh_product_index(table: str) -> None:
+    """Rebuilds the product name index of a SKU mapping table from BigQuery.
+
+    Args:
+        table: The SKU mapping table.
+    """
+    query_job = await execute_bigquery(f"SELECT `Product Name`, Mapping, SKU_STRING FROM `{table}`", use_cache=False)
+    if not query_job:
+        console.log(f"[bold red]Could not load {table} for the product index")
+        return
+    await asyncio.to_thread(product_indexes[table].build, query_job.result())
+    console.log(f"Product index of {table} rebuilt: {product_indexes[table].stats()['rows']} rows")
+
+
+async def run_product_index_refresher(interval: float) -> None:
+    """Keeps the product name indexes fresh, rebuilding them every interval seconds.
+
+    Args:
+        interval: The seconds between rebuilds.
+    """
+    while True:
+        for table in product_indexes:
+            try:
+                await refresh_product_index(table)
+            except Exception as e:
+                console.log(f"[bold red]Error refreshing the product index of {table}: {e}")
+        await asyncio.sleep(interval)
+
+
+async def refresh_replica() -> None:
+    """Exports every replicated view from BigQuery to a fresh Parquet snapshot."""
+    brands = set()
+    for table in helpers.product_replica.tables:
+        query_job = await execute_bigquery(f"SELECT * FROM `{table}`", use_cache=False, use_replica=False)
+        if not query_job:
+            console.log(f"[bold red]Could not export {table} to the replica")
+            continue
+        arrow_table = query_job.to_arrow()
+        await asyncio.to_thread(helpers.product_replica.export, table, arrow_table)
+        if table in (PRODUCT_TABLE_NG, PRODUCT_TABLE_NON_NG) and "Brand" in arrow_table.column_names:
+            brands.update(arrow_table.column("Brand").unique().to_pylist())
+    if brands:
+        query_shape_parser.set_brands(brands)
+
+
+async def run_replica_refresher(interval: float) -> None:
+    """Loads the snapshots left on disk, then refreshes the replica every interval seconds.
+
+    Args:
+        interval: The seconds between refreshes.
+    """
+    await asyncio.to_thread(helpers.product_replica.load_all)
+    while True:
+        try:
+            await refresh_replica()
+        except Exception as e:
+            console.log(f"[bold red]Error refreshing the product replica: {e}")
+        await asyncio.sleep(interval)
+
+
+def search_product_index(product_name: str, country: Optional[str], limit: int = 10) -> Optional[List[Dict]]:
+    """Looks up SKU mapping rows for a product name in the local index.
+
+    Args:
+        product_name: The recognized product name or OCR text.
+        country: The country to search for.
+        limit: The maximum number of rows.
+
+    Returns:
+        Optional[List[Dict]]: The best matching mapping rows, or None when the index is disabled,
+            not built yet or has no match, in which case the caller queries BigQuery.
+    """
+    index = product_indexes[sku_table(country)]
+    if not settings.PRODUCT_INDEX_ENABLED or not index.ready:
+        return None
+    return index.search(product_name, limit) or None
+
+
+async def fetch_rows(query_job: CachedQueryJob) -> List[Dict]:
+    """Returns the rows of a materialized query job.
+
+    Args:
+        query_job: The materialized query job.
+
+    Returns:
+        List[Dict]: The result rows.
+    """
+    return query_job.result()
+
+
+async def fetch_dataframe(query_job: CachedQueryJob) -> pd.DataFrame:
+    """Returns the results of a materialized query job as a DataFrame.
+
+    Args:
+        query_job: The materialized query job.
+
+    Returns:
+        pd.DataFrame: The result rows.
+    """
+    return query_job.to_dataframe()
+
+
+def category_page_label(category: str, country: Optional[str]) -> str:
+    """Returns the snapshot label of a category's pages, which its cursors are bound to.
+
+    Args:
+        category: The category name.
+        country: The country to search for.
+
+    Returns:
+        str: The label.
+    """
+    return snapshot_label(category_page_query(category, country).sql, category.lower())
+
+
+async def stream_category_page(
+    category: str,
+    country: Optional[str],
+    page_size: int,
+    cursor: Optional[PageCursor] = None,
+) -> AsyncIterator[Dict]:
+    """Serves one page of a category in Product ID order, chunk by chunk as BigQuery returns it.
+
+    The first page runs the category query once and leaves its results in a snapshot; later pages
+    read their rows from the snapshot by offset, so page N neither re-runs the query nor rescans
+    pages 1..N-1. If the snapshot has expired, the query is run again from the last Product ID served.
+    A cursor issued for another category, table or sort order is rejected rather than resumed.
+
+    Args:
+        category: The category name.
+        country: The country to search for.
+        page_size: The number of products per page.
+        cursor: The cursor of the page, None for the first page.
+
+    Yields:
+        Dict: {"rows": List[Dict]} for every chunk of the page, then {"next_cursor": Optional[str]}.
+            {"error": str} instead when the cursor does not match or the category could not be queried.
+    """
+    label = category_page_label(category, country)
+    snapshot = None
+    offset, after = 0, None
+    if cursor is not None:
+        if cursor.label != label:
+            yield {"error": CURSOR_MISMATCH}
+            return
+        offset, after = cursor.offset, cursor.after
+        if cursor.job_id:
+            snapshot = await asyncio.to_thread(helpers.find_snapshot, cursor.job_id, cursor.location, label)
+    if snapshot is None:
+        query = category_page_query(category, country, after)
+        snapshot = await run_admitted(
+            helpers.run_query_snapshot, query.sql, query.parameters, label, PRODUCT_RESPONSE_COLUMNS
+        )
+        offset = 0
+    if snapshot is None:
+        yield {"error": "Sorry, we could not access the data you requested. Please try again later."}
+        return
+
+    rows = await asyncio.to_thread(helpers.snapshot_rows, snapshot, offset, page_size)
+    pages = iter(rows.pages)
+    served = 0
+    while (page := await asyncio.to_thread(next, pages, None)) is not None:
+        chunk = [dict(row.items()) for row in page]
+        if chunk:
+            served += len(chunk)
+            after = chunk[-1]["Product ID"]
+            yield {"rows": chunk}
+
+    next_cursor = None
+    if offset + served < snapshot.total_rows:
+        next_cursor = encode_cursor(PageCursor(label, snapshot.job_id, snapshot.location, offset + served, after))
+    yield {"next_cursor": next_cursor}
+
+
+def _chat_messages(ctxt: str, user_content: str, conversations: Optional[List[Conversation]]) -> List[Dict[str, str]]:
+    """Builds the message list for a DataAnalysis completion with optional conversation history.
+
+    Args:
+        ctxt: The system prompt.
+        user_content: The user's message.
+        conversations: Optional list of Conversation objects.
+
+    Returns:
+        List[Dict[str, str]]: The messages to send.
+    """
+    messages = [
+        {"role": "system", "content": ctxt},
+        {"role": "user", "content": user_content},
+    ]
+    if conversations:
+        messages.extend(format_conversations(conversations))
+    return messages
+
+
+# Completions that continue a conversation are never shared
+@single_flight.coalesce(
+    "chat",
+    lambda ctxt, user_content, conversations, prompt, response_format: (
+        None if conversations else (prompt, ctxt, user_content)
+    ),
+    copy_result=True,
+)
+async def _chat_completion(
+    ctxt: str,
+    user_content: str,
+    conversations: Optional[List[Conversation]],
+    prompt: str,
+    response_format: Type[DataAnalysis] = DataAnalysis,
+) -> Dict:
+    """Runs a DataAnalysis completion with optional conversation history.
+
+    Args:
+        ctxt: The system prompt.
+        user_content: The user's message.
+        conversations: Optional list of Conversation objects.
+        prompt: The name the completion's token usage is recorded under.
+        response_format: The structured output, DataAnalysis or a model extending it.
+
+    Returns:
+        Dict: The decoded completion content with the last two messages attached.
+    """
+    messages = _chat_messages(ctxt, user_content, conversations)
+
+    response = await async_client.beta.chat.completions.parse(
+        model="gpt-4o-2024-08-06",
+        messages=messages,
+        response_format=response_format,
+    )
+    _record_usage(prompt, response)
+    extracted_data = json.loads(response.choices[0].message.content)
+    extracted_data["ai_context"] = messages[-1]
+    extracted_data["user_message"] = messages[-2]
+    return extracted_data
+
+
+async def _stream_chat_completion(
+    ctxt: str, user_content: str, conversations: Optional[List[Conversation]], prompt: str
+) -> AsyncIterator[Dict]:
+    """Streams a DataAnalysis completion, yielding the data_summary as it is generated.
+
+    Args:
+        ctxt: The system prompt.
+        user_content: The user's message.
+        conversations: Optional list of Conversation objects.
+        prompt: The name the completion's token usage is recorded under.
+
+    Yields:
+        Dict: {"delta": str} for every new piece of data_summary, then {"summary": Dict} with the
+            decoded completion content, shaped like the result of _chat_completion.
+    """
+    messages = _chat_messages(ctxt, user_content, conversations)
+    streamed_summary = ""
+
+    async with async_client.beta.chat.completions.stream(
+        model="gpt-4o-2024-08-06",
+        messages=messages,
+        response_format=DataAnalysis,
+        stream_options={"include_usage": True},
+    ) as stream:
+        async for event in stream:
+            if event.type != "content.delta" or not isinstance(event.parsed, dict):
+                continue
+            data_summary = event.parsed.get("data_summary") or ""
+            if len(data_summary) > len(streamed_summary):
+                yield {"delta": data_summary[len(streamed_summary):]}
+                streamed_summary = data_summary
+        completion = await stream.get_final_completion()
+    _record_usage(prompt, completion)
+
+    extracted_data = json.loads(completion.choices[0].message.content)
+    extracted_data["ai_context"] = messages[-1]
+    extracted_data["user_message"] = messages[-2]
+    yield {"summary": extracted_data}
+
+
+def _summary_request(
+    dataframe: pd.DataFrame, natural_query: str, country: Optional[str]
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Prepares the summary of a result table and answers it locally when the summary mode allows.
+
+    Args:
+        dataframe: The DataFrame containing the results to summarize.
+        natural_query: The natural language query string to process.
+        country: The country searched, which picks the language of a local summary.
+
+    Returns:
+        Tuple[str, Optional[Dict[str, Any]]]: The user message of the summary and the local summary,
+            or None when the summary needs the model now.
+    """
+    summary_input = build_summary_input(dataframe, settings.SUMMARY_TOKEN_BUDGET)
+    user_content = f"Given this query: '{natural_query}', summarize the following data:\n{summary_input}"
+    mode = SummaryMode(settings.SUMMARY_MODE)
+    if mode == SummaryMode.LLM:
+        return user_content, None
+
+    analytics = analyze_results(dataframe)
+    if mode == SummaryMode.THRESHOLD and analytics.products >= settings.SUMMARY_LLM_MIN_PRODUCTS:
+        return user_content, None
+    summary = render_summary(analytics, country)
+    summary["user_message"] = {"role": "user", "content": user_content}
+    summary["polish"] = mode == SummaryMode.ASYNC
+    summary_counts["local"] += 1
+    return user_content, summary
+
+
+async def summarize_results(
+    dataframe: pd.DataFrame,
+    natural_query: str,
+    conversations: Optional[List[Conversation]] = None,
+    country: Optional[str] = None,
+) -> Optional[Dict[str, str | List[str]]]:
+    """Processes and summarizes results, locally or using GPT-4 depending on SUMMARY_MODE.
+
+    Args:
+        dataframe: The DataFrame containing the results to summarize.
+        natural_query: The natural language query string to process.
+        conversations: Optional list of Conversation objects.
+        country: Optional country searched, which picks the language of a local summary.
+
+    Returns:
+        Optional[Dict[str, str | List[str]]]: A dictionary containing the summarized results. A local
+            summary whose polish flag is set should be handed to schedule_summary_polish once saved.
+    """
+    user_content, summary = _summary_request(dataframe, natural_query, country)
+    if summary:
+        return summary
+    summary_counts["llm"] += 1
+    return await _chat_completion(build_context_analytics(), user_content, conversations, "analytics")
+
+
+async def replay_summary(summary: Dict) -> AsyncIterator[Dict]:
+    """Relays a finished summary as the events of a streamed one, in one piece.
+
+    Args:
+        summary: The summary, e.g. a local summary or the reply of a query plan.
+
+    Yields:
+        Dict: The events of _stream_chat_completion.
+    """
+    yield {"delta": summary["data_summary"]}
+    yield {"summary": summary}
+
+
+async def polish_summary(summary: Dict) -> Dict:
+    """Rewrites a local summary with the model.
+
+    Args:
+        summary: A local summary whose polish flag is set.
+
+    Returns:
+        Dict: The rewrite, or the local summary without its polish flag when the model fails.
+    """
+    try:
+        polished = await _chat_completion(
+            build_context_analytics(), summary["user_message"]["content"], None, "analytics"
+        )
+    except Exception as e:
+        summary_counts["polish_failures"] += 1
+        console.log(f"Error polishing summary: {e}")
+        return {**summary, "polish": False}
+    summary_counts["polished"] += 1
+    return polished
+
+
+async def _polish_summary(summary: Dict, chat_id: str, message_id: Optional[str], summary_id: str) -> None:
+    """Rewrites a saved local summary, stores the rewrite in its message and completes its poll."""
+    polished = await polish_summary(summary)
+    try:
+        if message_id and polished["data_summary"] != summary["data_summary"]:
+            await update_message(message_id, polished["data_summary"])
+        await summary_store.complete(summary_id, polished["data_summary"], polished.get("suggested_queries"), chat_id)
+    except Exception as e:
+        console.log(f"Error storing polished summary: {e}")
+        await summary_store.fail(summary_id, "Sorry! Could not generate analysis")
+
+
+async def schedule_summary_polish(
+    summary: Optional[Dict], chat_id: Optional[str], message_id: Optional[str]
+) -> Optional[str]:
+    """Starts the model rewrite of a saved local summary in the background, when it asks for one.
+
+    The rewrite replaces the summary in its message and is polled from /web/summary/{summary_id}.
+
+    Args:
+        summary: The summary returned by summarize_results.
+        chat_id: The conversation the summary was saved to.
+        message_id: The message the summary was saved as, or None when it was not saved.
+
+    Returns:
+        Optional[str]: The summary_id the rewrite is polled by, or None when there is nothing to rewrite.
+    """
+    if not summary or not summary.get("polish") or not chat_id:
+        return None
+    summary_id = await summary_store.create()
+    task = asyncio.create_task(_polish_summary(summary, chat_id, message_id, summary_id))
+    polish_tasks.add(task)
+    task.add_done_callback(polish_tasks.discard)
+    return summary_id
+
+
+async def regular_chat(
+    natural_query: str,
+    conversations: Optional[List[Conversation]] = None,
+) -> Optional[Dict[str, str | List[str]]]:
+    """Chats with ctxt using GPT-4.
+
+    Args:
+        natural_query: The natural language query string to process.
+        conversations: Optional list of Conversation objects.
+
+    Returns:
+        Optional[Dict[str, str | List[str]]]: A dictionary containing the chat results.
+    """
+    return await _chat_completion(build_context_chat(), natural_query, conversations, "chat")
+
+
+def stream_summarize_results(
+    dataframe: pd.DataFrame,
+    natural_query: str,
+    conversations: Optional[List[Conversation]] = None,
+    country: Optional[str] = None,
+) -> AsyncIterator[Dict]:
+    """Streaming variant of summarize_results.
+
+    Args:
+        dataframe: The DataFrame containing the results to summarize.
+        natural_query: The natural language query string to process.
+        conversations: Optional list of Conversation objects.
+        country: Optional country searched, which picks the language of a local summary.
+
+    Returns:
+        AsyncIterator[Dict]: The events produced by _stream_chat_completion, or by replay_summary for
+            a local summary.
+    """
+    user_content, summary = _summary_request(dataframe, natural_query, country)
+    if summary:
+        return replay_summary(summary)
+    summary_counts["llm"] += 1
+    return _stream_chat_completion(build_context_analytics(), user_content, conversations, "analytics")
+
+
+def stream_regular_chat(
+    natural_query: str,
+    conversations: Optional[List[Conversation]] = None,
+) -> AsyncIterator[Dict]:
+    """Streaming variant of regular_chat.
+
+    Args:
+        natural_query: The natural language query string to process.
+        conversations: Optional list of Conversation objects.
+
+    Returns:
+        AsyncIterator[Dict]: The events produced by _stream_chat_completion.
+    """
+    return _stream_chat_completion(build_context_chat(), natural_query, conversations, "chat")
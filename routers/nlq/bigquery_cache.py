@@ -0,0 +1,186 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from routers.nlq.sql_canonical import canonicalize_sql
+
+
+def parameters_key(query_parameters: Optional[Sequence[Any]]) -> str:
+    """Serializes BigQuery query parameters for cache keys.
+
+    Args:
+        query_parameters: ScalarQueryParameter/ArrayQueryParameter/StructQueryParameter objects.
+
+    Returns:
+        str: A stable JSON representation of the parameters.
+    """
+    if not query_parameters:
+        return ""
+    return json.dumps([parameter.to_api_repr() for parameter in query_parameters], sort_keys=True, default=str)
+
+
+# String columns with few distinct values; these become categoricals instead of object columns.
+REPEATED_STRING_COLUMNS = {
+    "Brand or Manufacturer",
+    "Country",
+    "Brand",
+    "Manufacturer",
+    "Product Status",
+    "Stock Status",
+    "Category Name",
+    "Top Category",
+    "Seller Group",
+    "Seller Name",
+    "external_id",
+}
+
+
+def arrow_to_dataframe(arrow_table: pa.Table) -> pd.DataFrame:
+    """Converts an Arrow result table to a DataFrame without copying through Python objects.
+
+    Repeated string columns are dictionary-encoded into categoricals; every other column keeps an
+    Arrow-backed dtype.
+
+    Args:
+        arrow_table: The query results.
+
+    Returns:
+        pd.DataFrame: The query results.
+    """
+    for index, field in enumerate(arrow_table.schema):
+        is_string = pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+        if field.name in REPEATED_STRING_COLUMNS and is_string:
+            arrow_table = arrow_table.set_column(
+                index, field.name, pc.dictionary_encode(arrow_table.column(index))
+            )
+    return arrow_table.to_pandas(
+        types_mapper=lambda arrow_type: None if pa.types.is_dictionary(arrow_type) else pd.ArrowDtype(arrow_type)
+    )
+
+
+class CachedQueryJob:
+    """A finished, materialized query result with the parts of the bigquery.QueryJob interface we use.
+
+    The results are held once, as an Arrow table. result() returns the rows as dicts, so
+    `[dict(row) for row in job.result()]` and `row["SKU_STRING"]` keep working, and to_dataframe()
+    returns an Arrow-backed DataFrame over the same buffers, built on first use. Each call returns
+    a shallow copy of it: callers may add, drop or replace columns, but must not modify values in
+    place, since the column data is shared with every other caller of the cached result.
+    """
+
+    def __init__(self, arrow_table: pa.Table, job_id: Optional[str] = None):
+        self._arrow_table = arrow_table
+        self._dataframe: Optional[pd.DataFrame] = None
+        self.job_id = job_id
+        self.cache_hit = False
+        self.nbytes = arrow_table.nbytes
+
+    @property
+    def total_rows(self) -> int:
+        return self._arrow_table.num_rows
+
+    def to_arrow(self, *args, **kwargs) -> pa.Table:
+        return self._arrow_table
+
+    def result(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        return self._arrow_table.to_pylist()
+
+    def to_dataframe(self, *args, **kwargs) -> pd.DataFrame:
+        if self._dataframe is None:
+            self._dataframe = arrow_to_dataframe(self._arrow_table)
+        return self._dataframe.copy(deep=False)
+
+    def as_cache_hit(self) -> "CachedQueryJob":
+        hit = CachedQueryJob(self._arrow_table, job_id=self.job_id)
+        hit._dataframe = self._dataframe
+        hit.cache_hit = True
+        return hit
+
+
+class BigQueryResultCache:
+    """A byte-bounded LRU cache of materialized BigQuery results with per-table TTLs.
+
+    Entries are keyed on the canonical SQL (see sql_canonical) plus the query parameters, so
+    spellings of a query that differ only in formatting or predicate order share an entry. The
+    TTL of an entry is the shortest TTL of the tables the query mentions, so product listings with
+    live prices and stock can expire quickly while the SKU mapping tables are kept for hours.
+    """
+
+    def __init__(self, max_bytes: int, default_ttl: float, table_ttls: Optional[Dict[str, float]] = None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.table_ttls = table_ttls or {}
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[CachedQueryJob, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(sql_query: str, query_parameters: Optional[Sequence[Any]] = None) -> Tuple[str, str]:
+        return canonicalize_sql(sql_query), parameters_key(query_parameters)
+
+    def ttl_for(self, sql_query: str) -> float:
+        """Returns the TTL for a query, the shortest TTL among the tables it references."""
+        ttls = [
+            ttl for table, ttl in self.table_ttls.items()
+            if re.search(rf"\b{re.escape(table)}\b", sql_query)
+        ]
+        return min(ttls) if ttls else self.default_ttl
+
+    def get(self, key: Tuple[str, str]) -> Optional[CachedQueryJob]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            job, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return job.as_cache_hit()
+
+    def set(self, key: Tuple[str, str], job: CachedQueryJob) -> None:
+        ttl = self.ttl_for(key[0])
+        if ttl <= 0 or job.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (job, time.monotonic() + ttl)
+            self._bytes += job.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        job, _ = self._entries.pop(key)
+        self._bytes -= job.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Sequence
+
+from routers.nlq.projection import project_columns
+from routers.nlq.sql_canonical import canonicalize_sql, sql_fingerprint
+
+# BigQuery bills at least 10 MB per query; a smaller maximum_bytes_billed fails every query.
+MIN_BYTES_BILLED = 10 * 1024 * 1024
+
+# The columns a product listing needs; the fallback for an over-budget SELECT * reads only these.
+FALLBACK_COLUMNS = (
+    "Product ID",
+    "SKU",
+    "Product Name",
+    "Brand",
+    "Product Price",
+    "Stock Status",
+    "Salable Quantity",
+    "Category Name",
+    "Seller Name",
+)
+
+
+class ByteBudget:
+    """The bytes a single API request may still have BigQuery scan."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        return max(self.max_bytes - self.used, 0)
+
+    def allows(self, estimated_bytes: int) -> bool:
+        return estimated_bytes <= self.remaining and self.remaining >= MIN_BYTES_BILLED
+
+    def charge(self, billed_bytes: Optional[int]) -> None:
+        with self._lock:
+            self.used += billed_bytes or 0
+
+
+# Set per request by the app middleware. Queries run outside a request, such as the snapshot
+# exports and index refreshes, have no budget and are not guarded.
+request_byte_budget: ContextVar[Optional[ByteBudget]] = ContextVar("request_byte_budget", default=None)
+
+
+def narrow_projection(sql_query: str, columns: Sequence[str] = FALLBACK_COLUMNS) -> Optional[str]:
+    """Rewrites a SELECT * into a SELECT of the given columns, which BigQuery bills less for.
+
+    Args:
+        sql_query: The BigQuery SQL query.
+        columns: The columns to select instead of *.
+
+    Returns:
+        Optional[str]: The narrowed query, or None when the query does not select *.
+    """
+    return project_columns(sql_query, columns)
+
+
+class QueryCostStats:
+    """Records bytes processed, bytes billed, slot time and cache hits of the BigQuery jobs we run.
+
+    Jobs slower than slow_query_seconds go to a slow-query log grouped by the fingerprint of their
+    canonical SQL with literals stripped, so every spelling of a slow query shape is one entry.
+    """
+
+    def __init__(self, recent: int = 50, slow_query_seconds: float = 2.0, max_slow_queries: int = 100):
+        self.slow_query_seconds = slow_query_seconds
+        self.max_slow_queries = max_slow_queries
+        self._recent: deque = deque(maxlen=recent)
+        self._slow_queries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.cache_hits = 0
+        self.bytes_processed = 0
+        self.bytes_billed = 0
+        self.slot_millis = 0
+        self.dry_runs = 0
+        self.over_budget = 0
+        self.fallbacks = 0
+        self.rejected = 0
+
+    def record(self, query_job: Any, sql_query: Optional[str] = None, elapsed: float = 0.0) -> Dict[str, Any]:
+        """Records a finished job.
+
+        Args:
+            query_job: The finished bigquery.QueryJob.
+            sql_query: The SQL the job ran.
+            elapsed: The seconds the job took, including the download of its results.
+
+        Returns:
+            Dict[str, Any]: The job's recorded costs.
+        """
+        job = {
+            "job_id": query_job.job_id,
+            "fingerprint": sql_fingerprint(sql_query, strip_literals=True) if sql_query else None,
+            "elapsed": elapsed,
+            "bytes_processed": query_job.total_bytes_processed or 0,
+            "bytes_billed": query_job.total_bytes_billed or 0,
+            "slot_millis": query_job.slot_millis or 0,
+            "cache_hit": bool(query_job.cache_hit),
+        }
+        with self._lock:
+            self.jobs += 1
+            self.cache_hits += job["cache_hit"]
+            self.bytes_processed += job["bytes_processed"]
+            self.bytes_billed += job["bytes_billed"]
+            self.slot_millis += job["slot_millis"]
+            self._recent.append(job)
+            if sql_query and elapsed >= self.slow_query_seconds:
+                self._log_slow_query(job, sql_query)
+        return job
+
+    def _log_slow_query(self, job: Dict[str, Any], sql_query: str) -> None:
+        slow_query = self._slow_queries.pop(job["fingerprint"], None) or {
+            "query": canonicalize_sql(sql_query, strip_literals=True),
+            "count": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+            "bytes_processed": 0,
+        }
+        slow_query["count"] += 1
+        slow_query["total_seconds"] += job["elapsed"]
+        slow_query["max_seconds"] = max(slow_query["max_seconds"], job["elapsed"])
+        slow_query["bytes_processed"] += job["bytes_processed"]
+        self._slow_queries[job["fingerprint"]] = slow_query
+        while len(self._slow_queries) > self.max_slow_queries:
+            self._slow_queries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "jobs": self.jobs,
+            "cache_hits": self.cache_hits,
+            "bytes_processed": self.bytes_processed,
+            "bytes_billed": self.bytes_billed,
+            "slot_millis": self.slot_millis,
+            "dry_runs": self.dry_runs,
+            "over_budget": self.over_budget,
+            "fallbacks": self.fallbacks,
+            "rejected": self.rejected,
+            "recent_jobs": list(self._recent),
+            "slow_queries": dict(self._slow_queries),
+        }
@@ -4,19 +4,35 @@ import json
 import logging
 import os
 import re
-from typing import Dict, List, Optional, Union
+import time
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple, Union
 
-import pandas as pd
 import requests
 from fastapi import UploadFile
 from google.cloud import bigquery
 from openai import OpenAI
+from requests.adapters import HTTPAdapter
 from rich.console import Console
 
 from db.helpers import create_conversation
 from db.store import Conversation
 from external_services.vertex import VertexAIService
-from routers.nlq.schemas import DataAnalysis, Text2SQL
+from routers.nlq.bigquery_cache import BigQueryResultCache, CachedQueryJob
+from routers.nlq.cost_guard import (
+    MIN_BYTES_BILLED,
+    ByteBudget,
+    QueryCostStats,
+    narrow_projection,
+    request_byte_budget,
+)
+from routers.nlq.metrics import register_stats
+from routers.nlq.pagination import SNAPSHOT_LABEL, Snapshot
+from routers.nlq.projection import project_columns
+from routers.nlq.query_builder import REPLICA_TABLES
+from routers.nlq.replica import ProductReplica
+from routers.nlq.scheduler import QueryPriority, QueryRejected, QueryScheduler
+from routers.nlq.schemas import Text2SQL
 from settings import get_settings
 import json
 logger = logging.getLogger("test-logger")
@@ -27,9 +43,42 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 console = Console()
 bigquery_client = bigquery.Client(project=settings.GCP_PROJECT_ID)
+# One connection per admitted job, plus a few for dry runs and table lookups, which are not queued
+bigquery_client._http.mount(
+    "https://",
+    HTTPAdapter(pool_connections=4, pool_maxsize=settings.BIGQUERY_MAX_CONCURRENT_JOBS + 4),
+)
 
 client = OpenAI(api_key=settings.OPENAI_API_KEY)
 
+bigquery_cache = BigQueryResultCache(
+    max_bytes=settings.BIGQUERY_CACHE_MAX_BYTES,
+    default_ttl=settings.BIGQUERY_CACHE_DEFAULT_TTL,
+    table_ttls=settings.BIGQUERY_CACHE_TABLE_TTLS,
+)
+register_stats("bigquery_cache", bigquery_cache.stats)
+
+product_replica = ProductReplica(
+    directory=settings.REPLICA_DIRECTORY,
+    tables=REPLICA_TABLES,
+    max_age=settings.REPLICA_MAX_AGE,
+)
+register_stats("product_replica", product_replica.stats)
+
+query_cost_stats = QueryCostStats(slow_query_seconds=settings.BIGQUERY_SLOW_QUERY_SECONDS)
+register_stats("bigquery_cost", query_cost_stats.stats)
+
+query_scheduler = QueryScheduler(
+    max_concurrency=settings.BIGQUERY_MAX_CONCURRENT_JOBS,
+    deadlines={QueryPriority[name.upper()]: seconds for name, seconds in settings.BIGQUERY_QUEUE_DEADLINES.items()},
+)
+register_stats("bigquery_scheduler", query_scheduler.stats)
+
+DEFAULT_DATASET = "snowflake_views"
+
+# Column names of the views in the default dataset, fetched once per worker for projection pushdown
+_table_columns: Dict[str, FrozenSet[str]] = {}
+
 CATEGORIES = """
 Red101 Market,
 Tea & Infusions,
@@ -299,8 +348,6 @@ NON_NIGERIA_PRODUCT_TABLE = """
             `Last Price Update At` TIMESTAMP
         )
 """
-SKU_TABLE_NG = "market_place_product_nigeria_mapping_table"
-SKU_TABLE_NON_NG = "marketplace_product_except_nigeria_sku_aggregate_2"
 
 
 def split_on_multiple_separators(text, separators):
@@ -333,87 +380,34 @@ def extract_code(input_string: str) -> str:
     return f"'{parts[1]}"
 
 
-def generate_product_name_sql(product_name: str, country: str, limit=10) -> str:
-    """Generates a BigQuery SQL query to search for products with at least one word from the given product name.
-
-    Args:
-        product_name: The product name to search for.
-        country: The country to search for.
-
-    Returns:
-        A string containing the BigQuery SQL query.
-    """
-    separators = [",", ";", ":", "-", " "]
-
-    words = split_on_multiple_separators(product_name, separators)
-    # print(words)  # Output: ['This', 'is', 'a', 'string', 'with', 'multiple', 'separators', '']
-
-    conditions = [f"LOWER(`Product Name`) LIKE '%{word.lower()}%'" for word in words]
-    where_clause = " OR ".join(conditions)
-
-    query = f"""
-      SELECT *
-        FROM `{SKU_TABLE_NG if country == 'Nigeria' else SKU_TABLE_NON_NG}`
-        WHERE {where_clause}
-        LIMIT {limit}
-    """
-    return query
-
-
-def generate_gtin_sql(gtin: str, country: str, limit=10) -> str:
-    """Generates a BigQuery SQL query from a string of SKUs.
-
-    Args:
-        gtin: A gtin string.
-        country: The country to search for.
-        limit: limit for result.
-
-    Returns:
-        A string containing the BigQuery SQL query.
-    """
-
-    query = f"""
-        SELECT *
-        FROM `{SKU_TABLE_NG if country == 'Nigeria' else SKU_TABLE_NON_NG}`
-        WHERE Mapping = "{gtin}"
-        LIMIT {limit}
-    """
-
-    return query
-
-
-def build_context_nlq(
-    product_name: Optional[str],
-    country: Optional[str] = None,
-    total: Optional[int] = 10,
-) -> str:
-    """Builds a context string for natural language query processing.
+def product_table_schema(country: Optional[str]) -> str:
+    """Returns the DDL of the product table a country is served from.
 
     Args:
-        product_name: Optional product name to include in context.
         country: Optional country filter, defaults to None.
-        total: Optional result limit, defaults to 10.
 
     Returns:
-        str: A formatted context string for the AI model to process the natural language query.
+        str: The table DDL used in the Text2SQL prompts.
     """
-    product_ctxt = (
-        f"to search for products with at least a word from '{product_name}' in their name when a case insensitive search is performed"
-        if product_name
-        else ""
-    )
+    return NIGERIA_PRODUCT_TABLE if country == "Nigeria" else NON_NIGERIA_PRODUCT_TABLE
 
+
+# The static part of each Text2SQL prompt is built once per (prompt, table) and always leads the
+# system message, so every call for a country shares a byte-identical prefix the provider can serve
+# from its prompt cache. Anything that varies per request is appended after it.
+@lru_cache(maxsize=None)
+def _nlq_prompt_prefix(schema: str) -> str:
     return f"""
         You are an expert Text2SQL AI in the e-commerce domain 
         that takes a natural language query and translates it into a BigQuery SQL query. 
-        Translate the query into a BigQuery SQL query {product_ctxt} for the database:
-        {NIGERIA_PRODUCT_TABLE if country == "Nigeria" else NON_NIGERIA_PRODUCT_TABLE}
+        Translate the query into a BigQuery SQL query for the database:
+        {schema}
         These are the category names:
         {CATEGORIES}
         Your response should be formatted in the given structure 
-        where sql_query is the translated BigQuery SQL query with a LIMIT of {total},
+        where sql_query is the translated BigQuery SQL query with the LIMIT given in the request details below,
         suggested_queries is a list of similar or refined natural language queries the user can use instead in their next search.
-        If no natural language query is provided, return  {'BigQuery SQL query {product_ctxt}' or "suggested_queries"}.
+        If no natural language query is provided, return a BigQuery SQL query for the search target in the request details, or only suggested_queries if there is none.
         Favor OR operations over AND operations. Ensure the query selects all fields and the query is optimized for BigQuery performance.
         The clause should begin with AND keyword if an identifier is used in clause.
         If the natural language query looks malicious, requests personal information about users or company staff or is destructive, return nothing for sql_query but return suggested queries for finding coca cola products for suggested_queries.    
@@ -422,26 +416,15 @@ def build_context_nlq(
         """
 
 
-def build_context_nlq_sku(
-    country: Optional[str] = None,
-) -> str:
-    """Builds a context string for natural language query processing.
-
-    Args:
-        country: Optional country filter, defaults to None.
-
-    Returns:
-        str: A formatted context string for the AI model to process the natural language query.
-    """
-#  These are the category names:
-#         {CATEGORIES}
+@lru_cache(maxsize=None)
+def _sku_clause_prompt(schema: str, refinement_rules: str) -> str:
     return f"""
         You are an expert Text2SQL AI in the e-commerce domain 
         that takes a natural language query and translates it into a BigQuery SQL clause. 
         Translate the natural query into a BigQuery SQL conditional clause that can be used to complete an sql query similar to
         'SELECT * FROM `marketplace_product_nigeria` WHERE SKU IN ("BNE-021", "DTS-058", "SGL-022")'. 
         the database schema:
-        {NIGERIA_PRODUCT_TABLE if country == "Nigeria" else NON_NIGERIA_PRODUCT_TABLE}.
+        {schema}.
         Your response should be formatted in the given structure 
         where sql_query is the translated conditional clause,
         suggested_queries is a list of similar or refined natural language queries the user can use instead in their next search.
@@ -450,202 +433,100 @@ def build_context_nlq_sku(
         Favor OR operations over AND operations. Ensure the clause is optimized for BigQuery performance.
         If the natural language query looks malicious, requests personal information about users or company staff or is destructive, return nothing for sql_query but return suggested queries for finding coca cola products for suggested_queries.
 
-        {SQL_REFINEMENT_RULES}
+        {refinement_rules}
     """
 
 
-def build_whatsapp_context_nlq_sku(
+def build_context_nlq(
+    product_name: Optional[str],
     country: Optional[str] = None,
+    total: Optional[int] = 10,
 ) -> str:
     """Builds a context string for natural language query processing.
 
+    The schema, categories and rules form a leading block that is identical for every call with
+    the same country; the product name and limit follow it.
+
     Args:
+        product_name: Optional product name to include in context.
         country: Optional country filter, defaults to None.
+        total: Optional result limit, defaults to 10.
 
     Returns:
         str: A formatted context string for the AI model to process the natural language query.
     """
-#  These are the category names:
-#         {CATEGORIES}
-    return f"""
-        You are an expert Text2SQL AI in the e-commerce domain 
-        that takes a natural language query and translates it into a BigQuery SQL clause. 
-        Translate the natural query into a BigQuery SQL conditional clause that can be used to complete an sql query similar to
-        'SELECT * FROM `marketplace_product_nigeria` WHERE SKU IN ("BNE-021", "DTS-058", "SGL-022")'. 
-        the database schema:
-        {NIGERIA_PRODUCT_TABLE if country == "Nigeria" else NON_NIGERIA_PRODUCT_TABLE}.
-        Your response should be formatted in the given structure 
-        where sql_query is the translated conditional clause,
-        suggested_queries is a list of similar or refined natural language queries the user can use instead in their next search.
-        Begin the clause with 'AND' keyword if clause begins with an identifier
-        If no natural language query is provided, return only suggested_queries.
-        Favor OR operations over AND operations. Ensure the clause is optimized for BigQuery performance.
-        If the natural language query looks malicious, requests personal information about users or company staff or is destructive, return nothing for sql_query but return suggested queries for finding coca cola products for suggested_queries.
+    search_target = (
+        f"products with at least a word from '{product_name}' in their name when a case insensitive search is performed"
+        if product_name
+        else "none"
+    )
 
-        {SKU_REFINEMENT_RULES}
-    """
+    return f"""{_nlq_prompt_prefix(product_table_schema(country))}
+        **Request Details:**
+        Search target: {search_target}
+        LIMIT: {total}
+        """
 
 
-def parse_sku_search_query(
-    natural_query: Optional[str],
-    product_name: Optional[str],
-    amount: Optional[int],
-    sku_rows: List[str],
+def build_context_query_plan(
     country: Optional[str] = None,
-) -> Optional[Dict[str, str | List[str]]]:
-    """Parses a natural language query for SKUs.
+    total: Optional[int] = 10,
+) -> str:
+    """Builds a context string for planning a query, which translates and answers it in one completion.
+
+    The leading block is the one of build_context_nlq, so both prompts share their cached prefix.
 
     Args:
-        natural_query: The natural language query string to process.
-        product_name: Optional product name to include in context.
-        sku_rows: Optional dictionary of SKUs.
         country: Optional country filter, defaults to None.
-        use_gtin: Optional boolean flag to use GTIN, defaults to True.
+        total: Optional result limit, defaults to 10.
 
     Returns:
-        Optional[Dict[str, str | List[str]]]: A dictionary containing the parsed query results.
+        str: A formatted context string for the AI model to plan the natural language query.
     """
-    if not natural_query and not product_name:
-        return None
-    sql = None
-    if sku_rows:
-        skus_formatted = ", ".join([f'"{sku}"' for sku in sku_rows])
-        sql = f"SELECT * FROM `{'marketplace_product_nigeria' if country == 'Nigeria' else 'marketplace_product_except_nigeria_sku_aggregate'}` WHERE SKU IN ({skus_formatted}) "
-
-        context = build_context_nlq_sku(country=country)
-    else:
-        context = build_context_nlq(product_name, country=country, total=amount)
-
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o-2024-08-06",
-        messages=[
-            {"role": "system", "content": context},
-            {"role": "user", "content": natural_query or ""},
-        ],
-        response_format=Text2SQL,
-    )
-
-    try:
-        extracted_data = json.loads(completion.choices[0].message.content)
-        if sku_rows:
-            extracted_data["sql"] = sql
-        return extracted_data
-    except (KeyError, json.JSONDecodeError) as e:
-        console.log(f"Error parsing query: {e}")
-        return None
+    return f"""{_nlq_prompt_prefix(product_table_schema(country))}
+        **Query Plan:**
+        Besides translating the query, classify it and answer it.
+        intent is "search" when the query asks for products, prices, brands or sellers in the catalog,
+        "malicious" when it looks malicious, requests personal information about users or company staff or is destructive,
+        and "chat" for anything else, like greetings or questions about the platform.
+        sql_query is the translated BigQuery SQL query for a search and null otherwise.
+        data_summary is a reply to the user shown when there is no sql_query or the search finds no products.
+        As a state of the art customer care assistant for the e-commerce platform called redcloud,
+        use friendly and non technical words and respond as a representative of the redcloud platform.
+        For a search, tell the user no matching products were found and how they may refine their search.
+        For a malicious query, return a witty response telling the user to instead find a bottle of coke.
+
+        **Request Details:**
+        LIMIT: {total}
+        """
 
 
-def parse_whatsapp_sku_search_query(
-    natural_query: Optional[str],
-    product_name: Optional[str],
-    amount: Optional[int],
-    sku_rows: Dict[str, str | List[str]],
+def build_context_nlq_sku(
     country: Optional[str] = None,
-) -> Optional[Dict[str, str | List[str]]]:
-    """Parses a natural language query for SKUs.
+) -> str:
+    """Builds a context string for natural language query processing.
 
     Args:
-        natural_query: The natural language query string to process.
-        product_name: Optional product name to include in context.
-        sku_rows: Optional dictionary of SKUs.
         country: Optional country filter, defaults to None.
-        use_gtin: Optional boolean flag to use GTIN, defaults to True.
 
     Returns:
-        Optional[Dict[str, str | List[str]]]: A dictionary containing the parsed query results.
+        str: A formatted context string for the AI model to process the natural language query.
     """
-    if not natural_query and not product_name:
-        return None
-    sql = None
-    if sku_rows:
-        # Determine the correct table based on country
-        table_name = "marketplace_product_nigeria" if country == "Nigeria" else "marketplace_product_except_nigeria_sku_aggregate"
-
-        # Construct the UNNEST clause with STRUCTs
-        values_clause = ",\n        ".join(
-            [f"STRUCT('{group}' AS external_id, '{sku}' AS SKU)" for group, skus in sku_rows.items() for sku in skus]
-        )
-
-        # Final SQL Query
-        sql = f"""
-        WITH external_mapping AS (
-            SELECT * FROM UNNEST([
-                {values_clause}
-            ])
-        )
-        SELECT em.external_id, p.*
-        FROM `{table_name}` p
-        JOIN external_mapping em ON p.SKU = em.SKU
-        ORDER BY em.external_id;
-"""
-        context = build_whatsapp_context_nlq_sku(country=country)
-    else:
-        context = build_context_nlq(product_name, country=country, total=amount)
-    try:
-        # incase open ai is down / or rate limited
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {"role": "system", "content": context},
-                {"role": "user", "content": natural_query or ""},
-            ],
-            response_format=Text2SQL,
-        )
+    return _sku_clause_prompt(product_table_schema(country), SQL_REFINEMENT_RULES)
 
-        try:
-            extracted_data = json.loads(completion.choices[0].message.content)
-            if sku_rows:
-                extracted_data["sql"] = sql
-            return extracted_data
-        except (KeyError, json.JSONDecodeError) as e:
-            console.log(f"Error parsing query: {e}")
-            raise e
-    except Exception as e:
-        extracted_data = {
-            "sql": sql,
-            "suggested_queries": [natural_query]
-        }
-        return extracted_data
 
-
-def parse_nlq_search_query(
-    natural_query: Optional[str],
-    product_name: Optional[str],
-    amount: Optional[int],
+def build_whatsapp_context_nlq_sku(
     country: Optional[str] = None,
-) -> Optional[Dict[str, str | List[str]]]:
-    """Parses a natural language query for search.
+) -> str:
+    """Builds a context string for natural language query processing.
 
     Args:
-        natural_query: The natural language query string to process.
-        product_name: Optional product name to include in context.
-        amount: Optional result limit, defaults to 10.
         country: Optional country filter, defaults to None.
-        use_gtin: Optional boolean flag to use GTIN, defaults to True.
 
     Returns:
-        Optional[Dict[str, str | List[str]]]: A dictionary containing the parsed query results.
+        str: A formatted context string for the AI model to process the natural language query.
     """
-    if not natural_query and not product_name:
-        return None
-
-    context = build_context_nlq(product_name, country=country, total=amount)
-
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o-2024-08-06",
-        messages=[
-            {"role": "system", "content": context},
-            {"role": "user", "content": natural_query or ""},
-        ],
-        response_format=Text2SQL,
-    )
-
-    try:
-        extracted_data = json.loads(completion.choices[0].message.content)
-        return extracted_data
-    except (KeyError, json.JSONDecodeError) as e:
-        console.log(f"Error parsing query: {e}")
-        return None
+    return _sku_clause_prompt(product_table_schema(country), SKU_REFINEMENT_RULES)
 
 
 def process_product_image(image: Union[str, UploadFile]) -> Optional[str]:
@@ -874,133 +755,345 @@ def gpt_generate_sql(natural_query: str) -> Optional[Dict[str, str | List[str]]]
     return extracted_data
 
 
-def execute_bigquery(sql_query: str) -> bigquery.QueryJob | None:
-    """Executes a SQL query on BigQuery and returns the results as a DataFrame.
+def _job_config(query_parameters: Optional[Sequence[Any]] = None, **kwargs) -> bigquery.QueryJobConfig:
+    return bigquery.QueryJobConfig(
+        default_dataset=f"{bigquery_client.project}.{DEFAULT_DATASET}",
+        query_parameters=list(query_parameters or []),
+        **kwargs,
+    )
+
+
+def dry_run_bytes(sql_query: str, query_parameters: Optional[Sequence[Any]] = None) -> Optional[int]:
+    """Estimates the bytes a query would scan with a BigQuery dry run, which is free.
 
     Args:
-        sql_query: The SQL query to execute.
+        sql_query: The SQL query to estimate.
+        query_parameters: Optional BigQuery query parameters referenced by the query.
 
     Returns:
-        bigquery.QueryJob: The results of the query.
+        Optional[int]: The bytes the query would process, or None if the query is invalid.
     """
-    default_dataset = "snowflake_views"
+    query_cost_stats.dry_runs += 1
+    try:
+        dry_run_job = bigquery_client.query(
+            sql_query, job_config=_job_config(query_parameters, dry_run=True, use_query_cache=False)
+        )
+    except Exception as e:
+        console.log(f"[bold red]BigQuery dry run error: {e}")
+        return None
+    return dry_run_job.total_bytes_processed or 0
+
+
+def _guard_query_cost(
+    sql_query: str, query_parameters: Optional[Sequence[Any]], budget: ByteBudget
+) -> Tuple[Optional[str], Optional[CachedQueryJob]]:
+    """Checks a free-form query against the request's byte budget before it runs.
+
+    Over budget, the query is answered from the local replica if it can, or else narrowed from
+    SELECT * to the columns a product listing needs if that fits the budget.
 
-    job_config = bigquery.QueryJobConfig(
-        default_dataset=f"{bigquery_client.project}.{default_dataset}",
-        # dry_run=True
+    Args:
+        sql_query: The SQL query to guard.
+        query_parameters: Optional BigQuery query parameters referenced by the query.
+        budget: The request's byte budget.
+
+    Returns:
+        Tuple[Optional[str], Optional[CachedQueryJob]]: The query to run, or the fallback results;
+            both None when the query is invalid or no fallback fits the budget.
+    """
+    estimated_bytes = dry_run_bytes(sql_query, query_parameters)
+    if estimated_bytes is None:
+        return None, None
+    if budget.allows(estimated_bytes):
+        return sql_query, None
+
+    query_cost_stats.over_budget += 1
+    console.log(
+        f"[bold yellow]Query would scan {estimated_bytes} bytes, {budget.remaining} left in the budget"
     )
+    if settings.REPLICA_ENABLED:
+        replica_table = product_replica.query(sql_query, query_parameters, parameterized_only=False)
+        if replica_table is not None:
+            query_cost_stats.fallbacks += 1
+            return None, CachedQueryJob(replica_table)
+
+    narrowed_query = narrow_projection(sql_query)
+    if narrowed_query:
+        narrowed_bytes = dry_run_bytes(narrowed_query, query_parameters)
+        if narrowed_bytes is not None and budget.allows(narrowed_bytes):
+            query_cost_stats.fallbacks += 1
+            return narrowed_query, None
+
+    query_cost_stats.rejected += 1
+    return None, None
+
+
+def table_columns(table: str) -> Optional[FrozenSet[str]]:
+    """Returns the columns of a view in the default dataset.
+
+    Args:
+        table: The view name.
+
+    Returns:
+        Optional[FrozenSet[str]]: The column names, or None if the table could not be read.
+    """
+    if table not in _table_columns:
+        try:
+            schema = bigquery_client.get_table(f"{bigquery_client.project}.{DEFAULT_DATASET}.{table}").schema
+        except Exception as e:
+            console.log(f"[bold red]BigQuery table lookup error: {e}")
+            return None
+        _table_columns[table] = frozenset(field.name for field in schema)
+    return _table_columns[table]
+
+
+def local_query_result(
+    sql_query: str,
+    query_parameters: Optional[Sequence[Any]] = None,
+    use_cache: bool = True,
+    use_replica: bool = True,
+    columns: Optional[Sequence[str]] = None,
+) -> Tuple[str, Optional[CachedQueryJob]]:
+    """Answers a query without BigQuery, from the result cache or the product replica.
+
+    Results are served from the in-process result cache when the same canonical SQL and
+    parameters were run recently, and parameterized lookups of replicated tables from the
+    local product replica. When the caller names the columns it reads, SELECT * over a view is
+    first narrowed to those of them the view has, which cuts the bytes scanned, downloaded and
+    held in the DataFrame.
+
+    Args:
+        sql_query: The SQL query to execute.
+        query_parameters: Optional BigQuery query parameters referenced by the query.
+        use_cache: Whether to read from the result cache.
+        use_replica: Whether the local product replica may answer the query.
+        columns: Optional columns the caller reads from the results.
+
+    Returns:
+        Tuple[str, Optional[CachedQueryJob]]: The projected SQL to run on BigQuery, and the results
+            when they were found locally.
+    """
+    if columns and settings.PROJECTION_PUSHDOWN_ENABLED:
+        sql_query = project_columns(sql_query, columns, table_columns) or sql_query
+
+    if use_cache and settings.BIGQUERY_CACHE_ENABLED:
+        cached_job = bigquery_cache.get(bigquery_cache.make_key(sql_query, query_parameters))
+        if cached_job:
+            return sql_query, cached_job
+
+    if use_replica and settings.REPLICA_ENABLED:
+        replica_table = product_replica.query(sql_query, query_parameters)
+        if replica_table is not None:
+            return sql_query, CachedQueryJob(replica_table)
+
+    return sql_query, None
+
+
+def run_bigquery_job(
+    sql_query: str,
+    query_parameters: Optional[Sequence[Any]] = None,
+    use_cache: bool = True,
+) -> CachedQueryJob | None:
+    """Runs a query on BigQuery and materializes its results.
+
+    Within a request, queries are billed against the request's byte budget: free-form
+    (unparameterized) SQL is dry-run first and replaced by a cheaper fallback when it would
+    exceed the budget, and every job runs with maximum_bytes_billed set to what is left of it.
+    Jobs then wait for a slot of the per-worker scheduler, by the request's priority, unless the
+    caller already holds one from admit_async.
+
+    Args:
+        sql_query: The SQL query to execute, as returned by local_query_result.
+        query_parameters: Optional BigQuery query parameters referenced by the query.
+        use_cache: Whether to write the results to the result cache.
+
+    Returns:
+        CachedQueryJob: The materialized results of the query, or None if the query failed, would
+            exceed the byte budget or could not start before the request's deadline.
+    """
+    # Keyed by the SQL asked for, which the cost guard may swap for a cheaper one
+    cache_key = bigquery_cache.make_key(sql_query, query_parameters)
+    budget = request_byte_budget.get() if settings.BIGQUERY_COST_GUARD_ENABLED else None
+    job_options = {}
+    if budget is not None:
+        if not query_parameters:
+            sql_query, fallback_job = _guard_query_cost(sql_query, query_parameters, budget)
+            if fallback_job is not None:
+                return fallback_job
+            if sql_query is None:
+                return None
+        if budget.remaining < MIN_BYTES_BILLED:
+            query_cost_stats.rejected += 1
+            console.log("[bold red]The request's BigQuery byte budget is exhausted")
+            return None
+        job_options["maximum_bytes_billed"] = budget.remaining
 
     try:
-        query_job = bigquery_client.query(sql_query, job_config=job_config)
-        return query_job
+        with query_scheduler.admit():
+            started = time.perf_counter()
+            query_job = bigquery_client.query(sql_query, job_config=_job_config(query_parameters, **job_options))
+            # One columnar download, through the BigQuery Storage read API when it is installed.
+            arrow_table = query_job.to_arrow(create_bqstorage_client=True)
+            elapsed = time.perf_counter() - started
+    except QueryRejected as e:
+        console.log(f"[bold yellow]BigQuery job rejected: {e}")
+        return None
     except Exception as e:
         console.log(f"[bold red]BigQuery error: {e}")
         return None
 
+    job_costs = query_cost_stats.record(query_job, sql_query, elapsed)
+    if elapsed >= query_cost_stats.slow_query_seconds:
+        console.log(f"[bold yellow]Slow BigQuery query {job_costs['fingerprint']} took {elapsed:.2f}s")
+    if budget is not None:
+        budget.charge(job_costs["bytes_billed"])
 
-def format_conversations(conversations: List[Conversation]) -> List[Dict[str, str]]:
-    """
-    Formats a list of Conversation models into the expected message format.
+    materialized_job = CachedQueryJob(arrow_table, job_id=query_job.job_id)
+    if use_cache and settings.BIGQUERY_CACHE_ENABLED:
+        bigquery_cache.set(cache_key, materialized_job)
+    return materialized_job
+
+
+def execute_bigquery(
+    sql_query: str,
+    query_parameters: Optional[Sequence[Any]] = None,
+    use_cache: bool = True,
+    use_replica: bool = True,
+    columns: Optional[Sequence[str]] = None,
+) -> CachedQueryJob | None:
+    """Executes a SQL query, locally when local_query_result can answer it and on BigQuery otherwise.
 
     Args:
-        conversations: A list of Conversation objects.
+        sql_query: The SQL query to execute.
+        query_parameters: Optional BigQuery query parameters referenced by the query.
+        use_cache: Whether to read from and write to the result cache.
+        use_replica: Whether the local product replica may answer the query.
+        columns: Optional columns the caller reads from the results.
 
     Returns:
-        A list of dictionaries representing messages in the desired format.
+        CachedQueryJob: The materialized results of the query, or None if the query failed, would
+            exceed the byte budget or could not start before the request's deadline.
     """
-    formatted_messages = []
-    for conversation in conversations:
-        formatted_messages.append(
-            {"role": "assistant", "content": conversation.ai_content}
-        )
-        formatted_messages.append(
-            {"role": "user", "content": conversation.user_content}
-        )
-    return formatted_messages
+    sql_query, local_job = local_query_result(sql_query, query_parameters, use_cache, use_replica, columns)
+    if local_job is not None:
+        return local_job
+    return run_bigquery_job(sql_query, query_parameters, use_cache)
+
 
+def run_query_snapshot(
+    sql_query: str,
+    query_parameters: Optional[Sequence[Any]],
+    label: str,
+    columns: Optional[Sequence[str]] = None,
+) -> Optional[Snapshot]:
+    """Runs a query whose results are read a page at a time instead of downloaded.
 
-# Helper function to process and summarize results
-def summarize_results(
-    dataframe: pd.DataFrame,
-    natural_query: str,
-    conversations: Optional[List[Conversation]] = None,
-) -> Optional[Dict[str, str | List[str]]]:
-    """Processes and summarizes results using GPT-4.
+    The results stay in the job's destination table, which BigQuery keeps for about a day; the job
+    is labelled so later pages can check they read the snapshot of the same query. The job is
+    admitted and billed like those of execute_bigquery, but never served from the caches.
 
     Args:
-        dataframe: The DataFrame containing the results to summarize.
-        natural_query: The natural language query string to process.
-        conversations: Optional list of Conversation objects.
+        sql_query: The SQL query to execute.
+        query_parameters: Optional BigQuery query parameters referenced by the query.
+        label: The snapshot label of the query, from pagination.snapshot_label.
+        columns: Optional columns the caller reads; SELECT * is narrowed to them.
 
     Returns:
-        Optional[Dict[str, str | List[str]]]: A dictionary containing the summarized results.
+        Optional[Snapshot]: The snapshot, or None if the query failed, would exceed the byte budget
+            or could not start before the request's deadline.
     """
-    ctxt = build_context_analytics()
-    data_dict = dataframe.to_dict(orient="records")
-    formatted_convos = None
-
-    messages = [
-        {"role": "system", "content": ctxt},
-        {
-            "role": "user",
-            "content": f"Given this query: '{natural_query}', summarize the following data: {data_dict}",
-        },
-    ]
-    if conversations:
-        formatted_convos = format_conversations(conversations)
-    if formatted_convos:
-        messages.extend(formatted_convos)
+    if columns and settings.PROJECTION_PUSHDOWN_ENABLED:
+        sql_query = project_columns(sql_query, columns, table_columns) or sql_query
+
+    budget = request_byte_budget.get() if settings.BIGQUERY_COST_GUARD_ENABLED else None
+    job_options = {"labels": {SNAPSHOT_LABEL: label}}
+    if budget is not None:
+        if budget.remaining < MIN_BYTES_BILLED:
+            query_cost_stats.rejected += 1
+            console.log("[bold red]The request's BigQuery byte budget is exhausted")
+            return None
+        job_options["maximum_bytes_billed"] = budget.remaining
 
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o-2024-08-06",
-        messages=messages,
-        response_format=DataAnalysis,
-    )
-    extracted_data = json.loads(response.choices[0].message.content)
-    extracted_data["ai_context"] = messages[-1]
-    extracted_data["user_message"] = messages[-2]
-    # console.log(extracted_data)
-    return extracted_data
+    try:
+        with query_scheduler.admit():
+            started = time.perf_counter()
+            query_job = bigquery_client.query(sql_query, job_config=_job_config(query_parameters, **job_options))
+            rows = query_job.result(max_results=0)
+            elapsed = time.perf_counter() - started
+    except QueryRejected as e:
+        console.log(f"[bold yellow]BigQuery job rejected: {e}")
+        return None
+    except Exception as e:
+        console.log(f"[bold red]BigQuery error: {e}")
+        return None
+
+    job_costs = query_cost_stats.record(query_job, sql_query, elapsed)
+    if budget is not None:
+        budget.charge(job_costs["bytes_billed"])
+    return Snapshot(query_job.job_id, query_job.location, str(query_job.destination), rows.total_rows or 0)
 
 
-# Helper function to process and continue chat without sql
-def regular_chat(
-    natural_query: str,
-    conversations: Optional[List[Conversation]] = None,
-) -> Optional[Dict[str, str | List[str]]]:
-    """Chats with ctxt using GPT-4.
+def find_snapshot(job_id: str, location: Optional[str], label: str) -> Optional[Snapshot]:
+    """Looks up the snapshot of an earlier run_query_snapshot.
 
     Args:
-        natural_query: The natural language query string to process.
-        conversations: Optional list of Conversation objects.
+        job_id: The ID of the job that made the snapshot.
+        location: The location of the job.
+        label: The snapshot label the job must carry.
 
     Returns:
-        Optional[Dict[str, str | List[str]]]: A dictionary containing the chat results.
+        Optional[Snapshot]: The snapshot, or None if the job is not a snapshot of the same query or
+            its results have expired.
     """
-    ctxt = build_context_chat()
-    formatted_convos = None
-
-    messages = [
-        {"role": "system", "content": ctxt},
-        {
-            "role": "user",
-            "content": natural_query,
-        },
-    ]
-    if conversations:
-        formatted_convos = format_conversations(conversations)
-    if formatted_convos:
-        messages.extend(formatted_convos)
+    try:
+        query_job = bigquery_client.get_job(job_id, location=location)
+        if query_job.job_type != "query" or (query_job.labels or {}).get(SNAPSHOT_LABEL) != label:
+            return None
+        table = bigquery_client.get_table(query_job.destination)
+    except Exception as e:
+        console.log(f"[bold yellow]BigQuery snapshot {job_id} is not available: {e}")
+        return None
+    return Snapshot(job_id, location, str(table.reference), table.num_rows or 0)
 
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o-2024-08-06",
-        messages=messages,
-        response_format=DataAnalysis,
+
+def snapshot_rows(snapshot: Snapshot, start_index: int, max_results: int) -> bigquery.table.RowIterator:
+    """Reads rows of a snapshot from its destination table, which is not billed as a query.
+
+    Args:
+        snapshot: The snapshot.
+        start_index: The position of the first row.
+        max_results: The maximum number of rows.
+
+    Returns:
+        RowIterator: The rows, fetched one chunk of settings.CATEGORY_STREAM_CHUNK_SIZE rows per page.
+    """
+    return bigquery_client.list_rows(
+        snapshot.table,
+        start_index=start_index,
+        max_results=max_results,
+        page_size=settings.CATEGORY_STREAM_CHUNK_SIZE,
     )
-    extracted_data = json.loads(response.choices[0].message.content)
-    extracted_data["ai_context"] = messages[-1]
-    extracted_data["user_message"] = messages[-2]
-    return extracted_data
+
+
+def format_conversations(conversations: List[Conversation]) -> List[Dict[str, str]]:
+    """
+    Formats a list of Conversation models into the expected message format.
+
+    Args:
+        conversations: A list of Conversation objects.
+
+    Returns:
+        A list of dictionaries representing messages in the desired format.
+    """
+    formatted_messages = []
+    for conversation in conversations:
+        formatted_messages.append(
+            {"role": "assistant", "content": conversation.ai_content}
+        )
+        formatted_messages.append(
+            {"role": "user", "content": conversation.user_content}
+        )
+    return formatted_messages
 
 
 def start_conversation(user_content: str, ai_content: str) -> Conversation:
@@ -0,0 +1,260 @@
+import math
+from enum import Enum
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from routers.nlq.summary_input import PRICE_COLUMN, SELLER_COLUMN, aggregate_products
+from routers.whatsapp.constants import country_currency_code
+
+
+class SummaryMode(str, Enum):
+    """How result tables are summarized.
+
+    LLM always asks the model, LOCAL never does, ASYNC answers locally at once and rewrites the
+    answer with the model later, polled by summary_id and stored in the conversation, and THRESHOLD
+    asks the model only for results with at least SUMMARY_LLM_MIN_PRODUCTS products.
+    """
+
+    LLM = "llm"
+    LOCAL = "local"
+    ASYNC = "async"
+    THRESHOLD = "threshold"
+
+
+class ResultAnalytics(NamedTuple):
+    """What a result table says about its products, computed without a model."""
+
+    listings: int
+    products: int
+    sellers: Optional[int]
+    min_price: Optional[float]
+    max_price: Optional[float]
+    median_price: Optional[float]
+    cheapest: Optional[Tuple[str, float, Optional[str]]]
+    in_stock: Optional[int]
+    category: Optional[str]
+    brand: Optional[str]
+
+
+# Countries whose summaries are not in English
+COUNTRY_LANGUAGES = {"Argentina": "es", "Chile": "es", "Colombia": "es", "Mexico": "es", "Brazil": "pt"}
+
+# Sentences of a summary by language; nouns are (singular, plural)
+TEMPLATES: Dict[str, Dict[str, str | Tuple[str, str]]] = {
+    "en": {
+        "product": ("product", "products"),
+        "seller": ("seller", "sellers"),
+        "found": "I found {products}.",
+        "found_sellers": "I found {products} from {sellers}.",
+        "price_range": "Prices range from {min_price} to {max_price}, with a median of {median_price}.",
+        "single_price": "They all cost {min_price}.",
+        "one_single_price": "It costs {min_price}.",
+        "cheapest": "The cheapest is {name} at {price}.",
+        "cheapest_seller": "The cheapest is {name} at {price} from {seller}.",
+        "in_stock": "{in_stock} of them are in stock.",
+        "all_in_stock": "All of them are in stock.",
+        "none_in_stock": "None of them are in stock right now.",
+        "category": "All of them are in {category}.",
+        "one_all_in_stock": "It is in stock.",
+        "one_none_in_stock": "It is out of stock right now.",
+        "one_category": "It is in {category}.",
+        "no_products": "I could not find any products for this search.",
+        "suggest_cheapest": "cheapest {subject}",
+        "suggest_in_stock": "{subject} in stock",
+        "suggest_under": "{subject} under {price}",
+    },
+    "es": {
+        "product": ("producto", "productos"),
+        "seller": ("vendedor", "vendedores"),
+        "found": "Encontré {products}.",
+        "found_sellers": "Encontré {products} de {sellers}.",
+        "price_range": "Los precios van de {min_price} a {max_price}, con una mediana de {median_price}.",
+        "single_price": "Todos cuestan {min_price}.",
+        "one_single_price": "Cuesta {min_price}.",
+        "cheapest": "El más barato es {name} a {price}.",
+        "cheapest_seller": "El más barato es {name} a {price} de {seller}.",
+        "in_stock": "{in_stock} están disponibles.",
+        "all_in_stock": "Todos están disponibles.",
+        "none_in_stock": "Ninguno está disponible ahora.",
+        "category": "Todos son de la categoría {category}.",
+        "one_all_in_stock": "Está disponible.",
+        "one_none_in_stock": "No está disponible ahora.",
+        "one_category": "Es de la categoría {category}.",
+        "no_products": "No encontré productos para esta búsqueda.",
+        "suggest_cheapest": "{subject} más barato",
+        "suggest_in_stock": "{subject} disponible",
+        "suggest_under": "{subject} por menos de {price}",
+    },
+    "pt": {
+        "product": ("produto", "produtos"),
+        "seller": ("vendedor", "vendedores"),
+        "found": "Encontrei {products}.",
+        "found_sellers": "Encontrei {products} de {sellers}.",
+        "price_range": "Os preços vão de {min_price} a {max_price}, com mediana de {median_price}.",
+        "single_price": "Todos custam {min_price}.",
+        "one_single_price": "Custa {min_price}.",
+        "cheapest": "O mais barato é {name} por {price}.",
+        "cheapest_seller": "O mais barato é {name} por {price} de {seller}.",
+        "in_stock": "{in_stock} estão em estoque.",
+        "all_in_stock": "Todos estão em estoque.",
+        "none_in_stock": "Nenhum está em estoque agora.",
+        "category": "Todos são da categoria {category}.",
+        "one_all_in_stock": "Está em estoque.",
+        "one_none_in_stock": "Não está em estoque agora.",
+        "one_category": "É da categoria {category}.",
+        "no_products": "Não encontrei produtos para esta busca.",
+        "suggest_cheapest": "{subject} mais barato",
+        "suggest_in_stock": "{subject} em estoque",
+        "suggest_under": "{subject} abaixo de {price}",
+    },
+}
+
+
+def _most_common(column: pd.Series) -> Optional[str]:
+    values = column.dropna().astype("string").str.strip()
+    values = values[values != ""]
+    return values.mode().iloc[0] if not values.empty else None
+
+
+def analyze_results(dataframe: pd.DataFrame) -> ResultAnalytics:
+    """Computes the analytics of a result table with vectorized pandas.
+
+    Args:
+        dataframe: The query results, one row per seller listing. Missing columns leave their
+            analytics as None.
+
+    Returns:
+        ResultAnalytics: The analytics.
+    """
+    products = aggregate_products(dataframe)
+    sellers = int(dataframe[SELLER_COLUMN].nunique()) if SELLER_COLUMN in dataframe.columns else None
+
+    min_price = max_price = median_price = cheapest = None
+    if PRICE_COLUMN in dataframe.columns:
+        prices = pd.to_numeric(dataframe[PRICE_COLUMN], errors="coerce")
+        if prices.notna().any():
+            min_price, max_price, median_price = float(prices.min()), float(prices.max()), float(prices.median())
+            row = dataframe.loc[prices.idxmin()]
+            name = row.get("Product Name")
+            seller = row.get(SELLER_COLUMN)
+            if pd.notna(name):
+                cheapest = (str(name), min_price, str(seller) if pd.notna(seller) else None)
+
+    in_stock = None
+    if "in_stock_listings" in products.columns:
+        in_stock = int(products["in_stock_listings"].gt(0).sum())
+
+    category = None
+    if "Category Name" in dataframe.columns and dataframe["Category Name"].nunique() == 1:
+        category = _most_common(dataframe["Category Name"])
+    brand = _most_common(dataframe["Brand"]) if "Brand" in dataframe.columns else None
+
+    return ResultAnalytics(
+        listings=len(dataframe),
+        products=len(products),
+        sellers=sellers,
+        min_price=min_price,
+        max_price=max_price,
+        median_price=median_price,
+        cheapest=cheapest,
+        in_stock=in_stock,
+        category=category,
+        brand=brand,
+    )
+
+
+def _language(country: Optional[str]) -> str:
+    return COUNTRY_LANGUAGES.get(country, "en")
+
+
+def _money(value: float, country: Optional[str], language: str) -> str:
+    amount = f"{value:,.2f}".removesuffix(".00")
+    if language != "en":
+        amount = amount.translate(str.maketrans(",.", ".,"))
+    return f"{country_currency_code.get(country or 'Nigeria', 'USD')}{amount}"
+
+
+def _count(count: int, noun: Tuple[str, str]) -> str:
+    return f"{count} {noun[0] if count == 1 else noun[1]}"
+
+
+def _round_price(value: float) -> str:
+    """Rounds a price up to two significant figures, the way a shopper would type it."""
+    step = 10 ** max(int(math.log10(value)) - 1, 0) if value >= 1 else 1
+    return str(math.ceil(value / step) * step)
+
+
+def no_products_reply(country: Optional[str] = None) -> str:
+    """Returns the reply to a search that found nothing, in the country's language.
+
+    Args:
+        country: The country searched.
+
+    Returns:
+        str: The reply.
+    """
+    return TEMPLATES[_language(country)]["no_products"]
+
+
+def render_summary(analytics: ResultAnalytics, country: Optional[str] = None) -> Dict[str, str | List[str]]:
+    """Renders analytics through the templates of the country's language.
+
+    Args:
+        analytics: The analytics of the results.
+        country: The country searched, which picks the language and the currency.
+
+    Returns:
+        Dict[str, str | List[str]]: data_summary and suggested_queries, shaped like a DataAnalysis completion.
+    """
+    language = _language(country)
+    templates = TEMPLATES[language]
+    if not analytics.products:
+        return {"data_summary": no_products_reply(country), "suggested_queries": []}
+
+    # A single product gets the "one_" variant of the sentences about all of them
+    one = "one_" if analytics.products == 1 else ""
+    sentences = []
+    products = _count(analytics.products, templates["product"])
+    if analytics.sellers:
+        sellers = _count(analytics.sellers, templates["seller"])
+        sentences.append(templates["found_sellers"].format(products=products, sellers=sellers))
+    else:
+        sentences.append(templates["found"].format(products=products))
+
+    if analytics.min_price is not None:
+        prices = {
+            key: _money(value, country, language)
+            for key, value in (
+                ("min_price", analytics.min_price),
+                ("max_price", analytics.max_price),
+                ("median_price", analytics.median_price),
+            )
+        }
+        single = analytics.min_price == analytics.max_price
+        sentences.append(templates[f"{one}single_price" if single else "price_range"].format(**prices))
+        if analytics.cheapest and analytics.products > 1 and not single:
+            name, price, seller = analytics.cheapest
+            template = templates["cheapest_seller" if seller else "cheapest"]
+            sentences.append(template.format(name=name, price=_money(price, country, language), seller=seller))
+
+    if analytics.in_stock is not None:
+        if analytics.in_stock == analytics.products:
+            sentences.append(templates[f"{one}all_in_stock"])
+        elif analytics.in_stock == 0:
+            sentences.append(templates[f"{one}none_in_stock"])
+        else:
+            sentences.append(templates["in_stock"].format(in_stock=analytics.in_stock))
+    if analytics.category:
+        sentences.append(templates[f"{one}category"].format(category=analytics.category))
+
+    suggested_queries = []
+    subject = (analytics.category or analytics.brand or "").lower()
+    if subject:
+        suggested_queries.append(templates["suggest_cheapest"].format(subject=subject))
+        suggested_queries.append(templates["suggest_in_stock"].format(subject=subject))
+        if analytics.median_price:
+            price = _round_price(analytics.median_price)
+            suggested_queries.append(templates["suggest_under"].format(subject=subject, price=price))
+
+    return {"data_summary": " ".join(sentences), "suggested_queries": suggested_queries}
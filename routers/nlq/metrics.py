@@ -0,0 +1,66 @@
+from typing import Any, Callable, Dict
+
+_stats_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_stats(name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+    """Registers a component whose counters are reported by the /metrics endpoint.
+
+    Args:
+        name: The name the stats are reported under.
+        provider: A callable returning the component's current counters.
+    """
+    _stats_providers[name] = provider
+
+
+def collect_stats() -> Dict[str, Dict[str, Any]]:
+    """Collects the counters of every registered component.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The counters keyed by component name.
+    """
+    return {name: provider() for name, provider in _stats_providers.items()}
+
+
+class CompletionUsageStats:
+    """Accumulates token usage per prompt, including the prompt tokens served from the provider's cache.
+
+    OpenAI reuses the computation of a prompt prefix it has seen recently (1024 tokens or more),
+    reporting those tokens as usage.prompt_tokens_details.cached_tokens; a high cached ratio means
+    the static part of the prompt is being reused.
+    """
+
+    def __init__(self):
+        self._prompts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, prompt: str, usage: Any) -> int:
+        """Records the usage of one completion.
+
+        Args:
+            prompt: The name of the prompt, e.g. "nlq" or "analytics".
+            usage: The completion's usage object, may be None.
+
+        Returns:
+            int: The number of cached prompt tokens of the completion.
+        """
+        if usage is None:
+            return 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        totals = self._prompts.setdefault(
+            prompt, {"completions": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+        )
+        totals["completions"] += 1
+        totals["prompt_tokens"] += usage.prompt_tokens or 0
+        totals["cached_tokens"] += cached_tokens
+        totals["completion_tokens"] += usage.completion_tokens or 0
+        return cached_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            prompt: {
+                **totals,
+                "cached_ratio": totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0,
+            }
+            for prompt, totals in self._prompts.items()
+        }
@@ -1,41 +1,65 @@
 import logging
 import os
 import traceback
-from typing import Any
+from typing import Any, Dict, List, Optional
 
+import pandas as pd
+from db.store import Conversation
 from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException, Response
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from google.cloud import bigquery
 from openai import OpenAI
 from rich.console import Console
-from db.helpers import create_conversation, get_conversation, save_message
 from routers.categories.schemas import CategoryRequest, CategoryResponse
-from routers.nlq.helpers import (
-    azure_vision_service,
-    detect_text,
+from routers.nlq.async_helpers import (
+    category_page_label,
+    create_conversation,
     execute_bigquery,
-    extract_code,
-    generate_gtin_sql,
-    generate_product_name_sql,
-    parse_nlq_search_query,
-    parse_sku_search_query,
-    process_product_image,
+    fetch_rows,
+    get_conversation,
+    polish_summary,
     regular_chat,
-    request_image_inference,
+    save_message,
+    schedule_summary_polish,
+    stream_category_page,
     summarize_results,
-
+    summary_store,
+)
+from routers.nlq.helpers import (
+    extract_code,
+    process_product_image,
 )
 from routers.nlq.schemas import (
+    BulkGTINRequest,
+    BulkGTINResponse,
+    GTINProducts,
     MarketplaceProductNigeria,
     NLQRequest,
     NLQResponse,
+    SummaryResponse,
 
 )
+from routers.nlq.intent import MALICIOUS_REPLY, MALICIOUS_SUGGESTED_QUERIES, Intent
+from routers.nlq.metrics import collect_stats
+from routers.nlq.pagination import CURSOR_MISMATCH, decode_cursor
+from routers.nlq.pipeline import (
+    DATA_UNAVAILABLE,
+    IMAGE_NOT_RECOGNIZED,
+    fetch_products,
+    plan_search,
+    plan_sku_search,
+    recognize_product,
+)
+from routers.nlq.projection import PRODUCT_RESPONSE_COLUMNS
+from routers.nlq.query_builder import bulk_gtin_query
+from routers.nlq.scheduler import QueryPriority, set_query_priority
+from routers.nlq.streaming import encode_event, stream_web_pipeline
 from routers.whatsapp.helpers import decrypt_request, encrypt_response, handle_whatsapp_data
 from routers.whatsapp.schema import (
     WhatsappNLQRequest,
 )
+from settings import get_settings
 
 
 logger = logging.getLogger("test-logger")
@@ -43,6 +67,8 @@ logger.setLevel(logging.DEBUG)
 
 load_dotenv()
 
+settings = get_settings()
+
 bigquery_client = bigquery.Client(project=os.environ.get("GCP_PROJECT_ID", None))
 
 client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY", None))
@@ -58,6 +84,15 @@ async def index():
     return {"message": "Hello World"}
 
 
+@router.get(
+    "/metrics",
+    summary="Cache and pipeline counters",
+    description="Hit/miss counters and other statistics of the in-process caches and pipeline stages.",
+)
+async def metrics_endpoint():
+    return collect_stats()
+
+
 @router.post(
     "/nlq",
     responses={
@@ -71,6 +106,7 @@ async def index():
     description="Process a natural language query to fetch matching products from the database.",
 )
 async def nlq_endpoint(request: WhatsappNLQRequest):
+    set_query_priority(QueryPriority.FLOW)
     response: dict = {}
     try:
         private_key = open("whatsapp_private_key.pem", "r").read()
@@ -92,7 +128,7 @@ async def nlq_endpoint(request: WhatsappNLQRequest):
             case "data_exchange":
                 try:
                     print(data.decrypted_body.data, 'data')
-                    init_response = handle_whatsapp_data(data.decrypted_body.data)
+                    init_response = await handle_whatsapp_data(data.decrypted_body.data)
                     data_response = init_response.data.model_dump(mode="json")
                     suggested_queries = data_response.get("suggested_queries", []) if len(data_response.get("suggested_queries", [])) > 1 else [
                         {
@@ -178,6 +214,110 @@ async def nlq_endpoint(request: WhatsappNLQRequest):
         return JSONResponse(content={}, status_code=500)
 
 
+async def _summarized_response(
+    response: NLQResponse,
+    chat: Optional[List[Conversation]],
+    summary: Optional[Dict[str, Any]],
+    failure_message: str,
+) -> NLQResponse:
+    """Completes a response with a summary or chat reply and saves the reply to the conversation.
+
+    Args:
+        response: The response so far.
+        chat: The existing conversation, if any.
+        summary: The reply, from summarize_results, regular_chat or plan_query.
+        failure_message: The message of the response when there is no reply.
+
+    Returns:
+        NLQResponse: The completed response.
+    """
+    if not summary:
+        response.message = failure_message
+        response.results = response.results or []
+        response.analytics_queries = []
+        response.suggested_queries = response.suggested_queries or []
+        return response
+
+    result_analysis = summary.get("data_summary", None)
+    user_content = summary.get("user_message", None)["content"]
+
+    if chat:
+        chat_id = chat[0].chat_id
+        message_id = await save_message(chat_id, user_content, result_analysis)
+    else:
+        saved = await create_conversation(user_content, result_analysis)
+        chat_id, message_id = saved.chat_id, saved.id
+
+    response.summary_id = await schedule_summary_polish(summary, chat_id, message_id)
+    response.result_analysis = result_analysis
+    response.analytics_queries = summary.get("suggested_queries", None)
+    response.conversation_id = chat_id
+    return response
+
+
+async def _background_summary(
+    summary_id: str,
+    chat: Optional[List[Conversation]],
+    dataframe: pd.DataFrame,
+    natural_query: Optional[str],
+    country: str,
+    failure_message: str,
+) -> None:
+    """Summarizes results after they were returned and stores the summary for polling.
+
+    A local summary that asks for a rewrite is rewritten here, so the poll and the conversation get the same text.
+    """
+    try:
+        summary = await summarize_results(dataframe, natural_query, country=country)
+        if summary and summary.get("polish"):
+            summary = await polish_summary(summary)
+        summarized = await _summarized_response(NLQResponse(), chat, summary, failure_message)
+    except Exception:
+        logger.error(f"Error in background summary: {traceback.format_exc()}")
+        summary = None
+    if not summary:
+        await summary_store.fail(summary_id, failure_message)
+        return
+    await summary_store.complete(
+        summary_id, summarized.result_analysis, summarized.analytics_queries, summarized.conversation_id
+    )
+
+
+async def _results_summary(
+    response: NLQResponse,
+    chat: Optional[List[Conversation]],
+    dataframe: pd.DataFrame,
+    natural_query: Optional[str],
+    country: str,
+    failure_message: str,
+    background_tasks: Optional[BackgroundTasks] = None,
+) -> NLQResponse:
+    """Summarizes the results of a response now, or after it is sent when background_tasks are given.
+
+    Args:
+        response: The response with its results.
+        chat: The existing conversation, if any.
+        dataframe: The results to summarize.
+        natural_query: The natural language query.
+        country: The country searched.
+        failure_message: The message of the response when there is no summary.
+        background_tasks: The tasks run after the response is sent, to defer the summary to.
+
+    Returns:
+        NLQResponse: The summarized response, or the response with the summary_id to poll.
+    """
+    if background_tasks is None:
+        summary = await summarize_results(dataframe, natural_query, country=country)
+        return await _summarized_response(response, chat, summary, failure_message)
+
+    response.summary_id = await summary_store.create()
+    response.conversation_id = chat[0].chat_id if chat else None
+    background_tasks.add_task(
+        _background_summary, response.summary_id, chat, dataframe, natural_query, country, failure_message
+    )
+    return response
+
+
 @router.post(
     "/web",
     responses={
@@ -190,14 +330,19 @@ async def nlq_endpoint(request: WhatsappNLQRequest):
     summary="API for web app",
     description="Process a natural language query to fetch matching products from the database.",
 )
-async def web_endpoint(request: NLQRequest, limit: int = 10):
+async def web_endpoint(
+    request: NLQRequest, background_tasks: BackgroundTasks, limit: int = 10, defer_summary: bool = False
+):
+    set_query_priority(QueryPriority.WEB)
     if limit <= 0:
         raise HTTPException(status_code=400, detail="Limit must be greater than zero.")
 
+    # Deferred summaries are written after the response is sent and polled from /web/summary/{summary_id}
+    summary_tasks = background_tasks if defer_summary else None
+
     response = NLQResponse()
 
     chat = None
-    chat_id: str = None
 
     conversation_id = request.conversation_id or None
     country = request.country or "Nigeria"
@@ -215,38 +360,15 @@ async def web_endpoint(request: NLQRequest, limit: int = 10):
         raise HTTPException(status_code=400, detail="No image or query submitted.")
 
     if conversation_id:
-        chat = get_conversation(conversation_id)
+        chat = await get_conversation(conversation_id)
         if chat is None:
             raise HTTPException(status_code=404, detail="Conversation not found.")
 
     if product_image:
-        steps = [azure_vision_service, detect_text]
-
-        for function in steps:
-            try:
-                result = function(product_image)
-                if result:
-                    if function is azure_vision_service:
-                        product_name: str = extract_code(result["label"])
-                        use_gtin = True
-
-                    if function is request_image_inference:
-                        product_name: str = result["label"]
-                        use_gtin = False
-
-                    if function is detect_text:
-                        possible_name: str = result["responses"][0][
-                            "fullTextAnnotation"
-                        ]["text"]
-                        product_name = possible_name.replace("\n", " ")
-                        use_gtin = False
-
-                    break
-            except Exception:
-                logger.error("Error in processing image: %s", traceback.format_exc())
+        product_name, use_gtin = await recognize_product(product_image)
     try:
         if not natural_query and not product_name:
-            response.message = "Sorry, we could not recognize the product or brand in your image. Please try again with another picture."
+            response.message = IMAGE_NOT_RECOGNIZED
             response.results = []
             response.analytics_queries = []
             response.suggested_queries = []
@@ -254,307 +376,234 @@ async def web_endpoint(request: NLQRequest, limit: int = 10):
             return response
 
         if not product_name:
-            nlq_sql_queries = parse_nlq_search_query(
-                natural_query, product_name, limit, country=country
-            )
-
-            if not nlq_sql_queries:
-                regular_summary = regular_chat(natural_query, conversations=chat)
-                if not regular_summary:
-                    response.message = "Sorry, we did not understand your search request. Please refine your search and try again"
-                    response.results = []
-                    response.analytics_queries = []
-                    response.suggested_queries = []
-
-                    return response
-
-                result_analysis = regular_summary.get("data_summary", None)
-                analytics_queries = regular_summary.get("suggested_queries", None)
-                user_message = regular_summary.get("user_message", None)
-
-                ai_content = result_analysis
-                user_content = user_message["content"]
-
-                if chat:
-                    chat_id = chat[0].chat_id
-                    save_message(chat_id, user_content, ai_content)
-                else:
-                    saved = create_conversation(user_content, ai_content)
-                    chat_id = saved.chat_id
-
-                response.result_analysis = result_analysis
-                response.analytics_queries = analytics_queries
-                response.conversation_id = chat_id
+            intent, plan = await plan_search(natural_query, limit, country, chat)
+            if intent == Intent.MALICIOUS:
+                response.result_analysis = MALICIOUS_REPLY
+                response.suggested_queries = list(MALICIOUS_SUGGESTED_QUERIES)
+                response.analytics_queries = list(MALICIOUS_SUGGESTED_QUERIES)
                 response.results = []
 
                 return response
 
-            nlq_sql_query = nlq_sql_queries.get("sql_query", None)
-            nlq_suggested_queries = nlq_sql_queries.get("suggested_queries", [])
+            sql_query = plan.get("sql_query", None) if plan else None
+            response.sql_query = sql_query
+            response.suggested_queries = plan.get("suggested_queries", []) if plan else None
 
-            response.sql_query = nlq_sql_query
-            response.suggested_queries = nlq_suggested_queries
-
-            if not nlq_sql_query:
-                regular_summary = regular_chat(natural_query, conversations=chat)
-                if not regular_summary:
-                    response.message = "Sorry, we did not understand your search request. Please refine your search and try again"
+            if sql_query:
+                products = await fetch_products(sql_query, plan.get("query_parameters"))
+                if not products:
+                    response.message = DATA_UNAVAILABLE
                     response.results = []
                     response.analytics_queries = []
 
                     return response
 
-                result_analysis = regular_summary.get("data_summary", None)
-                analytics_queries = regular_summary.get("suggested_queries", None)
-                user_message = regular_summary.get("user_message", None)
-
-                ai_content = result_analysis
-                user_content = user_message["content"]
-
-                if chat:
-                    chat_id = chat[0].chat_id
-                    save_message(chat_id, user_content, ai_content)
-                else:
-                    saved = create_conversation(user_content, ai_content)
-                    chat_id = saved.chat_id
-
-                response.result_analysis = result_analysis
-                response.analytics_queries = analytics_queries
-                response.conversation_id = chat_id
-                response.results = []
-
-                return response
-
-            nlq_sql_query_job = execute_bigquery(nlq_sql_query)
-            if not nlq_sql_query_job:
-                response.message = "Sorry, we could not access the data you requested. Please try again later."
-                response.results = []
-                response.analytics_queries = []
-
-                return response
-
-            results = [dict(row) for row in nlq_sql_query_job.result()]
-            dataframe = nlq_sql_query_job.to_dataframe()
-
-            response.results = [
-                MarketplaceProductNigeria(**product) for product in results
-            ]
-
-            if dataframe.empty:
-                regular_summary = regular_chat(natural_query, conversations=chat)
-                if not regular_summary:
-                    response.message = "Sorry! Could not generate appropriate response due to lack of data"
-                    response.results = []
-                    response.analytics_queries = []
-                    return response
-
-                result_analysis = regular_summary.get("data_summary", None)
-                analytics_queries = regular_summary.get("suggested_queries", None)
-                user_message = regular_summary.get("user_message", None)
-
-                ai_content = result_analysis
-                user_content = user_message["content"]
-
-                if chat:
-                    chat_id = chat[0].chat_id
-                    save_message(chat_id, user_content, ai_content)
-                else:
-                    saved = create_conversation(user_content, ai_content)
-                    chat_id = saved.chat_id
-
-                response.result_analysis = result_analysis
-                response.analytics_queries = analytics_queries
-                response.conversation_id = chat_id
-                response.results = []
-                return response
-
-            summary = summarize_results(dataframe, natural_query)
-            if not summary:
-                response.message = "Sorry! Could not generate appropriate response to summarize results"
-                return response
-
-            result_analysis = summary.get("data_summary", None)
-            analytics_queries = summary.get("suggested_queries", None)
-            user_message = summary.get("user_message", None)
-
-            ai_content = result_analysis
-            user_content = user_message["content"]
-
-            if chat:
-                chat_id = chat[0].chat_id
-                save_message(chat[0].chat_id, user_content, ai_content)
-            else:
-                saved = create_conversation(user_content, ai_content)
-                chat_id = saved.chat_id
-
-            response.result_analysis = result_analysis
-            response.analytics_queries = analytics_queries
-            response.conversation_id = chat_id
-
-            return response
-
-        if use_gtin:
-            sql_query = generate_gtin_sql(product_name, country)
-
-        else:
-            sql_query = generate_product_name_sql(product_name, country)
-
-        response.sql_query = sql_query
-
-        if not sql_query:
-            regular_summary = regular_chat(natural_query, conversations=chat)
-            if not regular_summary:
-                response.message = "Sorry, we could not understand your request. Please refine your input and try again"
-                response.results = []
-                response.analytics_queries = []
-                response.suggested_queries = []
-                return response
-
-            result_analysis = regular_summary.get("data_summary", None)
-            analytics_queries = regular_summary.get("suggested_queries", None)
-            user_message = regular_summary.get("user_message", None)
-
-            ai_content = result_analysis
-            user_content = user_message["content"]
-
-            if chat:
-                chat_id = chat[0].chat_id
-                save_message(chat_id, user_content, ai_content)
-            else:
-                saved = create_conversation(user_content, ai_content)
-                chat_id = saved.chat_id
-
-            response.result_analysis = result_analysis
-            response.analytics_queries = analytics_queries
-            response.conversation_id = chat_id
-
-            return response
-
-        nlq_query_job = execute_bigquery(sql_query)
-
-        sku_rows = [dict(row) for row in nlq_query_job.result()]
-
-        if len(sku_rows) < 1:
-            response.message = (
-                "No data relating to your product/query was found in our catalog"
+                results, dataframe = products
+                if not dataframe.empty:
+                    response.results = [MarketplaceProductNigeria(**product) for product in results]
+                    return await _results_summary(
+                        response,
+                        chat,
+                        dataframe,
+                        natural_query,
+                        country,
+                        "Sorry! Could not generate appropriate response to summarize results",
+                        summary_tasks,
+                    )
+
+            # Without SQL or products the plan's own reply is used; only local plans need a chat completion
+            if not plan or not plan.get("data_summary"):
+                plan = await regular_chat(natural_query, conversations=chat)
+            response.results = []
+            return await _summarized_response(
+                response,
+                chat,
+                plan,
+                "Sorry, we did not understand your search request. Please refine your search and try again",
             )
+
+        sku_search = await plan_sku_search(natural_query, product_name, use_gtin, country, limit)
+        response.sql_query = sku_search.sql_query or sku_search.mapping_sql
+        if sku_search.message:
+            response.message = sku_search.message
             response.results = []
             response.analytics_queries = []
             response.suggested_queries = []
 
             return response
 
-        sku_rows_array = []
-        if sku_rows:
-            for row in sku_rows:
-                skus = row["SKU_STRING"].split(",")
-                sku_rows_array.extend(skus)
-
-        sku_sql_queries = parse_sku_search_query(
-            natural_query,
-            product_name,
-            limit,
-            sku_rows_array,
-            country=country,
-        )
+        response.suggested_queries = sku_search.suggested_queries
 
-        if not sku_sql_queries:
-            response.message = "Sorry, we did not understand your search request. Please refine your search input and try again"
+        products = await fetch_products(sku_search.sql_query, sku_search.query_parameters)
+        if not products:
+            response.message = DATA_UNAVAILABLE
             response.results = []
             response.analytics_queries = []
-            response.suggested_queries = []
 
             return response
 
-        sku_sql_in = sku_sql_queries.get("sql", None)
-        sku_sql_where = sku_sql_queries.get("sql_query", None)
-        if sku_sql_where:
-            sku_sql_query = (
-                f"{sku_sql_in} {sku_sql_where.replace('WHERE', '')} LIMIT {limit};"
+        results, dataframe = products
+        response.results = [MarketplaceProductNigeria(**product) for product in results]
+
+        if dataframe.empty:
+            regular_summary = await regular_chat(natural_query or product_name, conversations=chat)
+            return await _summarized_response(
+                response, chat, regular_summary, "Sorry! Could not generate report needed for analysis"
             )
-        else:
-            sku_sql_query = f"{sku_sql_in} LIMIT {limit};"
 
-        sku_suggested_queries = sku_sql_queries.get("suggested_queries", None)
+        return await _results_summary(
+            response, chat, dataframe, natural_query, country, "Sorry! Could not generate analysis", summary_tasks
+        )
 
-        response.sql_query = sku_sql_query
-        response.suggested_queries = sku_suggested_queries
+    except Exception as e:
+        logger.error(f"Error in nlq_endpoint: {traceback.format_exc()}")
+        raise HTTPException(status_code=400, detail=str(e)) from e
 
-        if not sku_sql_query:
-            response.message = "Sorry, we did not understand your search request. Please refine your search input and try again"
-            response.results = []
-            response.analytics_queries = []
 
-            return response
+@router.get(
+    "/web/summary/{summary_id}",
+    responses={
+        200: {"description": "The summary, or its pending or failed status."},
+        404: {"description": "Summary not found."},
+    },
+    response_model=SummaryResponse,
+    summary="Summary of a web search",
+    description=(
+        "Polls the result_analysis of a /web search made with `defer_summary=true`, "
+        "which returns its results at once with a `summary_id`, or the rewrite of a local "
+        "summary returned with a `summary_id` when SUMMARY_MODE is async."
+    ),
+)
+async def web_summary_endpoint(summary_id: str):
+    summary = await summary_store.get(summary_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Summary not found.")
+    return SummaryResponse(summary_id=summary_id, **summary)
 
-        sku_sql_query_job = execute_bigquery(sku_sql_query)
-        if not sku_sql_query_job:
-            response.message = "Sorry, we could not access the data you requested. Please try again later."
-            response.results = []
-            response.analytics_queries = []
 
-            return response
+@router.post(
+    "/web/stream",
+    responses={
+        200: {"description": "Stream of pipeline events as NDJSON or server-sent events."},
+        400: {"description": "Bad request, invalid or empty query."},
+        404: {"description": "Conversation not found."},
+    },
+    summary="Streaming API for web app",
+    description=(
+        "Streaming variant of /web. Emits `query`, `results`, `analysis_delta`, `analysis` and `conversation` "
+        "events as each stage finishes. Send `Accept: text/event-stream` for server-sent events, NDJSON otherwise."
+    ),
+)
+async def web_stream_endpoint(request: NLQRequest, http_request: Request, limit: int = 10):
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="Limit must be greater than zero.")
 
-        results = [dict(row) for row in sku_sql_query_job.result()]
-        dataframe = sku_sql_query_job.to_dataframe()
+    chat = None
+    country = request.country or "Nigeria"
+    natural_query = request.query.strip() if request.query else None
+    product_image = (
+        process_product_image(request.product_image) if request.product_image else None
+    )
 
-        response.results = [MarketplaceProductNigeria(**product) for product in results]
+    if not natural_query and not product_image:
+        raise HTTPException(status_code=400, detail="No image or query submitted.")
 
-        if dataframe.empty:
-            regular_summary = regular_chat(natural_query, conversations=chat)
-            if not regular_summary:
-                response.message = (
-                    "Sorry! Could not generate report needed for analysis"
-                )
-                return response
-            result_analysis = regular_summary.get("data_summary", None)
-            analytics_queries = regular_summary.get("suggested_queries", None)
-            user_message = regular_summary.get("user_message", None)
+    if request.conversation_id:
+        chat = await get_conversation(request.conversation_id)
+        if chat is None:
+            raise HTTPException(status_code=404, detail="Conversation not found.")
 
-            ai_content = result_analysis
-            user_content = user_message["content"]
+    sse = "text/event-stream" in http_request.headers.get("accept", "")
 
-            if chat:
-                chat_id = chat[0].chat_id
-                save_message(chat_id, user_content, ai_content)
-            else:
-                saved = create_conversation(user_content, ai_content)
-                chat_id = saved.chat_id
+    async def event_stream():
+        set_query_priority(QueryPriority.WEB)
+        async for event in stream_web_pipeline(natural_query, product_image, country, limit, chat=chat):
+            yield encode_event(event, sse=sse)
 
-            response.result_analysis = result_analysis
-            response.analytics_queries = analytics_queries
-            response.conversation_id = chat_id
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-            return response
 
-        summary = summarize_results(dataframe, natural_query)
-        if not summary:
-            response.message = "Sorry! Could not generate analysis"
-            return response
+@router.post(
+    "/gtins",
+    responses={
+        200: {"description": "GTINs resolved successfully."},
+        400: {"description": "Bad request, no GTINs or too many GTINs."},
+    },
+    response_model=BulkGTINResponse,
+    response_model_by_alias=False,
+    summary="Resolve GTINs in bulk",
+    description=(
+        "Resolves many GTINs, or `Prefix_Code` barcode labels, to their products in one query, "
+        "grouped by GTIN. No LLM calls are made."
+    ),
+)
+async def bulk_gtin_endpoint(request: BulkGTINRequest, limit: int = 10):
+    set_query_priority(QueryPriority.WEB)
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="Limit must be greater than zero.")
 
-        result_analysis = summary.get("data_summary", None)
-        analytics_queries = summary.get("suggested_queries", None)
-        user_message = summary.get("user_message", None)
+    country = request.country or "Nigeria"
+    gtins = []
+    for label in request.gtins:
+        label = label.strip()
+        gtin = extract_code(label) if "_" in label else label
+        gtin = gtin.strip().lstrip("'")
+        if gtin and gtin not in gtins:
+            gtins.append(gtin)
+
+    if not gtins:
+        raise HTTPException(status_code=400, detail="No GTINs submitted.")
+    if len(gtins) > settings.BULK_GTIN_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {settings.BULK_GTIN_MAX_ITEMS} GTINs can be resolved at once."
+        )
 
-        ai_content = result_analysis
-        user_content = user_message["content"]
+    try:
+        query = bulk_gtin_query(gtins, country, limit)
+        query_job = await execute_bigquery(query.sql, query.parameters, PRODUCT_RESPONSE_COLUMNS)
+        if not query_job:
+            raise HTTPException(
+                status_code=400, detail="Sorry, we could not access the data you requested. Please try again later."
+            )
 
-        if chat:
-            chat_id = chat[0].chat_id
-            save_message(chat[0].chat_id, user_content, ai_content)
-        else:
-            saved = create_conversation(user_content, ai_content)
-            chat_id = saved.chat_id
+        products = {gtin: [] for gtin in gtins}
+        for row in await fetch_rows(query_job):
+            gtin = row.pop("Mapping").lstrip("'")
+            products.setdefault(gtin, []).append(MarketplaceProductNigeria(**row))
 
-        response.result_analysis = result_analysis
-        response.analytics_queries = analytics_queries
-        response.conversation_id = chat_id
+        return BulkGTINResponse(
+            country=country,
+            results=[GTINProducts(gtin=gtin, results=rows) for gtin, rows in products.items() if rows],
+            not_found=[gtin for gtin, rows in products.items() if not rows],
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error in bulk GTIN endpoint: %s", traceback.format_exc())
+        raise HTTPException(status_code=400, detail=str(e)) from e
 
-        return response
 
-    except Exception as e:
-        logger.error(f"Error in nlq_endpoint: {traceback.format_exc()}")
+def _category_page_args(request: CategoryRequest, page_size: int, cursor: Optional[str]):
+    """Validates a paginated category request; returns the category, country and decoded cursor."""
+    if not 0 < page_size <= settings.CATEGORY_MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"Page size must be between 1 and {settings.CATEGORY_MAX_PAGE_SIZE}."
+        )
+    category = request.category.strip() if request.category else None
+    country = request.country.strip() if request.country else "Nigeria"
+    if not category:
+        raise HTTPException(status_code=400, detail="No category submitted.")
+    try:
+        page_cursor = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
+    if page_cursor and page_cursor.label != category_page_label(category, country):
+        raise HTTPException(status_code=400, detail=CURSOR_MISMATCH)
+    return category, country, page_cursor
 
 
 @router.post(
@@ -567,9 +616,32 @@ async def web_endpoint(request: NLQRequest, limit: int = 10):
     response_model=CategoryResponse,
     response_model_by_alias=False,
     summary="Search by category",
-    description="Exactly what it says on the tin",
+    description=(
+        "Returns up to `limit` products of a category. With `page_size`, returns one page in Product ID order "
+        "and a `next_cursor` to pass as `cursor` for the next page, until it is null."
+    ),
 )
-async def category_endpoint(request: CategoryRequest, limit: int = 10):
+async def category_endpoint(
+    request: CategoryRequest, limit: int = 10, page_size: Optional[int] = None, cursor: Optional[str] = None
+):
+    set_query_priority(QueryPriority.CATEGORIES)
+    if page_size is not None or cursor:
+        page_size = limit if page_size is None else page_size
+        category, country, page_cursor = _category_page_args(request, page_size, cursor)
+        try:
+            results, next_cursor = [], None
+            async for page_event in stream_category_page(category, country, page_size, page_cursor):
+                if "error" in page_event:
+                    raise HTTPException(status_code=400, detail=page_event["error"])
+                results.extend(page_event.get("rows", []))
+                next_cursor = page_event.get("next_cursor", next_cursor)
+            return {"category": category, "results": results, "next_cursor": next_cursor}
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Error in category endpoint: %s", traceback.format_exc())
+            raise HTTPException(status_code=400, detail=str(e)) from e
+
     if limit <= 0:
         raise HTTPException(status_code=400, detail="Limit must be greater than zero.")
 
@@ -585,21 +657,63 @@ async def category_endpoint(request: CategoryRequest, limit: int = 10):
             WHERE LOWER(`Category Name`) = @category
             LIMIT @limit
         """
-        default_dataset = "snowflake_views"
-
-        job_config = bigquery.QueryJobConfig(
-            default_dataset=f"{bigquery_client.project}.{default_dataset}",
-            query_parameters=[
-                bigquery.ScalarQueryParameter("category", "STRING", category.lower()),
-                bigquery.ScalarQueryParameter("limit", "INT64", limit),
-            ],
-            # dry_run=True
-        )
-
-        category_query_job = bigquery_client.query(sql_query, job_config=job_config)
+        query_parameters = [
+            bigquery.ScalarQueryParameter("category", "STRING", category.lower()),
+            bigquery.ScalarQueryParameter("limit", "INT64", limit),
+        ]
+
+        category_query_job = await execute_bigquery(sql_query, query_parameters)
+        if not category_query_job:
+            raise HTTPException(
+                status_code=400, detail="Sorry, we could not access the data you requested. Please try again later."
+            )
 
-        rows = [dict(row) for row in category_query_job.result()]
+        rows = await fetch_rows(category_query_job)
         return {"category": category, "results": rows}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Error in category endpoint: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.post(
+    "/categories/stream",
+    responses={
+        200: {"description": "Stream of page events as NDJSON or server-sent events."},
+        400: {"description": "Bad request, invalid page size, cursor or empty category."},
+    },
+    summary="Streaming, paginated search by category",
+    description=(
+        "Streams one page of a category in Product ID order. Emits `results` events as rows arrive from "
+        "BigQuery, then a `page` event with the `next_cursor` to pass as `cursor` for the next page. "
+        "Send `Accept: text/event-stream` for server-sent events, NDJSON otherwise."
+    ),
+)
+async def category_stream_endpoint(
+    request: CategoryRequest, http_request: Request, page_size: int = 100, cursor: Optional[str] = None
+):
+    category, country, page_cursor = _category_page_args(request, page_size, cursor)
+    sse = "text/event-stream" in http_request.headers.get("accept", "")
+
+    async def event_stream():
+        set_query_priority(QueryPriority.CATEGORIES)
+        try:
+            async for page_event in stream_category_page(category, country, page_size, page_cursor):
+                if "error" in page_event:
+                    event = {"event": "error", "data": {"message": page_event["error"]}}
+                elif "rows" in page_event:
+                    rows = [MarketplaceProductNigeria(**row).model_dump(mode="json") for row in page_event["rows"]]
+                    event = {"event": "results", "data": {"results": rows}}
+                else:
+                    event = {"event": "page", "data": {"category": category, "next_cursor": page_event["next_cursor"]}}
+                yield encode_event(event, sse=sse)
+        except Exception:
+            logger.error("Error in category stream: %s", traceback.format_exc())
+            yield encode_event({"event": "error", "data": {"message": "Sorry! Could not load the category"}}, sse=sse)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
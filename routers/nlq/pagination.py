@@ -0,0 +1,92 @@
+import base64
+import binascii
+import hashlib
+import json
+from typing import NamedTuple, Optional
+
+# Job label that ties a snapshot to the query and values it was run for
+SNAPSHOT_LABEL = "page_snapshot"
+
+CURSOR_MISMATCH = "Cursor does not match this category."
+
+
+class Snapshot(NamedTuple):
+    """The results of a query job, left in the job's destination table to be read a page at a time."""
+
+    job_id: str
+    location: Optional[str]
+    table: str
+    total_rows: int
+
+
+class PageCursor(NamedTuple):
+    """Where the next page of a paginated query starts.
+
+    label is the snapshot label of the query and values the cursor was issued for, so it is only
+    accepted for the same category, table and sort order. offset is the position of the next row
+    in the snapshot of job_id. after is the last Product ID served, which resumes the pages with a
+    new snapshot when that one has expired.
+    """
+
+    label: str
+    job_id: Optional[str]
+    location: Optional[str]
+    offset: int
+    after: Optional[int]
+
+
+def snapshot_label(sql_query: str, *values: str) -> str:
+    """Returns the label value of the snapshots of a query run with the given values.
+
+    Args:
+        sql_query: The SQL query, before any projection.
+        *values: The parameter values that select the rows, e.g. the category.
+
+    Returns:
+        str: 16 hex characters, which fit a BigQuery label value.
+    """
+    return hashlib.sha256("\n".join((sql_query, *values)).encode()).hexdigest()[:16]
+
+
+def encode_cursor(cursor: PageCursor) -> str:
+    """Encodes a cursor as an opaque, URL-safe token.
+
+    Args:
+        cursor: The cursor.
+
+    Returns:
+        str: The token.
+    """
+    payload = json.dumps(list(cursor), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> PageCursor:
+    """Decodes a token made by encode_cursor.
+
+    Args:
+        token: The token.
+
+    Returns:
+        PageCursor: The cursor.
+
+    Raises:
+        ValueError: When the token is not a valid cursor.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        cursor = PageCursor(*payload)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, TypeError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+    valid = (
+        isinstance(cursor.label, str)
+        and isinstance(cursor.job_id, (str, type(None)))
+        and isinstance(cursor.location, (str, type(None)))
+        and type(cursor.offset) is int
+        and cursor.offset >= 0
+        and (cursor.after is None or type(cursor.after) is int)
+    )
+    if not valid:
+        raise ValueError("Invalid cursor.")
+    return cursor
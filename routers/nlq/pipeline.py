@@ -0,0 +1,163 @@
+import asyncio
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from db.store import Conversation
+from routers.nlq.async_helpers import (
+    azure_vision_service,
+    classify_intent,
+    detect_text,
+    execute_bigquery,
+    fetch_dataframe,
+    fetch_rows,
+    parse_sku_clause,
+    plan_query,
+    recognize_image,
+    search_product_index,
+)
+from routers.nlq.helpers import (
+    extract_code,
+    settings,
+)
+from routers.nlq.intent import Intent
+from routers.nlq.projection import PRODUCT_RESPONSE_COLUMNS, SKU_MAPPING_COLUMNS
+from routers.nlq.query_builder import gtin_query, product_name_query, product_name_words, sku_query
+
+IMAGE_NOT_RECOGNIZED = (
+    "Sorry, we could not recognize the product or brand in your image. Please try again with another picture."
+)
+PRODUCT_NOT_FOUND = "No data relating to your product/query was found in our catalog"
+SEARCH_NOT_UNDERSTOOD = (
+    "Sorry, we did not understand your search request. Please refine your search input and try again"
+)
+DATA_UNAVAILABLE = "Sorry, we could not access the data you requested. Please try again later."
+
+
+class SkuSearch(NamedTuple):
+    """The product query of a search for a recognized product.
+
+    mapping_sql is the query that looked the product's SKUs up. When the search cannot go on,
+    message says why and sql_query is None.
+    """
+
+    mapping_sql: str
+    sql_query: Optional[str] = None
+    query_parameters: Optional[Sequence[Any]] = None
+    suggested_queries: Optional[List[str]] = None
+    message: Optional[str] = None
+
+
+def _barcode(result: Dict) -> Optional[Tuple[str, bool]]:
+    if result.get("confidence", 0) > settings.IMAGE_RECOGNITION_THRESHOLD:
+        return extract_code(result["label"]), True
+    return None
+
+
+def _image_text(result: Dict) -> Tuple[str, bool]:
+    return str(result["responses"][0]["fullTextAnnotation"]["text"]).replace("\n", " "), False
+
+
+async def recognize_product(product_image: str) -> Tuple[Optional[str], bool]:
+    """Recognizes the product in an image by its barcode, or else by its text.
+
+    Args:
+        product_image: The processed base64 encoded product image.
+
+    Returns:
+        Tuple[Optional[str], bool]: The GTIN or product name, or None when nothing was recognized,
+            and whether it is a GTIN.
+    """
+    recognized = await recognize_image(product_image, [(azure_vision_service, _barcode), (detect_text, _image_text)])
+    # Text without a single word would search for nothing, so it counts as unrecognized
+    if recognized and (recognized[1] or product_name_words(recognized[0])):
+        return recognized
+    return None, False
+
+
+async def plan_search(
+    natural_query: str,
+    limit: int,
+    country: str,
+    chat: Optional[List[Conversation]],
+) -> Tuple[Intent, Optional[Dict]]:
+    """Classifies a text query and plans its SQL when it is a search.
+
+    Args:
+        natural_query: The user's natural language query.
+        limit: The result limit.
+        country: The country to search in.
+        chat: The existing conversation, if any.
+
+    Returns:
+        Tuple[Intent, Optional[Dict]]: The intent and the plan of plan_query, which is None for
+            anything but a search.
+    """
+    intent = classify_intent(natural_query)
+    # Chit-chat needs no SQL, so it goes straight to the chat reply without a query plan
+    if intent != Intent.SEARCH:
+        return intent, None
+    return intent, await plan_query(natural_query, limit, country=country, conversations=chat)
+
+
+async def plan_sku_search(
+    natural_query: Optional[str],
+    product_name: str,
+    use_gtin: bool,
+    country: str,
+    limit: int,
+) -> SkuSearch:
+    """Looks a recognized product's SKUs up and builds the query of its listings.
+
+    Args:
+        natural_query: The user's natural language query, which filters the listings.
+        product_name: The recognized GTIN or product name.
+        use_gtin: Whether product_name is a GTIN.
+        country: The country to search in.
+        limit: The result limit.
+
+    Returns:
+        SkuSearch: The product query, or the message of why there is none.
+    """
+    mapping_query = gtin_query(product_name, country) if use_gtin else product_name_query(product_name, country)
+
+    async def load_sku_rows():
+        if not use_gtin:
+            indexed_rows = search_product_index(product_name, country)
+            if indexed_rows:
+                return indexed_rows
+        nlq_query_job = await execute_bigquery(mapping_query.sql, mapping_query.parameters, SKU_MAPPING_COLUMNS)
+        return await fetch_rows(nlq_query_job) if nlq_query_job else []
+
+    # The clause does not depend on the SKU rows, so both round trips run together.
+    sku_rows, sku_sql_queries = await asyncio.gather(
+        load_sku_rows(),
+        parse_sku_clause(natural_query, product_name, country=country),
+    )
+    if not sku_rows:
+        return SkuSearch(mapping_query.sql, message=PRODUCT_NOT_FOUND)
+    if not sku_sql_queries:
+        return SkuSearch(mapping_query.sql, message=SEARCH_NOT_UNDERSTOOD)
+
+    sku_rows_array = [sku for row in sku_rows for sku in row["SKU_STRING"].split(",")]
+    sql_query, query_parameters = sku_query(sku_rows_array, country, sku_sql_queries.get("sql_query", None), limit)
+    return SkuSearch(mapping_query.sql, sql_query, query_parameters, sku_sql_queries.get("suggested_queries", None))
+
+
+async def fetch_products(
+    sql_query: str, query_parameters: Optional[Sequence[Any]]
+) -> Optional[Tuple[List[Dict], pd.DataFrame]]:
+    """Runs a product query.
+
+    Args:
+        sql_query: The SQL of a query plan or a SkuSearch.
+        query_parameters: Its parameters.
+
+    Returns:
+        Optional[Tuple[List[Dict], pd.DataFrame]]: The product rows and their DataFrame, or None when
+            BigQuery could not be reached.
+    """
+    query_job = await execute_bigquery(sql_query, query_parameters, PRODUCT_RESPONSE_COLUMNS)
+    if not query_job:
+        return None
+    return await fetch_rows(query_job), await fetch_dataframe(query_job)
@@ -0,0 +1,145 @@
+import heapq
+import math
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Splits a product name or OCR text into lowercase alphanumeric tokens.
+
+    Args:
+        text: The text to tokenize.
+
+    Returns:
+        List[str]: The tokens, single characters dropped.
+    """
+    if not text:
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1]
+
+
+class ProductNameIndex:
+    """An in-process inverted index over the product names of a SKU mapping table.
+
+    Rows are ranked with BM25, so the rare words of a noisy OCR text (a brand, a flavour) outweigh
+    the common ones ("drink", "ml") that a LIKE '%word%' OR ... scan would match on almost every
+    row. The index is rebuilt as a whole and swapped in, so searches never see a partial build.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        # (rows, postings, lengths, idf, average length), replaced in a single assignment
+        self._index: Tuple[List[Dict[str, Any]], Dict[str, Dict[int, int]], List[int], Dict[str, float], float] = (
+            [], {}, [], {}, 0.0
+        )
+        self.name_field = "Product Name"
+        self.built_at: Optional[float] = None
+        self.searches = 0
+        self.hits = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.built_at is not None
+
+    def build(self, rows: Iterable[Dict[str, Any]], name_field: str = "Product Name") -> None:
+        """Replaces the indexed rows.
+
+        Args:
+            rows: The mapping table rows, each with a product name.
+            name_field: The field holding the product name.
+        """
+        indexed_rows = []
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = []
+        for row in rows:
+            tokens = tokenize(row.get(name_field))
+            if not tokens:
+                continue
+            row_id = len(indexed_rows)
+            indexed_rows.append(row)
+            lengths.append(len(tokens))
+            for token, frequency in Counter(tokens).items():
+                postings.setdefault(token, {})[row_id] = frequency
+
+        total = len(indexed_rows)
+        idf = {
+            token: math.log((total - len(docs) + 0.5) / (len(docs) + 0.5) + 1)
+            for token, docs in postings.items()
+        }
+        self._index = (indexed_rows, postings, lengths, idf, sum(lengths) / total if total else 0.0)
+        self.name_field = name_field
+        self.built_at = time.time()
+
+    def search(self, text: Optional[str], limit: int = 10) -> List[Dict[str, Any]]:
+        """Finds the rows whose product names best match a text.
+
+        Args:
+            text: The product name or OCR text to search for.
+            limit: The maximum number of rows.
+
+        Returns:
+            List[Dict[str, Any]]: The best matching rows, best first.
+        """
+        rows, postings, lengths, idf, average_length = self._index
+        self.searches += 1
+        scores: Dict[int, float] = {}
+        for token in set(tokenize(text)):
+            for row_id, frequency in postings.get(token, {}).items():
+                norm = 1 - self.b + self.b * lengths[row_id] / average_length
+                scores[row_id] = scores.get(row_id, 0.0) + idf[token] * (
+                    frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+                )
+        if scores:
+            self.hits += 1
+        ranked = heapq.nsmallest(limit, scores, key=lambda row_id: (-scores[row_id], lengths[row_id]))
+        return [rows[row_id] for row_id in ranked]
+
+    def has_token(self, token: str) -> bool:
+        """Tells whether a product name has a word, or its plural.
+
+        Args:
+            token: The lowercase word.
+
+        Returns:
+            bool: True if at least one product name has the word.
+        """
+        postings = self._index[1]
+        return any(variant in postings for variant in (token, f"{token}s", f"{token}es"))
+
+    def contains(self, phrase: str) -> bool:
+        """Tells whether a product name contains a phrase, as LIKE '%phrase%' over the names would.
+
+        Only the rows that have every word of the phrase, or its plural, are compared.
+
+        Args:
+            phrase: The lowercase phrase.
+
+        Returns:
+            bool: True if at least one product name contains the phrase.
+        """
+        rows, postings, _, _, _ = self._index
+        candidates = None
+        for token in set(tokenize(phrase)):
+            row_ids = set()
+            for variant in (token, f"{token}s", f"{token}es"):
+                row_ids.update(postings.get(variant, ()))
+            candidates = row_ids if candidates is None else candidates & row_ids
+            if not candidates:
+                return False
+        return any(phrase in rows[row_id][self.name_field].lower() for row_id in candidates or ())
+
+    def stats(self) -> Dict[str, Any]:
+        rows, postings, _, _, _ = self._index
+        return {
+            "rows": len(rows),
+            "terms": len(postings),
+            "age_seconds": time.time() - self.built_at if self.built_at else None,
+            "searches": self.searches,
+            "hits": self.hits,
+        }
@@ -0,0 +1,116 @@
+from typing import Callable, Collection, Dict, Optional, Sequence, Tuple, Type
+
+import sqlglot
+from pydantic import BaseModel
+from sqlglot import exp
+
+from routers.nlq.schemas import MarketplaceProductNigeria
+
+# Returns the columns of a table, or None when they are not known.
+TableColumns = Callable[[str], Optional[Collection[str]]]
+
+
+def model_columns(model: Type[BaseModel]) -> Tuple[str, ...]:
+    """Returns the result columns a response model reads, i.e. the aliases of its fields.
+
+    Args:
+        model: The pydantic model the rows are validated into.
+
+    Returns:
+        Tuple[str, ...]: The column names, in field order.
+    """
+    return tuple(field.alias or name for name, field in model.model_fields.items())
+
+
+# Everything the web endpoints return per product; the summarizer reads a subset of these.
+PRODUCT_RESPONSE_COLUMNS = model_columns(MarketplaceProductNigeria)
+# What the web flows read from the SKU mapping tables.
+SKU_MAPPING_COLUMNS = ("Product Name", "Mapping", "SKU_STRING")
+
+# SELECT * EXCEPT/REPLACE/RENAME already picks its columns; sqlglot versions name the except key differently.
+STAR_MODIFIERS = ("except", "except_", "replace", "rename")
+
+
+def _table_aliases(select: exp.Select) -> Dict[str, Optional[str]]:
+    """Maps each alias or name in a SELECT's FROM and JOINs to its table, or None for subqueries and UNNESTs."""
+    # sqlglot versions name the FROM key differently
+    sources = [select.args.get("from_") or select.args.get("from")] + list(select.args.get("joins") or [])
+    aliases = {}
+    for source in sources:
+        if source is None:
+            continue
+        relation = source.this
+        name = relation.alias_or_name
+        aliases[name] = relation.name if isinstance(relation, exp.Table) else None
+    return aliases
+
+
+def _project(
+    select: exp.Select, columns: Sequence[str], table_columns: Optional[TableColumns], cte_names: Collection[str]
+) -> bool:
+    """Replaces the stars of one SELECT in place; returns whether any was replaced."""
+    if select.args.get("distinct"):
+        return False
+    aliases = _table_aliases(select)
+    projected = []
+    replaced = False
+    for expression in select.expressions:
+        star = expression if isinstance(expression, exp.Star) else None
+        qualifier = None
+        if isinstance(expression, exp.Column) and isinstance(expression.this, exp.Star):
+            star, qualifier = expression.this, expression.table
+        if star is None or any(star.args.get(modifier) for modifier in STAR_MODIFIERS):
+            projected.append(expression)
+            continue
+
+        if qualifier:
+            table = aliases.get(qualifier)
+        else:
+            table = next(iter(aliases.values())) if len(aliases) == 1 else None
+        if not table or table in cte_names:
+            projected.append(expression)
+            continue
+        available = table_columns(table) if table_columns else None
+        if table_columns and available is None:
+            projected.append(expression)
+            continue
+        wanted = [column for column in columns if available is None or column in available]
+        if not wanted:
+            projected.append(expression)
+            continue
+        projected.extend(exp.column(column, table=qualifier, quoted=True) for column in wanted)
+        replaced = True
+    if replaced:
+        select.set("expressions", projected)
+    return replaced
+
+
+def project_columns(
+    sql_query: str, columns: Sequence[str], table_columns: Optional[TableColumns] = None
+) -> Optional[str]:
+    """Rewrites SELECT * and SELECT alias.* over a table into the given columns.
+
+    Only stars over real tables are rewritten, not over subqueries, CTEs or UNNESTs, and never in a
+    SELECT DISTINCT, where fewer columns would change the rows. With table_columns, only the columns
+    the table has are selected and stars over tables with unknown columns are left alone.
+
+    Args:
+        sql_query: The BigQuery SQL query.
+        columns: The columns the consumer of the results reads.
+        table_columns: Optional lookup of the columns of a table.
+
+    Returns:
+        Optional[str]: The rewritten query, or None when there was no star to rewrite.
+    """
+    try:
+        statements = [statement for statement in sqlglot.parse(sql_query, read="bigquery") if statement]
+    except sqlglot.errors.SqlglotError:
+        return None
+    if len(statements) != 1:
+        return None
+    statement = statements[0]
+    cte_names = {cte.alias_or_name for cte in statement.find_all(exp.CTE)}
+    replaced = False
+    for select in list(statement.find_all(exp.Select)):
+        replaced = _project(select, columns, table_columns, cte_names) or replaced
+    return statement.sql(dialect="bigquery") if replaced else None
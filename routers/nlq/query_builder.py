@@ -0,0 +1,255 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+
+from google.cloud.bigquery import ArrayQueryParameter, ScalarQueryParameter, StructQueryParameter
+from google.cloud.bigquery.query import ScalarQueryParameterType, StructQueryParameterType
+
+QueryParameter = Union[ScalarQueryParameter, ArrayQueryParameter]
+
+SKU_TABLE_NG = "market_place_product_nigeria_mapping_table"
+SKU_TABLE_NON_NG = "marketplace_product_except_nigeria_sku_aggregate_2"
+PRODUCT_TABLE_NG = "marketplace_product_nigeria"
+PRODUCT_TABLE_NON_NG = "marketplace_product_except_nigeria_sku_aggregate"
+# The product view outside Nigeria that Text2SQL, the category pages and the fast path search
+CATALOG_TABLE_NON_NG = "marketplace_product_except_nigeria"
+# The views small enough to snapshot into the local replica
+REPLICA_TABLES = (SKU_TABLE_NG, SKU_TABLE_NON_NG, PRODUCT_TABLE_NG, PRODUCT_TABLE_NON_NG)
+
+PRODUCT_NAME_SEPARATORS = [",", ";", ":", "-", " "]
+
+EXTERNAL_MAPPING_TYPE = StructQueryParameterType(
+    ScalarQueryParameterType("STRING", name="external_id"),
+    ScalarQueryParameterType("STRING", name="SKU"),
+)
+
+
+class ParameterizedQuery(NamedTuple):
+    """A SQL statement and the query parameters it references.
+
+    Values are never pasted into the SQL text, so the same logical query always has the same
+    text, which keeps it small and lets BigQuery's result cache and our own cache hit.
+    """
+
+    sql: str
+    parameters: List[QueryParameter]
+
+
+def sku_table(country: Optional[str]) -> str:
+    return SKU_TABLE_NG if country == "Nigeria" else SKU_TABLE_NON_NG
+
+
+def product_table(country: Optional[str]) -> str:
+    return PRODUCT_TABLE_NG if country == "Nigeria" else PRODUCT_TABLE_NON_NG
+
+
+def catalog_table(country: Optional[str]) -> str:
+    return PRODUCT_TABLE_NG if country == "Nigeria" else CATALOG_TABLE_NON_NG
+
+
+def product_name_words(product_name: str) -> List[str]:
+    """Splits a product name into the distinct lowercase words it is searched by.
+
+    Args:
+        product_name: The product name, e.g. a label recognized from an image.
+
+    Returns:
+        List[str]: The sorted, distinct, non-empty words.
+    """
+    pattern = "|".join(re.escape(separator) for separator in PRODUCT_NAME_SEPARATORS)
+    return sorted({word.lower() for word in re.split(pattern, product_name) if word})
+
+
+def _refinement_clause(clause: Optional[str]) -> str:
+    """Prepares a Text2SQL clause for appending to a WHERE condition."""
+    if not clause:
+        return ""
+    return clause.replace("WHERE", "").strip().rstrip(";")
+
+
+def product_name_query(product_name: str, country: Optional[str], limit: int = 10) -> ParameterizedQuery:
+    """Builds a query for the SKU mappings of products with at least one word of the product name in their name.
+
+    Args:
+        product_name: The product name to search for.
+        country: The country to search for.
+        limit: The maximum number of rows.
+
+    Returns:
+        ParameterizedQuery: The query and its parameters.
+    """
+    sql = f"""
+        SELECT *
+        FROM `{sku_table(country)}`
+        WHERE EXISTS (
+            SELECT 1 FROM UNNEST(@words) AS word
+            WHERE LOWER(`Product Name`) LIKE CONCAT('%', word, '%')
+        )
+        LIMIT @limit
+    """
+    return ParameterizedQuery(sql, [
+        ArrayQueryParameter("words", "STRING", product_name_words(product_name)),
+        ScalarQueryParameter("limit", "INT64", limit),
+    ])
+
+
+def gtin_query(gtin: str, country: Optional[str], limit: int = 10) -> ParameterizedQuery:
+    """Builds a query for the SKU mappings of a GTIN.
+
+    Args:
+        gtin: The GTIN.
+        country: The country to search for.
+        limit: The maximum number of rows.
+
+    Returns:
+        ParameterizedQuery: The query and its parameters.
+    """
+    sql = f"""
+        SELECT *
+        FROM `{sku_table(country)}`
+        WHERE Mapping = @gtin
+        LIMIT @limit
+    """
+    return ParameterizedQuery(sql, [
+        ScalarQueryParameter("gtin", "STRING", gtin),
+        ScalarQueryParameter("limit", "INT64", limit),
+    ])
+
+
+def sku_query(
+    skus: Sequence[str], country: Optional[str], clause: Optional[str] = None, limit: int = 10
+) -> ParameterizedQuery:
+    """Builds a query for the products with the given SKUs, refined by a Text2SQL clause.
+
+    Args:
+        skus: The SKUs to select.
+        country: The country to search for.
+        clause: Optional Text2SQL conditional clause, beginning with AND.
+        limit: The maximum number of rows.
+
+    Returns:
+        ParameterizedQuery: The query and its parameters.
+    """
+    sql = (
+        f"SELECT * FROM `{product_table(country)}` WHERE SKU IN UNNEST(@skus) "
+        f"{_refinement_clause(clause)} LIMIT @limit"
+    )
+    return ParameterizedQuery(sql, [
+        ArrayQueryParameter("skus", "STRING", sorted(set(skus))),
+        ScalarQueryParameter("limit", "INT64", limit),
+    ])
+
+
+def external_mapping_query(
+    sku_rows: Dict[str, List[str]], country: Optional[str], clause: Optional[str] = None
+) -> ParameterizedQuery:
+    """Builds a query for the products with the given SKUs, tagged with the external id they were found by.
+
+    The mapping is passed as an ARRAY<STRUCT<external_id STRING, SKU STRING>> parameter.
+
+    Args:
+        sku_rows: A dictionary of external id to SKUs.
+        country: The country to search for.
+        clause: Optional Text2SQL conditional clause, beginning with AND.
+
+    Returns:
+        ParameterizedQuery: The query and its parameters.
+    """
+    mapping = [
+        StructQueryParameter(
+            None,
+            ScalarQueryParameter("external_id", "STRING", external_id),
+            ScalarQueryParameter("SKU", "STRING", sku),
+        )
+        for external_id, skus in sorted(sku_rows.items())
+        for sku in skus
+    ]
+    refinement = _refinement_clause(clause)
+    order_by = "" if "ORDER BY" in refinement.upper() else "ORDER BY em.external_id"
+    sql = f"""
+        WITH external_mapping AS (
+            SELECT mapping.external_id, mapping.SKU FROM UNNEST(@external_mapping) AS mapping
+        )
+        SELECT em.external_id, p.*
+        FROM `{product_table(country)}` p
+        JOIN external_mapping em ON p.SKU = em.SKU
+        WHERE TRUE {refinement}
+        {order_by}
+    """
+    return ParameterizedQuery(sql, [ArrayQueryParameter("external_mapping", EXTERNAL_MAPPING_TYPE, mapping)])
+
+
+def gtin_mapping_values(gtins: Sequence[str]) -> List[str]:
+    """Returns the Mapping values a list of GTINs may be stored as.
+
+    Recognized barcodes are stored with a leading apostrophe (see extract_code), so both spellings
+    of each GTIN are searched.
+
+    Args:
+        gtins: The GTINs, without the apostrophe.
+
+    Returns:
+        List[str]: The sorted, distinct Mapping values.
+    """
+    return sorted({value for gtin in gtins for value in (gtin, f"'{gtin}")})
+
+
+def bulk_gtin_query(gtins: Sequence[str], country: Optional[str], limit: int = 10) -> ParameterizedQuery:
+    """Builds one query for the products of many GTINs, tagged with the Mapping they were found by.
+
+    The SKU mapping rows are resolved and joined with the product rows in the same query, and each
+    GTIN returns at most `limit` products.
+
+    Args:
+        gtins: The GTINs, without the apostrophe.
+        country: The country to search for.
+        limit: The maximum number of products per GTIN.
+
+    Returns:
+        ParameterizedQuery: The query and its parameters.
+    """
+    sql = f"""
+        WITH mapping AS (
+            SELECT m.Mapping, sku
+            FROM `{sku_table(country)}` m, UNNEST(SPLIT(m.SKU_STRING, ',')) AS sku
+            WHERE m.Mapping IN UNNEST(@mappings)
+        )
+        SELECT mapping.Mapping, p.*
+        FROM mapping
+        JOIN `{product_table(country)}` p ON p.SKU = mapping.sku
+        WHERE TRUE
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY mapping.Mapping ORDER BY p.SKU) <= @limit
+        ORDER BY mapping.Mapping, p.SKU
+    """
+    return ParameterizedQuery(sql, [
+        ArrayQueryParameter("mappings", "STRING", gtin_mapping_values(gtins)),
+        ScalarQueryParameter("limit", "INT64", limit),
+    ])
+
+
+def category_page_query(category: str, country: Optional[str], after: Optional[int] = None) -> ParameterizedQuery:
+    """Builds the query behind the pages of a category, in a stable Product ID order.
+
+    The query has no LIMIT: it runs once and its results are read a page at a time. @after is the
+    last Product ID already served, or NULL for the whole category, so the pages can be resumed
+    by keyset when the results of an earlier run are gone.
+
+    Args:
+        category: The category name, matched case-insensitively.
+        country: The country to search for.
+        after: The last Product ID already served.
+
+    Returns:
+        ParameterizedQuery: The query and its parameters.
+    """
+    sql = f"""
+        SELECT *
+        FROM `{catalog_table(country)}`
+        WHERE LOWER(`Category Name`) = @category
+            AND `Product ID` IS NOT NULL
+            AND (@after IS NULL OR `Product ID` > @after)
+        ORDER BY `Product ID`
+    """
+    return ParameterizedQuery(sql, [
+        ScalarQueryParameter("category", "STRING", category.lower()),
+        ScalarQueryParameter("after", "INT64", after),
+    ])
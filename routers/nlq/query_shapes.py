@@ -0,0 +1,211 @@
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from google.cloud.bigquery import ScalarQueryParameter
+
+from routers.nlq.query_builder import QueryParameter, catalog_table
+
+# Words before and after the query that do not change it
+LEADING_WORDS = re.compile(
+    r"^(?:please\s+)?(?:(?:can you\s+|could you\s+)?(?:show|find|list|get|give|search for|search|fetch)(?:\s+me)?"
+    r"|i want|i need|i am looking for|i'm looking for|looking for|do you have|are there|any)\s+"
+    r"(?:the\s+|all\s+|some\s+|any\s+)?"
+)
+TRAILING_WORDS = re.compile(r"[\s?.!]*(?:\s+please)?[\s?.!]*$")
+
+SUBJECT = r"(?P<subject>[a-z0-9][a-z0-9&' \-]{0,48}?)"
+PRICED = r"(?:\s+(?:priced|costing|that costs?|with (?:a )?price|at prices?))?"
+
+
+def _price(name: str) -> str:
+    return rf"(?:₦\s?|ngn\s?|n(?=\d))?(?P<{name}>\d[\d,]*(?:\.\d+)?k?)(?:\s?(?:naira|ngn|bucks))?"
+
+
+SHAPES: List[Tuple[str, re.Pattern]] = [
+    (shape, re.compile(pattern))
+    for shape, pattern in (
+        ("price_below", SUBJECT + PRICED + r"\s+(?:under|below|less than|cheaper than|for less than|at most"
+         r"|not more than|max|within)\s+" + _price("price")),
+        ("price_above", SUBJECT + PRICED + r"\s+(?:over|above|more than|at least|from)\s+" + _price("price")),
+        ("price_between", SUBJECT + PRICED + r"\s+between\s+" + _price("low") + r"\s+and\s+" + _price("high")),
+        ("cheapest", r"(?:top\s+\d+\s+)?(?P<order>cheapest|lowest priced|least expensive|most expensive|priciest"
+         r"|highest priced)\s+" + SUBJECT),
+        ("in_stock", SUBJECT + r"\s+(?:that (?:are|is)\s+)?(?:in stock|available)"),
+    )
+]
+
+# Subjects that name no product at all, e.g. "products under 500"
+GENERIC_SUBJECTS = {"product", "products", "item", "items", "thing", "things", "anything", "something", "stuff"}
+# Words that may trail a subject without changing it, e.g. "coca-cola products"
+SUBJECT_SUFFIXES = (" products", " items", " brand")
+DESCENDING_ORDERS = {"most expensive", "priciest", "highest priced"}
+
+
+def _number(text: str) -> float:
+    value = text.replace(",", "")
+    return float(value[:-1]) * 1000 if value.endswith("k") else float(value)
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if value == int(value) else str(value)
+
+
+def _singular(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+class QueryShapeParser:
+    """Compiles the common shapes of a catalog search to SQL without an LLM.
+
+    A large share of queries are "<product> under <N>", "cheapest <category>" or "<brand> in stock".
+    The whole query must match one of the shapes and the subject must resolve to a category, a known
+    brand or, for the price shapes, a phrase that some product name contains; anything else, such as
+    a synonym or a subject that is really a description, is a parse failure the caller sends to
+    Text2SQL. products(phrase, country) tells whether a product name contains the phrase; without
+    it, subjects must be a category or a brand. Values are passed as query parameters, never pasted
+    into the SQL.
+    """
+
+    def __init__(
+        self,
+        categories: Iterable[str],
+        brands: Iterable[str] = (),
+        products: Optional[Callable[[str, Optional[str]], bool]] = None,
+    ):
+        self.categories = {category.lower(): category for category in categories}
+        self.brands = {brand.lower() for brand in brands}
+        self.products = products
+        self.counts = Counter()
+        self._words = self._vocabulary()
+
+    def set_brands(self, brands: Iterable[str]) -> None:
+        """Replaces the known brands, e.g. with the distinct brands of a fresh catalog snapshot.
+
+        Args:
+            brands: The brand names.
+        """
+        self.brands = {brand.lower() for brand in brands if brand}
+        self._words = self._vocabulary()
+
+    def _vocabulary(self) -> Set[str]:
+        return {word for name in (*self.categories, *self.brands) for word in re.findall(r"[a-z0-9]+", name)}
+
+    def has_word(self, word: str) -> bool:
+        """Tells whether a word, or its singular or plural, is part of a category or brand name.
+
+        Args:
+            word: The lowercase word.
+
+        Returns:
+            bool: True if a category or brand name has the word.
+        """
+        return any(candidate in self._words for candidate in (word, f"{word}s", _singular(word)))
+
+    def _match(self, natural_query: str) -> Optional[Tuple[str, re.Match]]:
+        text = " ".join(natural_query.lower().split())
+        text = LEADING_WORDS.sub("", TRAILING_WORDS.sub("", text))
+        for shape, pattern in SHAPES:
+            match = pattern.fullmatch(text)
+            if match:
+                return shape, match
+        return None
+
+    def _subject(
+        self, subject: str, country: Optional[str], allow_product: bool
+    ) -> Optional[Tuple[str, List[QueryParameter]]]:
+        """Resolves a subject to its WHERE condition, or None when it cannot be resolved."""
+        subjects = [subject.strip(" -'")]
+        for suffix in SUBJECT_SUFFIXES:
+            if subjects[0].endswith(suffix):
+                subjects.append(subjects[0][:-len(suffix)])
+        if subjects[0] in GENERIC_SUBJECTS:
+            return "TRUE", []
+
+        for subject in subjects:
+            for candidate in (subject, f"{subject}s", _singular(subject)):
+                if candidate in self.categories:
+                    return "LOWER(`Category Name`) = @category", [ScalarQueryParameter("category", "STRING", candidate)]
+            for candidate in (subject, subject.replace(" ", "-"), subject.replace("-", " ")):
+                if candidate in self.brands:
+                    return "LOWER(`Brand`) = @brand", [ScalarQueryParameter("brand", "STRING", candidate)]
+        if not allow_product or self.products is None:
+            return None
+        phrase = " ".join(_singular(word) for word in subjects[-1].split())
+        if not self.products(phrase, country):
+            return None
+        return (
+            "(LOWER(`Product Name`) LIKE @product OR LOWER(`Brand`) LIKE @product)",
+            [ScalarQueryParameter("product", "STRING", f"%{phrase}%")],
+        )
+
+    def parse(self, natural_query: Optional[str], country: Optional[str], limit: int = 10) -> Optional[Dict[str, Any]]:
+        """Compiles a query of a known shape.
+
+        Args:
+            natural_query: The natural language query.
+            country: The country to search in.
+            limit: The maximum number of products.
+
+        Returns:
+            Optional[Dict[str, Any]]: The sql_query, its query_parameters and suggested_queries, shaped
+                like a Text2SQL completion, or None when the query has no known shape.
+        """
+        matched = self._match(natural_query or "")
+        resolved = None
+        if matched:
+            shape, match = matched
+            resolved = self._subject(match["subject"], country, allow_product=shape != "in_stock")
+        if not resolved:
+            self.counts["misses"] += 1
+            return None
+        self.counts[shape] += 1
+
+        condition, parameters = resolved
+        subject = " ".join(match["subject"].split())
+        conditions = [condition]
+        order_by = ""
+        if shape == "price_below":
+            price = _number(match["price"])
+            conditions.append("`Product Price` < @price")
+            parameters.append(ScalarQueryParameter("price", "FLOAT64", price))
+            suggested = [f"cheapest {subject}", f"{subject} under {_format_number(price * 2)}", f"{subject} in stock"]
+        elif shape == "price_above":
+            price = _number(match["price"])
+            conditions.append("`Product Price` > @price")
+            parameters.append(ScalarQueryParameter("price", "FLOAT64", price))
+            suggested = [f"most expensive {subject}", f"{subject} under {_format_number(price)}", f"{subject} in stock"]
+        elif shape == "price_between":
+            low, high = sorted((_number(match["low"]), _number(match["high"])))
+            conditions.append("`Product Price` BETWEEN @low AND @high")
+            parameters += [ScalarQueryParameter("low", "FLOAT64", low), ScalarQueryParameter("high", "FLOAT64", high)]
+            suggested = [f"cheapest {subject}", f"{subject} under {_format_number(low)}", f"{subject} in stock"]
+        elif shape == "cheapest":
+            descending = match["order"] in DESCENDING_ORDERS
+            order_by = f"ORDER BY `Product Price` {'DESC' if descending else 'ASC'}"
+            opposite = "cheapest" if descending else "most expensive"
+            suggested = [f"{opposite} {subject}", f"{subject} in stock", f"{subject} under 1000"]
+        else:
+            conditions.append("LOWER(`Stock Status`) = 'in stock'")
+            suggested = [f"cheapest {subject}", f"most expensive {subject}", f"{subject} under 1000"]
+        parameters.append(ScalarQueryParameter("limit", "INT64", limit))
+
+        where = "\n            AND ".join(condition for condition in conditions if condition != "TRUE") or "TRUE"
+        sql = f"""
+        SELECT *
+        FROM `{catalog_table(country)}`
+        WHERE {where}
+        {order_by}
+        LIMIT @limit
+    """
+        return {"sql_query": sql, "query_parameters": parameters, "suggested_queries": suggested}
+
+    def stats(self) -> Dict[str, Any]:
+        misses = self.counts["misses"]
+        hits = sum(self.counts.values()) - misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "shapes": {shape: self.counts[shape] for shape, _ in SHAPES},
+        }
@@ -0,0 +1,172 @@
+import os
+import time
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Sequence, Tuple
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sqlglot
+from google.cloud.bigquery import ArrayQueryParameter, StructQueryParameter
+from sqlglot import exp
+
+
+@lru_cache(maxsize=1024)
+def to_duckdb(sql_query: str) -> Optional[Tuple[str, FrozenSet[str]]]:
+    """Translates a BigQuery SELECT statement to DuckDB.
+
+    Args:
+        sql_query: The BigQuery SQL query.
+
+    Returns:
+        Optional[Tuple[str, FrozenSet[str]]]: The DuckDB SQL and the tables it reads, or None when
+            the statement is not a single SELECT or cannot be translated.
+    """
+    try:
+        statements = sqlglot.parse(sql_query, read="bigquery")
+    except sqlglot.errors.ParseError:
+        return None
+    statements = [statement for statement in statements if statement is not None]
+    if len(statements) != 1 or not isinstance(statements[0], (exp.Select, exp.Union)):
+        return None
+    statement = statements[0]
+    cte_names = {cte.alias_or_name for cte in statement.find_all(exp.CTE)}
+    tables = frozenset(table.name for table in statement.find_all(exp.Table) if table.name not in cte_names)
+    return statement.sql(dialect="duckdb"), tables
+
+
+def _parameter_value(parameter: Any) -> Any:
+    if isinstance(parameter, StructQueryParameter):
+        return {name: value for name, value in parameter.struct_values.items()}
+    if isinstance(parameter, ArrayQueryParameter):
+        return [_parameter_value(value) for value in parameter.values]
+    return getattr(parameter, "value", parameter)
+
+
+def duckdb_parameters(query_parameters: Optional[Sequence[Any]]) -> Dict[str, Any]:
+    """Converts BigQuery query parameters to DuckDB named parameters.
+
+    Args:
+        query_parameters: ScalarQueryParameter/ArrayQueryParameter objects.
+
+    Returns:
+        Dict[str, Any]: The parameter values by name; ARRAY<STRUCT> values become lists of dicts.
+    """
+    return {parameter.name: _parameter_value(parameter) for parameter in query_parameters or []}
+
+
+class ProductReplica:
+    """A local DuckDB replica of the product and SKU mapping views, fed by Parquet snapshots.
+
+    Each table is exported from BigQuery to a Parquet file and loaded into an in-memory DuckDB
+    database. Parameterized lookups (SKU, GTIN, product name, category) that only read replicated
+    tables with a fresh snapshot are answered locally; anything else, and any query DuckDB fails to
+    run, returns None so the caller goes to BigQuery.
+    """
+
+    def __init__(self, directory: str, tables: Iterable[str], max_age: float):
+        self.directory = directory
+        self.tables = frozenset(tables)
+        self.max_age = max_age
+        self._connection = duckdb.connect()
+        self._snapshots: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _path(self, table: str) -> str:
+        return os.path.join(self.directory, f"{table}.parquet")
+
+    def export(self, table: str, arrow_table: pa.Table) -> None:
+        """Writes a snapshot of a table to Parquet and loads it.
+
+        Args:
+            table: The table name.
+            arrow_table: The full contents of the table.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(table)
+        pq.write_table(arrow_table, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        self.load(table)
+
+    def load(self, table: str) -> bool:
+        """Loads the Parquet snapshot of a table into DuckDB, replacing the previous one.
+
+        Args:
+            table: The table name.
+
+        Returns:
+            bool: Whether a snapshot was found.
+        """
+        path = self._path(table)
+        if not os.path.exists(path):
+            return False
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute(f'CREATE OR REPLACE TABLE "{table}" AS SELECT * FROM read_parquet(?)', [path])
+        finally:
+            cursor.close()
+        self._snapshots[table] = os.path.getmtime(path)
+        return True
+
+    def load_all(self) -> None:
+        """Loads the snapshots left on disk by a previous run."""
+        for table in self.tables:
+            self.load(table)
+
+    def snapshot_age(self, table: str) -> Optional[float]:
+        snapshot = self._snapshots.get(table)
+        return time.time() - snapshot if snapshot is not None else None
+
+    def _is_fresh(self, table: str) -> bool:
+        age = self.snapshot_age(table)
+        return age is not None and age <= self.max_age
+
+    def query(
+        self,
+        sql_query: str,
+        query_parameters: Optional[Sequence[Any]] = None,
+        parameterized_only: bool = True,
+    ) -> Optional[pa.Table]:
+        """Answers a lookup from the replica.
+
+        Args:
+            sql_query: The BigQuery SQL query.
+            query_parameters: The BigQuery query parameters referenced by the query.
+            parameterized_only: Whether to leave queries without parameters, i.e. free-form
+                Text2SQL output, to BigQuery.
+
+        Returns:
+            Optional[pa.Table]: The results, or None when the replica cannot answer the query.
+        """
+        translated = to_duckdb(sql_query) if query_parameters or not parameterized_only else None
+        if (
+            translated is None
+            or not translated[1]
+            or not all(table in self.tables and self._is_fresh(table) for table in translated[1])
+        ):
+            self.misses += 1
+            return None
+
+        cursor = self._connection.cursor()
+        try:
+            arrow_table = cursor.execute(translated[0], duckdb_parameters(query_parameters)).to_arrow_table()
+        except duckdb.Error:
+            self.errors += 1
+            self.misses += 1
+            return None
+        finally:
+            cursor.close()
+        self.hits += 1
+        return arrow_table
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "snapshot_age_seconds": {table: self.snapshot_age(table) for table in sorted(self.tables)},
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
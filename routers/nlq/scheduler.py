@@ -0,0 +1,228 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class QueryPriority(IntEnum):
+    """The order BigQuery jobs are admitted in when the pool is full; lower goes first."""
+
+    FLOW = 0
+    WEBHOOK = 1
+    WEB = 2
+    CATEGORIES = 3
+    BACKGROUND = 4
+
+
+class QueryRejected(Exception):
+    """Raised when a job could not start before its caller's deadline."""
+
+
+# Set per request by each endpoint with the time it started. Jobs run outside a request, such as the
+# replica exports and index refreshes, are background jobs without a deadline.
+query_priority: ContextVar[Tuple[QueryPriority, float]] = ContextVar(
+    "query_priority", default=(QueryPriority.BACKGROUND, 0.0)
+)
+
+
+# True while the current job holds a slot from admit_async; worker threads started with
+# asyncio.to_thread inherit it, so the job does not queue a second time in admit.
+query_admitted: ContextVar[bool] = ContextVar("query_admitted", default=False)
+
+
+def set_query_priority(priority: QueryPriority) -> None:
+    """Sets the priority of the BigQuery jobs of the current request; its deadline counts from now.
+
+    Args:
+        priority: The request's priority class.
+    """
+    query_priority.set((priority, time.monotonic()))
+
+
+class QueryScheduler:
+    """Admits BigQuery jobs into a bounded pool, highest priority first.
+
+    At most max_concurrency jobs run at once, matching the connection pool of the shared client, so
+    a spike queues here instead of in the HTTP pool or against the concurrent-query quota. Waiting
+    jobs are admitted by priority, then arrival. A job whose estimated wait would run past its
+    request's deadline is rejected right away rather than after the deadline has passed.
+
+    Coroutines wait with admit_async on the event loop and only then hand the job to a worker
+    thread, so queued jobs hold no thread of the default executor and are never reordered by its
+    FIFO queue. Code already on a thread waits with admit; both share one queue.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        deadlines: Optional[Dict[QueryPriority, float]] = None,
+        initial_job_seconds: float = 2.0,
+        smoothing: float = 0.2,
+    ):
+        self.max_concurrency = max_concurrency
+        self.deadlines = deadlines or {}
+        self.job_seconds = initial_job_seconds
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self._waiting: List[Tuple[int, int]] = []
+        # Queue time and wake-up callback of each waiting entry; admitted entries are removed
+        self._waiters: Dict[Tuple[int, int], Tuple[float, Callable[[], None]]] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {
+            priority: {"admitted": 0, "rejected": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for priority in QueryPriority
+        }
+
+    def deadline(self, priority: QueryPriority, started_at: float) -> Optional[float]:
+        seconds = self.deadlines.get(priority)
+        return started_at + seconds if seconds and started_at else None
+
+    def estimated_wait(self, ahead: int) -> float:
+        """Estimates the wait of a job with `ahead` jobs queued before it, from the average job time."""
+        if self.in_flight < self.max_concurrency and ahead == 0:
+            return 0.0
+        return (ahead + 1) / self.max_concurrency * self.job_seconds
+
+    def _admit_waiting(self) -> None:
+        """Admits waiting jobs while the pool has room; called with the lock held."""
+        while self._waiting and self.in_flight < self.max_concurrency:
+            entry = heapq.heappop(self._waiting)
+            queued_at, wake = self._waiters.pop(entry)
+            self.in_flight += 1
+            wait = time.monotonic() - queued_at
+            stats = self._stats[QueryPriority(entry[0])]
+            stats["admitted"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+            wake()
+
+    def _enqueue(self, wake: Callable[[], None]) -> Tuple[Tuple[int, int], Optional[float]]:
+        """Queues a job of the current request; wake is called once, with the lock held, when it is admitted.
+
+        Returns:
+            Tuple[Tuple[int, int], Optional[float]]: The queue entry and the request's deadline.
+
+        Raises:
+            QueryRejected: When the job's estimated wait runs past the request's deadline.
+        """
+        priority, started_at = query_priority.get()
+        deadline = self.deadline(priority, started_at)
+        queued_at = time.monotonic()
+        with self._lock:
+            entry = (int(priority), next(self._sequence))
+            ahead = sum(1 for other in self._waiting if other < entry)
+            if deadline is not None and queued_at + self.estimated_wait(ahead) > deadline:
+                self._stats[priority]["rejected"] += 1
+                raise QueryRejected(f"{priority.name} job would wait past its deadline")
+            heapq.heappush(self._waiting, entry)
+            self._waiters[entry] = (queued_at, wake)
+            self._admit_waiting()
+        return entry, deadline
+
+    def _withdraw(self, entry: Tuple[int, int]) -> bool:
+        """Takes a job out of the queue.
+
+        Returns:
+            bool: True if the job was still waiting, False if it was admitted in the meantime.
+        """
+        with self._lock:
+            if entry not in self._waiters:
+                return False
+            del self._waiters[entry]
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            self._stats[QueryPriority(entry[0])]["rejected"] += 1
+            # Jobs queued behind this one may fit now
+            self._admit_waiting()
+            return True
+
+    def _release(self, admitted_at: float) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            elapsed = time.monotonic() - admitted_at
+            self.job_seconds += self.smoothing * (elapsed - self.job_seconds)
+            self._admit_waiting()
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """Holds a slot of the pool for a job of the current request, blocking the thread while it waits.
+
+        Does not wait again inside admit_async, whose slot the job already holds.
+
+        Raises:
+            QueryRejected: When the job cannot start before the request's deadline.
+        """
+        if query_admitted.get():
+            yield
+            return
+
+        admitted = threading.Event()
+        entry, deadline = self._enqueue(admitted.set)
+        timeout = deadline - time.monotonic() if deadline is not None else None
+        if not admitted.wait(timeout) and self._withdraw(entry):
+            raise QueryRejected(f"{QueryPriority(entry[0]).name} job timed out in the queue")
+
+        admitted_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(admitted_at)
+
+    @asynccontextmanager
+    async def admit_async(self) -> AsyncIterator[None]:
+        """Holds a slot of the pool for a job of the current request, waiting on the event loop.
+
+        Raises:
+            QueryRejected: When the job cannot start before the request's deadline.
+        """
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def set_admitted():
+            # The waiter may have been cancelled before the loop ran this
+            if not admitted.done():
+                admitted.set_result(None)
+
+        def wake():
+            loop.call_soon_threadsafe(set_admitted)
+
+        entry, deadline = self._enqueue(wake)
+        timeout = deadline - time.monotonic() if deadline is not None else None
+        try:
+            await asyncio.wait_for(asyncio.shield(admitted), timeout)
+        except asyncio.TimeoutError:
+            if self._withdraw(entry):
+                raise QueryRejected(f"{QueryPriority(entry[0]).name} job timed out in the queue") from None
+        except asyncio.CancelledError:
+            if not self._withdraw(entry):
+                self._release(time.monotonic())
+            raise
+
+        admitted_at = time.monotonic()
+        token = query_admitted.set(True)
+        try:
+            yield
+        finally:
+            query_admitted.reset(token)
+            self._release(admitted_at)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiting),
+            "job_seconds": self.job_seconds,
+            "priorities": {
+                priority.name.lower(): {
+                    **stats,
+                    "mean_wait": stats["total_wait"] / stats["admitted"] if stats["admitted"] else 0.0,
+                }
+                for priority, stats in self._stats.items()
+            },
+        }
@@ -51,6 +51,32 @@ class NLQResponse(BaseModel):
     result_analysis: Optional[str] = None
     analytics_queries: Optional[List[str]] = None
     results: List[MarketplaceProductNigeria] = None
+    summary_id: Optional[str] = None
+
+
+class SummaryResponse(BaseModel):
+    summary_id: str
+    status: Literal["pending", "ready", "failed"]
+    message: Optional[str] = None
+    result_analysis: Optional[str] = None
+    analytics_queries: Optional[List[str]] = None
+    conversation_id: Optional[str] = None
+
+
+class BulkGTINRequest(BaseModel):
+    gtins: List[str]
+    country: Optional[str] = "Nigeria"
+
+
+class GTINProducts(BaseModel):
+    gtin: str
+    results: List[MarketplaceProductNigeria]
+
+
+class BulkGTINResponse(BaseModel):
+    country: Optional[str] = None
+    results: List[GTINProducts] = []
+    not_found: List[str] = []
 
 
 class Text2SQL(BaseModel):
@@ -63,6 +89,11 @@ class DataAnalysis(BaseModel):
     suggested_queries: Optional[List[str]]
 
 
+class QueryPlan(Text2SQL, DataAnalysis):
+    intent: Literal["search", "chat", "malicious"]
+    sql_query: Optional[str]
+
+
 class QueryRequest(BaseModel):
     query: str
     conversation_id: Optional[str] = None
@@ -0,0 +1,115 @@
+import asyncio
+import copy
+import functools
+import hashlib
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+def text_digest(text: Optional[str]) -> str:
+    """Returns a short key for a large text, such as a base64 encoded image."""
+    return hashlib.sha256((text or "").encode()).hexdigest()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls of a pipeline stage with the same key into one execution.
+
+    The first call of a key runs the stage in a task; calls made with the same key while it is
+    running await that task instead of running the stage again, and all of them receive its result
+    or its exception. Keys are forgotten as soon as the task finishes, so this never serves stale
+    results; caching is left to the stage. A caller that is cancelled does not cancel the work the
+    others are waiting for; the task is only cancelled when no caller is left waiting for it.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _forget(self, call_key: Tuple[str, Hashable], task: asyncio.Future) -> None:
+        if self._calls.get(call_key) is task:
+            del self._calls[call_key]
+        self._waiters.pop(task, None)
+        # Marks the exception as retrieved when every caller has gone away
+        if not task.cancelled():
+            task.exception()
+
+    async def run(
+        self,
+        stage: str,
+        key: Hashable,
+        function: Callable[[], Awaitable[Any]],
+        copy_result: bool = False,
+    ) -> Any:
+        """Runs function once for all concurrent calls of a stage with the same key.
+
+        Args:
+            stage: The name of the stage, which scopes the key and the stats.
+            key: The key of the call; calls with equal keys share one execution.
+            function: Starts the execution.
+            copy_result: Whether every caller gets its own deep copy of the result, for results the
+                callers may modify.
+
+        Returns:
+            Any: The result of the execution.
+        """
+        call_key = (stage, key)
+        stats = self._stats.setdefault(stage, {"executions": 0, "coalesced": 0})
+        task = self._calls.get(call_key)
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self._calls[call_key] = task
+            task.add_done_callback(functools.partial(self._forget, call_key))
+            stats["executions"] += 1
+        else:
+            stats["coalesced"] += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+                if not self._waiters[task]:
+                    # Later calls with the key start afresh instead of awaiting the cancelled task
+                    if self._calls.get(call_key) is task:
+                        del self._calls[call_key]
+                    task.cancel()
+            raise
+        return copy.deepcopy(result) if copy_result else result
+
+    def coalesce(
+        self, stage: str, key: Callable[..., Optional[Hashable]], copy_result: bool = False
+    ) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+        """Decorates an async function so concurrent calls with the same key share one execution.
+
+        Args:
+            stage: The name of the stage.
+            key: Maps the function's arguments, by name and with defaults applied, to the call's key,
+                or to None when the call must run on its own.
+            copy_result: Whether every caller gets its own deep copy of the result.
+
+        Returns:
+            Callable: The decorator.
+        """
+        def decorator(function: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+            signature = inspect.signature(function)
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await function(*args, **kwargs)
+                arguments = signature.bind(*args, **kwargs)
+                arguments.apply_defaults()
+                call_key = key(**arguments.arguments)
+                if call_key is None:
+                    return await function(*args, **kwargs)
+                return await self.run(stage, call_key, lambda: function(*args, **kwargs), copy_result)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._calls), "stages": copy.deepcopy(self._stats)}
@@ -0,0 +1,149 @@
+import hashlib
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Iterator, Type
+
+import sqlglot
+from sqlglot import exp
+
+# Comparisons rewritten so the literal is on the right, e.g. 500 > price becomes price < 500.
+FLIPPED_COMPARISONS = {
+    exp.EQ: exp.EQ,
+    exp.NEQ: exp.NEQ,
+    exp.GT: exp.LT,
+    exp.GTE: exp.LTE,
+    exp.LT: exp.GT,
+    exp.LTE: exp.GTE,
+}
+
+
+def canonical_sql(sql_query: str) -> str:
+    """Reduces a SQL string to a canonical text without parsing it.
+
+    Args:
+        sql_query: The SQL query.
+
+    Returns:
+        str: The query with whitespace collapsed and any trailing semicolon removed.
+    """
+    return " ".join(sql_query.split()).rstrip(";").strip()
+
+
+def _sort_key(expression: exp.Expression) -> str:
+    return expression.sql(dialect="bigquery", identify=True)
+
+
+def _operands(expression: exp.Expression, connector: Type[exp.Connector]) -> Iterator[exp.Expression]:
+    """Yields the operands of a chain of ANDs or ORs, looking through parentheses."""
+    if isinstance(expression, exp.Paren) and isinstance(expression.this, connector):
+        expression = expression.this
+    if isinstance(expression, connector):
+        yield from _operands(expression.this, connector)
+        yield from _operands(expression.expression, connector)
+    else:
+        yield expression
+
+
+def _number(text: str) -> str:
+    """Spells a numeric literal one way, e.g. 500.00 as 500.0, keeping integers integers."""
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        return text
+    if "." not in text and "e" not in text.lower():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _rewrite(expression: exp.Expression, strip_literals: bool) -> exp.Expression:
+    """Canonicalizes one node whose children are already canonical."""
+    if isinstance(expression, exp.Literal):
+        if strip_literals:
+            return exp.Placeholder()
+        if not expression.is_string:
+            return exp.Literal.number(_number(expression.this))
+        return expression
+
+    if isinstance(expression, exp.Paren):
+        inner = expression.this
+        if isinstance(inner, (exp.Predicate, exp.Column, exp.Literal, exp.Placeholder, exp.Paren)) or (
+            isinstance(inner, exp.Connector) and isinstance(expression.parent, (exp.Where, exp.Having))
+        ):
+            return inner
+        return expression
+
+    if isinstance(expression, (exp.And, exp.Or)):
+        connector = type(expression)
+        operands = {_sort_key(operand): operand for operand in _operands(expression, connector)}
+        ordered = [operands[key] for key in sorted(operands)]
+        combine = exp.and_ if connector is exp.And else exp.or_
+        return ordered[0] if len(ordered) == 1 else combine(*ordered, copy=False)
+
+    if type(expression) in FLIPPED_COMPARISONS:
+        left, right = expression.this, expression.expression
+        literals = (exp.Literal, exp.Placeholder)
+        if isinstance(left, literals) and not isinstance(right, literals):
+            return FLIPPED_COMPARISONS[type(expression)](this=right, expression=left)
+        if (
+            isinstance(expression, (exp.EQ, exp.NEQ))
+            and not isinstance(right, literals)
+            and _sort_key(right) < _sort_key(left)
+        ):
+            return type(expression)(this=right, expression=left)
+        return expression
+
+    if isinstance(expression, exp.In) and expression.expressions:
+        values = expression.expressions
+        if all(isinstance(value, (exp.Literal, exp.Placeholder)) for value in values):
+            unique = {_sort_key(value): value for value in values}
+            expression.set("expressions", [unique[key] for key in sorted(unique)])
+        return expression
+
+    return expression
+
+
+def _canonical_tree(expression: exp.Expression, strip_literals: bool) -> exp.Expression:
+    for child in list(expression.iter_expressions()):
+        child.replace(_canonical_tree(child, strip_literals))
+    return _rewrite(expression, strip_literals)
+
+
+@lru_cache(maxsize=4096)
+def canonicalize_sql(sql_query: str, strip_literals: bool = False) -> str:
+    """Rewrites a BigQuery statement into one canonical spelling.
+
+    Queries that differ only in whitespace, keyword casing, identifier quoting, the order of
+    AND/OR operands and IN-list values, redundant parentheses, which side of a comparison the
+    literal is on, or how a number is written come out as the same text. Statements sqlglot
+    cannot parse fall back to canonical_sql.
+
+    Args:
+        sql_query: The BigQuery SQL query, e.g. from parse_nlq_search_query or a SKU query with
+            its Text2SQL clause.
+        strip_literals: Whether to replace every literal with ?, so queries of the same shape with
+            different values share a text.
+
+    Returns:
+        str: The canonical SQL.
+    """
+    try:
+        statements = [statement for statement in sqlglot.parse(sql_query, read="bigquery") if statement]
+    except sqlglot.errors.SqlglotError:
+        statements = []
+    if len(statements) != 1:
+        return canonical_sql(sql_query)
+    statement = _canonical_tree(statements[0], strip_literals)
+    return statement.sql(dialect="bigquery", identify=True)
+
+
+def sql_fingerprint(sql_query: str, strip_literals: bool = False) -> str:
+    """Returns a short, stable hash of the canonical SQL.
+
+    Args:
+        sql_query: The BigQuery SQL query.
+        strip_literals: Whether queries of the same shape with different values share a fingerprint.
+
+    Returns:
+        str: 16 hex characters.
+    """
+    return hashlib.sha256(canonicalize_sql(sql_query, strip_literals).encode()).hexdigest()[:16]
@@ -0,0 +1,191 @@
+import json
+import logging
+import traceback
+from typing import AsyncIterator, Dict, List, Optional
+
+from db.store import Conversation
+from routers.nlq.async_helpers import (
+    create_conversation,
+    replay_summary,
+    save_message,
+    schedule_summary_polish,
+    stream_regular_chat,
+    stream_summarize_results,
+)
+from routers.nlq.intent import MALICIOUS_REPLY, MALICIOUS_SUGGESTED_QUERIES, Intent
+from routers.nlq.pipeline import (
+    DATA_UNAVAILABLE,
+    IMAGE_NOT_RECOGNIZED,
+    fetch_products,
+    plan_search,
+    plan_sku_search,
+    recognize_product,
+)
+from routers.nlq.schemas import MarketplaceProductNigeria
+
+logger = logging.getLogger("test-logger")
+logger.setLevel(logging.DEBUG)
+
+
+def encode_event(event: Dict, sse: bool = False) -> str:
+    """Encodes a pipeline event as an NDJSON line or a server-sent event.
+
+    Args:
+        event: The event, a dict with "event" and "data" keys.
+        sse: Whether to encode as a server-sent event instead of NDJSON.
+
+    Returns:
+        str: The encoded event.
+    """
+    if sse:
+        return f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+    return json.dumps(event, default=str) + "\n"
+
+
+def _event(name: str, **data) -> Dict:
+    return {"event": name, "data": data}
+
+
+async def _stream_analysis(
+    summary_events: AsyncIterator[Dict],
+    chat: Optional[List[Conversation]],
+) -> AsyncIterator[Dict]:
+    """Relays a streamed summary token by token, then stores it in the conversation.
+
+    Args:
+        summary_events: The events of stream_summarize_results or stream_regular_chat.
+        chat: The existing conversation, if any.
+
+    Yields:
+        Dict: analysis_delta events, then an analysis event and a conversation event.
+    """
+    summary = None
+    async for summary_event in summary_events:
+        if "delta" in summary_event:
+            yield _event("analysis_delta", delta=summary_event["delta"])
+        else:
+            summary = summary_event["summary"]
+
+    if not summary:
+        yield _event("error", message="Sorry! Could not generate analysis")
+        return
+
+    result_analysis = summary.get("data_summary", None)
+    analytics_queries = summary.get("suggested_queries", None)
+    user_content = summary.get("user_message", {}).get("content")
+    yield _event("analysis", result_analysis=result_analysis, analytics_queries=analytics_queries)
+
+    if chat:
+        chat_id = chat[0].chat_id
+        message_id = await save_message(chat_id, user_content, result_analysis)
+    else:
+        saved = await create_conversation(user_content, result_analysis)
+        chat_id, message_id = saved.chat_id, saved.id
+    summary_id = await schedule_summary_polish(summary, chat_id, message_id)
+    yield _event("conversation", conversation_id=chat_id, summary_id=summary_id)
+
+
+def _fallback_reply(
+    plan: Optional[Dict],
+    natural_query: Optional[str],
+    chat: Optional[List[Conversation]],
+) -> AsyncIterator[Dict]:
+    """Returns the reply for a query with no SQL or no products: the plan's own, or else a chat completion."""
+    if plan and plan.get("data_summary"):
+        return replay_summary(plan)
+    return stream_regular_chat(natural_query, conversations=chat)
+
+
+async def stream_web_pipeline(
+    natural_query: Optional[str],
+    product_image: Optional[str],
+    country: str,
+    limit: int,
+    chat: Optional[List[Conversation]] = None,
+) -> AsyncIterator[Dict]:
+    """Runs the web search pipeline and yields its results stage by stage.
+
+    The event order is: query (recognized product and SQL), results (product rows as soon as
+    BigQuery returns them), analysis_delta (result_analysis token by token), analysis and
+    conversation, whose summary_id polls the rewrite of a local summary. Failures are reported
+    as an error event that ends the stream.
+
+    Args:
+        natural_query: The user's natural language query.
+        product_image: Optional base64 encoded product image.
+        country: The country to search in.
+        limit: The result limit.
+        chat: The existing conversation, if any.
+
+    Yields:
+        Dict: Pipeline events with "event" and "data" keys.
+    """
+    try:
+        product_name, use_gtin = None, False
+        plan = None
+        if product_image:
+            product_name, use_gtin = await recognize_product(product_image)
+
+        if not natural_query and not product_name:
+            yield _event("error", message=IMAGE_NOT_RECOGNIZED)
+            return
+
+        if not product_name:
+            intent, plan = await plan_search(natural_query, limit, country, chat)
+            if intent == Intent.MALICIOUS:
+                suggested_queries = list(MALICIOUS_SUGGESTED_QUERIES)
+                yield _event(
+                    "query", query=natural_query, product_name=None, sql_query=None, suggested_queries=suggested_queries
+                )
+                yield _event("analysis", result_analysis=MALICIOUS_REPLY, analytics_queries=suggested_queries)
+                return
+
+            sql_query = plan.get("sql_query", None) if plan else None
+            query_parameters = plan.get("query_parameters") if plan else None
+            suggested_queries = plan.get("suggested_queries", []) if plan else []
+            yield _event(
+                "query",
+                query=natural_query,
+                product_name=product_name,
+                sql_query=sql_query,
+                suggested_queries=suggested_queries,
+            )
+            if not sql_query:
+                async for event in _stream_analysis(_fallback_reply(plan, natural_query, chat), chat):
+                    yield event
+                return
+        else:
+            sku_search = await plan_sku_search(natural_query, product_name, use_gtin, country, limit)
+            if sku_search.message:
+                yield _event("error", message=sku_search.message)
+                return
+            sql_query, query_parameters = sku_search.sql_query, sku_search.query_parameters
+            yield _event(
+                "query",
+                query=natural_query,
+                product_name=product_name,
+                sql_query=sql_query,
+                suggested_queries=sku_search.suggested_queries,
+            )
+
+        products = await fetch_products(sql_query, query_parameters)
+        if not products:
+            yield _event("error", message=DATA_UNAVAILABLE)
+            return
+
+        results, dataframe = products
+        yield _event(
+            "results",
+            results=[MarketplaceProductNigeria(**product).model_dump(mode="json") for product in results],
+        )
+
+        if dataframe.empty:
+            summary_events = _fallback_reply(plan, natural_query or product_name, chat)
+        else:
+            summary_events = stream_summarize_results(dataframe, natural_query, country=country)
+        async for event in _stream_analysis(summary_events, chat):
+            yield event
+
+    except Exception as e:
+        logger.error(f"Error in web stream: {traceback.format_exc()}")
+        yield _event("error", message=str(e))
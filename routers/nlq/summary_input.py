@@ -0,0 +1,137 @@
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+# Columns worth describing to the summarizer; IDs, timestamps and internal codes are dropped.
+PRODUCT_COLUMNS = ["Product Name", "Brand", "Manufacturer", "Category Name", "Top Category"]
+PRICE_COLUMN = "Product Price"
+QUANTITY_COLUMN = "Salable Quantity"
+SELLER_COLUMN = "Seller Name"
+STOCK_COLUMN = "Stock Status"
+
+# Rough size of a token in characters for English text and CSV; avoids a tokenizer dependency.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of tokens of a text.
+
+    Args:
+        text: The text to measure.
+
+    Returns:
+        int: The approximate token count.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _format_number(value) -> str:
+    if pd.isna(value):
+        return ""
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def aggregate_products(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """Collapses seller rows into one row per product with price, seller and stock aggregates.
+
+    Args:
+        dataframe: The query results, one row per seller listing.
+
+    Returns:
+        pd.DataFrame: One row per product, most widely sold first.
+    """
+    product_columns = [column for column in PRODUCT_COLUMNS if column in dataframe.columns]
+    key = ["SKU"] if "SKU" in dataframe.columns else product_columns[:1]
+    if not key:
+        return pd.DataFrame()
+
+    frame = dataframe.copy()
+    for column in key + product_columns:
+        frame[column] = frame[column].astype("string").fillna("")
+
+    aggregations = {column: (column, "first") for column in product_columns if column not in key}
+    aggregations["listings"] = (key[0], "size")
+    if PRICE_COLUMN in frame.columns:
+        frame[PRICE_COLUMN] = pd.to_numeric(frame[PRICE_COLUMN], errors="coerce").astype("float64")
+        aggregations.update(
+            min_price=(PRICE_COLUMN, "min"),
+            max_price=(PRICE_COLUMN, "max"),
+            mean_price=(PRICE_COLUMN, "mean"),
+        )
+    if SELLER_COLUMN in frame.columns:
+        aggregations["sellers"] = (SELLER_COLUMN, "nunique")
+    if QUANTITY_COLUMN in frame.columns:
+        frame[QUANTITY_COLUMN] = pd.to_numeric(frame[QUANTITY_COLUMN], errors="coerce").astype("float64")
+        aggregations["salable_quantity"] = (QUANTITY_COLUMN, "sum")
+    if STOCK_COLUMN in frame.columns:
+        frame["in_stock"] = frame[STOCK_COLUMN].astype("string").str.lower().eq("in stock").fillna(False)
+        aggregations["in_stock_listings"] = ("in_stock", "sum")
+
+    products = frame.groupby(key, sort=False, observed=True).agg(**aggregations).reset_index()
+    if "SKU" in key and "Product Name" in products.columns:
+        products = products.drop(columns="SKU")
+    return products.sort_values("listings", ascending=False, kind="stable")
+
+
+def _hoist_constant_columns(products: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+    """Moves text columns that hold one value for every product into header lines."""
+    header = []
+    for column in products.columns:
+        if products[column].dtype.kind in "biuf" or len(products) < 2:
+            continue
+        values = products[column].unique()
+        if len(values) == 1:
+            header.append(f"{column}: {values[0]} (all products)")
+            products = products.drop(columns=column)
+    return products, header
+
+
+def build_summary_input(dataframe: pd.DataFrame, token_budget: Optional[int] = None) -> str:
+    """Builds a compact description of query results for the summarization prompt.
+
+    Seller rows are aggregated per product, columns that are the same for every product are
+    stated once, and the products are rendered as CSV, most widely sold first, until the token
+    budget is reached. Totals always describe the full result set.
+
+    Args:
+        dataframe: The query results.
+        token_budget: Optional approximate token limit of the output.
+
+    Returns:
+        str: The summarization input.
+    """
+    products = aggregate_products(dataframe)
+    if products.empty:
+        return "No products."
+
+    lines = [f"{len(dataframe)} listings of {len(products)} products."]
+    if "min_price" in products.columns and products["min_price"].notna().any():
+        lines.append(
+            f"Price range: {_format_number(products['min_price'].min())} - "
+            f"{_format_number(products['max_price'].max())}."
+        )
+    if "sellers" in products.columns and SELLER_COLUMN in dataframe.columns:
+        lines.append(f"Distinct sellers: {dataframe[SELLER_COLUMN].nunique()}.")
+
+    products, header = _hoist_constant_columns(products)
+    lines.extend(header)
+
+    for column in ("min_price", "max_price", "mean_price", "salable_quantity"):
+        if column in products.columns:
+            products[column] = products[column].map(_format_number)
+
+    csv_lines = products.to_csv(index=False).splitlines()
+    text = "\n".join(lines + csv_lines[:1])
+    used = estimate_tokens(text)
+    shown = 0
+    for row in csv_lines[1:]:
+        cost = estimate_tokens(row)
+        if token_budget is not None and used + cost > token_budget:
+            break
+        text += "\n" + row
+        used += cost
+        shown += 1
+
+    if shown < len(products):
+        text += f"\n... {len(products) - shown} more products omitted."
+    return text
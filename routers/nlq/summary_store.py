@@ -0,0 +1,130 @@
+import uuid
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+SummarySaver = Callable[[str, Dict[str, Any]], Awaitable[None]]
+SummaryLoader = Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class SummaryStatus(str, Enum):
+    """Where a background summary is; polls repeat until it is no longer pending."""
+
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class SummaryStore:
+    """Tracks the summaries that are written after their results were returned.
+
+    Every summary is kept in a bounded LRU in memory, where the worker that runs it serves the
+    polls for it, and written through to the database, where any worker finds it once it has
+    been evicted or when the poll reaches another worker.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        saver: Optional[SummarySaver] = None,
+        loader: Optional[SummaryLoader] = None,
+    ):
+        self.max_entries = max_entries
+        self.saver = saver
+        self.loader = loader
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.memory_hits = 0
+        self.loads = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, summary_id: str, summary: Dict[str, Any]) -> None:
+        self._entries[summary_id] = summary
+        self._entries.move_to_end(summary_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _set(self, summary_id: str, summary: Dict[str, Any]) -> None:
+        self._remember(summary_id, summary)
+        if self.saver:
+            await self.saver(summary_id, summary)
+
+    async def create(self) -> str:
+        """Registers a pending summary.
+
+        Returns:
+            str: The id the summary is polled by.
+        """
+        summary_id = uuid.uuid4().hex
+        await self._set(summary_id, {"status": SummaryStatus.PENDING.value})
+        return summary_id
+
+    async def complete(
+        self,
+        summary_id: str,
+        result_analysis: Optional[str],
+        analytics_queries: Optional[list],
+        conversation_id: Optional[str],
+    ) -> None:
+        """Stores a finished summary.
+
+        Args:
+            summary_id: The id returned by create.
+            result_analysis: The analysis of the results.
+            analytics_queries: The suggested follow-up queries.
+            conversation_id: The conversation the analysis was saved to.
+        """
+        await self._set(
+            summary_id,
+            {
+                "status": SummaryStatus.READY.value,
+                "result_analysis": result_analysis,
+                "analytics_queries": analytics_queries,
+                "conversation_id": conversation_id,
+            },
+        )
+
+    async def fail(self, summary_id: str, message: str) -> None:
+        """Stores the failure of a summary.
+
+        Args:
+            summary_id: The id returned by create.
+            message: The message shown instead of the analysis.
+        """
+        await self._set(summary_id, {"status": SummaryStatus.FAILED.value, "message": message})
+
+    async def get(self, summary_id: str) -> Optional[Dict[str, Any]]:
+        """Looks up a summary.
+
+        Args:
+            summary_id: The id returned by create.
+
+        Returns:
+            Optional[Dict[str, Any]]: A copy of the summary with its status, or None when it is unknown.
+        """
+        summary = self._entries.get(summary_id)
+        if summary is not None:
+            self._entries.move_to_end(summary_id)
+            self.memory_hits += 1
+            return dict(summary)
+
+        summary = await self.loader(summary_id) if self.loader else None
+        if summary is None:
+            self.misses += 1
+            return None
+        self.loads += 1
+        # Pending summaries run on another worker, so only finished ones are kept
+        if summary["status"] != SummaryStatus.PENDING.value:
+            self._remember(summary_id, summary)
+        return dict(summary)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "pending": sum(summary["status"] == SummaryStatus.PENDING.value for summary in self._entries.values()),
+            "memory_hits": self.memory_hits,
+            "loads": self.loads,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
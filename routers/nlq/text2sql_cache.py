@@ -0,0 +1,196 @@
+import copy
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+Embedder = Callable[[str], Awaitable[List[float]]]
+
+
+def normalize_query(query: Optional[str]) -> str:
+    """Normalizes a natural language query for cache lookups.
+
+    Lowercases, drops punctuation and collapses whitespace, so "Coke under 500!" and
+    "coke  under 500" share an entry.
+
+    Args:
+        query: The natural language query.
+
+    Returns:
+        str: The normalized query.
+    """
+    if not query:
+        return ""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+def _numbers(query: str) -> Tuple[str, ...]:
+    return tuple(re.findall(r"\d+(?:\.\d+)?", query))
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "embedding", "numbers")
+
+    def __init__(self, value: Dict, expires_at: float, embedding: Optional[np.ndarray], numbers: Tuple[str, ...]):
+        self.value = value
+        self.expires_at = expires_at
+        self.embedding = embedding
+        self.numbers = numbers
+
+
+class Text2SQLCache:
+    """An LRU cache with TTL for Text2SQL completions.
+
+    Entries are keyed on the normalized query plus the parameters that change the prompt
+    (kind, country, limit, product name). A lookup first tries the exact key; on a miss, and
+    when an embedder is configured, it falls back to the most similar cached query in the same
+    partition whose cosine similarity reaches the threshold. Queries that mention different
+    numbers never match semantically, since "coke under 500" and "coke under 600" need
+    different SQL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl: float = 3600,
+        similarity_threshold: float = 0.92,
+        embedder: Optional[Embedder] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embedder = embedder
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._pending_embeddings: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(
+        query: Optional[str],
+        country: Optional[str],
+        limit: Optional[int],
+        kind: str = "nlq",
+        product_name: Optional[str] = None,
+    ) -> Tuple:
+        return (kind, country, limit, normalize_query(product_name), normalize_query(query))
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        if not self.embedder or not text:
+            return None
+        try:
+            vector = np.asarray(await self.embedder(text), dtype=np.float32)
+        except Exception:
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _expire(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+
+    async def get(
+        self,
+        query: Optional[str],
+        country: Optional[str],
+        limit: Optional[int],
+        kind: str = "nlq",
+        product_name: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Looks up a cached completion.
+
+        Args:
+            query: The natural language query.
+            country: The country the query runs against.
+            limit: The result limit baked into the prompt.
+            kind: The prompt family, e.g. "nlq" or "sku".
+            product_name: Optional product name baked into the prompt.
+
+        Returns:
+            Optional[Dict[str, Any]]: A copy of the cached completion, or None on a miss.
+        """
+        now = time.monotonic()
+        key = self.make_key(query, country, limit, kind, product_name)
+
+        entry = self._entries.get(key)
+        if entry and entry.expires_at > now:
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return copy.deepcopy(entry.value)
+
+        self._expire(now)
+        embedding = await self._embed(key[-1])
+        if embedding is not None:
+            self._pending_embeddings[key] = embedding
+            while len(self._pending_embeddings) > self.max_entries:
+                self._pending_embeddings.popitem(last=False)
+
+            numbers = _numbers(key[-1])
+            candidates = [
+                (candidate_key, candidate)
+                for candidate_key, candidate in self._entries.items()
+                if candidate_key[:-1] == key[:-1] and candidate.embedding is not None and candidate.numbers == numbers
+            ]
+            if candidates:
+                similarities = np.stack([candidate.embedding for _, candidate in candidates]) @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    best_key, best_entry = candidates[best]
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return copy.deepcopy(best_entry.value)
+
+        self.misses += 1
+        return None
+
+    async def set(
+        self,
+        query: Optional[str],
+        country: Optional[str],
+        limit: Optional[int],
+        value: Dict[str, Any],
+        kind: str = "nlq",
+        product_name: Optional[str] = None,
+    ) -> None:
+        """Stores a completion.
+
+        Args:
+            query: The natural language query.
+            country: The country the query runs against.
+            limit: The result limit baked into the prompt.
+            value: The completion to cache.
+            kind: The prompt family, e.g. "nlq" or "sku".
+            product_name: Optional product name baked into the prompt.
+        """
+        key = self.make_key(query, country, limit, kind, product_name)
+        embedding = self._pending_embeddings.pop(key, None)
+        if embedding is None:
+            embedding = await self._embed(key[-1])
+
+        self._entries[key] = _Entry(
+            copy.deepcopy(value), time.monotonic() + self.ttl, embedding, _numbers(key[-1])
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._pending_embeddings.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
@@ -1,11 +1,27 @@
+import asyncio
 import traceback
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Sequence, Tuple
 
 from fastapi import HTTPException
 from pandas import DataFrame
 import requests
 from db.chromadb_store import ProductCatalog
-from routers.nlq.helpers import azure_vision_service, detect_text, execute_bigquery, extract_code, generate_gtin_sql, generate_product_name_sql, parse_nlq_search_query, parse_sku_search_query, parse_whatsapp_sku_search_query, regular_chat, request_image_inference, summarize_results
+from routers.nlq.async_helpers import (
+    azure_vision_service,
+    create_conversation,
+    detect_text,
+    execute_bigquery,
+    fetch_dataframe,
+    fetch_rows,
+    get_conversation,
+    parse_whatsapp_sku_clause,
+    recognize_image,
+    regular_chat,
+    save_message,
+    summarize_results,
+)
+from routers.nlq.projection import PRODUCT_RESPONSE_COLUMNS, SKU_MAPPING_COLUMNS
+from routers.nlq.query_builder import external_mapping_query, gtin_query
 from routers.nlq.schemas import MarketplaceProductNigeria
 from routers.whatsapp.schema import FlowEndpointException, WhatsappFlowChipSelector, WhatsappNLQRequest
 from routers.whatsapp.constants import country_currency_code
@@ -23,13 +39,19 @@ from rich.console import Console
 import logging
 from typing import Optional
 from routers.nlq.schemas import MarketplaceProductNigeria, NLQRequest
-from db.helpers import create_conversation, get_conversation, save_message
 from routers.whatsapp.schema import WhatsappDataExchange, WhatsappFlowChipSelector, WhatsappNLQResponse, WhatsappPayload, WhatsappProductImage, WhatsappResponse
+from settings import get_settings
 console = Console()
+settings = get_settings()
 logger = logging.getLogger("test-logger")
 logger.setLevel(logging.DEBUG)
 embedded_product_client = ProductCatalog()
 
+# The product columns the WhatsApp summary reads
+SUMMARY_COLUMNS = ['Product Name', 'Product Price', 'Seller Name', 'Manufacturer', 'Brand', 'Salable Quantity']
+# The webhook only reads what format_product_message and the summary need; the Flow returns whole products
+WEBHOOK_COLUMNS = ['Country', *SUMMARY_COLUMNS]
+
 
 def currency_formatter(price: float, country: str):
     return f"{country_currency_code.get(country, 'USD')}{'{:,.0f}'.format(price)}"
@@ -210,7 +232,7 @@ def convert_to_base64(response: WhatsappResponse) -> str:
         raise HTTPException(status_code=500, detail="Failed to encode response") from e
 
 
-def handle_image_search(image_str: str | None) -> Tuple[str, str]:
+async def handle_image_search(image_str: str | None) -> Tuple[str, str]:
     """
     Handle the image search process
     """
@@ -218,10 +240,10 @@ def handle_image_search(image_str: str | None) -> Tuple[str, str]:
     search_text, gtin = "", ""
     if not image_str:
         return search_text, gtin
-    THRESHOLD = 0.5
+    THRESHOLD = settings.IMAGE_RECOGNITION_THRESHOLD
     steps: List[
         Tuple[Callable[[str], Any],
-              Callable[[Any], Tuple[str, str]]]
+              Callable[[Any], Tuple[str, str] | None]]
     ] = [
         (detect_text,
          lambda result: (
@@ -229,23 +251,21 @@ def handle_image_search(image_str: str | None) -> Tuple[str, str]:
              "")
          ),
         (azure_vision_service,
-         lambda result: result.get("label", "_").split("_") if result.get("confidence", 0) > THRESHOLD else ("", "")),
+         lambda result: tuple(result.get("label", "_").split("_", 1)) if result.get("confidence", 0) > THRESHOLD else None),
         # (request_image_inference,
         #  lambda result: (result.get("Label", ""), ""))
     ]
 
-    for index, (function, callback) in enumerate(steps):
-        try:
-            search_text, gtin = callback(function(image_str))
-            if search_text or gtin:
-                break
-        except Exception as e:
-            console.log(f"[bold red]error happened in step {index}: {e}")
+    recognized = await recognize_image(image_str, steps)
+    if recognized and any(recognized):
+        search_text, gtin = recognized
     return search_text, gtin
 
 
-def handle_whatsapp_data(data: WhatsappDataExchange) -> WhatsappResponse:
-    chat = get_conversation(data.conversation_id)
+async def handle_whatsapp_data(
+    data: WhatsappDataExchange, columns: Sequence[str] = PRODUCT_RESPONSE_COLUMNS
+) -> WhatsappResponse:
+    chat = await get_conversation(data.conversation_id)
     natural_query = data.query.strip()
     response = WhatsappNLQResponse(query=natural_query, next_screen=data.next_screen)
     product_image = data.product_image
@@ -253,73 +273,75 @@ def handle_whatsapp_data(data: WhatsappDataExchange) -> WhatsappResponse:
         if product_image:
             product_image = product_image[0]
             if isinstance(product_image, WhatsappProductImage):
-                product_image = process_whatsapp_image_data(product_image)
+                product_image = await asyncio.to_thread(process_whatsapp_image_data, product_image)
 
     if not (natural_query or product_image):
         response.message = "No query or image submitted."
         return WhatsappResponse(data=response, status="error")
-    product_name, gtin = handle_image_search(product_image)
+    product_name, gtin = await handle_image_search(product_image)
     print(product_name, gtin, 'product_name, gtin')
     limit = data.limit or 10
     try:
-        # GET SKU
-        skus: Dict[str, str | List[str]] = {}
-        if gtin:
-            sql_query = generate_gtin_sql(gtin, data.country, limit)
-            nlq_query_job = execute_bigquery(sql_query)
-            if nlq_query_job:
-                try:
-                    result_rows = nlq_query_job.result()
-                    sku_rows = [dict(row) for row in result_rows]
-                    for row in sku_rows:
-                        skus[row["Mapping"]] = row["SKU_STRING"].split(",")
-                except Exception as e:
-                    console.log(f"[bold red]Error getting sku rows: {e}")
-        search_text = product_name or natural_query
-        if search_text and not skus:
-            product_embeddings = embedded_product_client.perform_cosine_search([search_text], data.country, limit)
-            for product_embedding in product_embeddings:
-                for product in product_embedding:
-                    skus[product.id] = product.sku
+        async def lookup_skus() -> Dict[str, str | List[str]]:
+            # GET SKU
+            skus: Dict[str, str | List[str]] = {}
+            if gtin:
+                mapping_query = gtin_query(gtin, data.country, limit)
+                nlq_query_job = await execute_bigquery(mapping_query.sql, mapping_query.parameters, SKU_MAPPING_COLUMNS)
+                if nlq_query_job:
+                    try:
+                        sku_rows = await fetch_rows(nlq_query_job)
+                        for row in sku_rows:
+                            skus[row["Mapping"]] = row["SKU_STRING"].split(",")
+                    except Exception as e:
+                        console.log(f"[bold red]Error getting sku rows: {e}")
+            search_text = product_name or natural_query
+            if search_text and not skus:
+                product_embeddings = await asyncio.to_thread(
+                    embedded_product_client.perform_cosine_search, [search_text], data.country, limit
+                )
+                for product_embedding in product_embeddings:
+                    for product in product_embedding:
+                        skus[product.id] = product.sku
+            return skus
+
+        # The clause does not depend on the SKUs, so the lookup and the LLM call run together.
+        skus, sku_sql_queries = await asyncio.gather(
+            lookup_skus(),
+            parse_whatsapp_sku_clause(natural_query, product_name, data.country),
+        )
 
         if not skus:
             response.message = "No SKU found for your product/query in our catalog"
             return WhatsappResponse(data=response, status="error")
-        sku_sql_queries = parse_whatsapp_sku_search_query(
-            natural_query,
-            product_name,
-            limit,
-            skus,
-            data.country
-        )
         # print(sku_sql_queries, 'sku_sql_queries')
         if not sku_sql_queries:
             response.message = "Sorry, we did not understand your search request. Please refine your search input and try again"
             return WhatsappResponse(data=response, status="error")
-        sku_sql_in = sku_sql_queries.get("sql", '')
-        sku_sql_where = sku_sql_queries.get("sql_query", '')
-        sku_sql_query = f"{sku_sql_in}  {sku_sql_where.replace('WHERE', '')}"
+        # The clause goes inside the WHERE of the mapping query, ahead of its ORDER BY
+        sku_sql_query, sku_query_parameters = external_mapping_query(
+            skus, data.country, sku_sql_queries.get("sql_query", '')
+        )
         sku_suggested_queries: List[str] = sku_sql_queries.get("suggested_queries", [])
         response.sql_query = sku_sql_query
         response.suggested_queries = format_flow_chip_selector_from_list(sku_suggested_queries)
         try:
-            sku_sql_query_job = execute_bigquery(sku_sql_query)
+            sku_sql_query_job = await execute_bigquery(sku_sql_query, sku_query_parameters, columns)
             if not sku_sql_query_job:
                 response.message = "Sorry, we could not access the data you requested. Please try again later."
                 return WhatsappResponse(data=response, status="error")
-            dataframe: DataFrame = sku_sql_query_job.to_dataframe()
+            dataframe: DataFrame = await fetch_dataframe(sku_sql_query_job)
+            results = await fetch_rows(sku_sql_query_job)
 
         except Exception as e:
             console.log(f"[bold red]Error getting sku rows: {e}")
             return WhatsappResponse(data=response, status="error")
-        results = list(dataframe.T.to_dict().values())
         response.results = [MarketplaceProductNigeria(**product) for product in results]
         try:
             if dataframe.empty:
-                summary = regular_chat(natural_query, conversations=chat)
+                summary = await regular_chat(natural_query, conversations=chat)
             else:
-                summary = summarize_results(dataframe[['Product Name', 'Product Price', 'Seller Name',
-                                            'Manufacturer', 'Brand', 'Salable Quantity']], natural_query)
+                summary = await summarize_results(dataframe[SUMMARY_COLUMNS], natural_query, country=data.country)
         except:
             summary = None
         if not summary:
@@ -334,9 +356,9 @@ def handle_whatsapp_data(data: WhatsappDataExchange) -> WhatsappResponse:
 
             if chat:
                 chat_id = chat[0].chat_id
-                save_message(chat[0].chat_id, user_content, ai_content)
+                await save_message(chat[0].chat_id, user_content, ai_content)
             else:
-                saved = create_conversation(user_content, ai_content)
+                saved = await create_conversation(user_content, ai_content)
                 chat_id = saved.chat_id
 
             response.result_analysis = result_analysis
@@ -1,10 +1,12 @@
 
+import asyncio
 from typing import Dict, List
 from fastapi import APIRouter, Request, Response
 from external_services.whatsapp import WhatsappService
 from dotenv import load_dotenv
 from os import environ
-from routers.whatsapp.helpers import format_product_message, handle_whatsapp_data
+from routers.nlq.scheduler import QueryPriority, set_query_priority
+from routers.whatsapp.helpers import WEBHOOK_COLUMNS, format_product_message, handle_whatsapp_data
 from routers.whatsapp.schema import (
     MarketplaceProductNigeria,
     WhatsappDataExchange,
@@ -34,6 +36,7 @@ whatsapp_service = WhatsappService(
 
 @router.post("/webhook")
 async def whatsapp_webhook(request: Request):
+    set_query_priority(QueryPriority.WEBHOOK)
     LIMIT = 1
     base64_image = None
     text = ""
@@ -54,12 +57,13 @@ async def whatsapp_webhook(request: Request):
 
     match message.type:
         case "image":
-            base64_image, text = whatsapp_service.handle_image_message(message)
+            base64_image, text = await asyncio.to_thread(whatsapp_service.handle_image_message, message)
 
         case "text":
             keywords = ["help", "hello"]
             if any(keyword in message.text.body.lower() for keyword in keywords):
-                whatsapp_service.send_message(
+                await asyncio.to_thread(
+                    whatsapp_service.send_message,
                     business_phone_number_id=phone_number_id,
                     to=message.sender,
                     is_template=True,
@@ -73,7 +77,9 @@ async def whatsapp_webhook(request: Request):
             pass
 
     # Mark message as read
-    whatsapp_service.mark_message_as_read(business_phone_number_id=phone_number_id, message_id=message.id)
+    await asyncio.to_thread(
+        whatsapp_service.mark_message_as_read, business_phone_number_id=phone_number_id, message_id=message.id
+    )
     if not is_keyword_found:
         input_data = WhatsappDataExchange(
             query=text,
@@ -82,7 +88,7 @@ async def whatsapp_webhook(request: Request):
             product_image=[base64_image] if base64_image else None
         )
         try:
-            response = handle_whatsapp_data(input_data)
+            response = await handle_whatsapp_data(input_data, WEBHOOK_COLUMNS)
         except Exception as e:
             print(e, 'error')
             return Response(status_code=400, content="Error in processing: %s" % e)
@@ -93,14 +99,16 @@ async def whatsapp_webhook(request: Request):
             grouped_results[result.external_id].append(result)
         print(grouped_results.keys(), 'grouped_results')
         for result_id, results in grouped_results.items():
-            whatsapp_service.send_text_message(
+            await asyncio.to_thread(
+                whatsapp_service.send_text_message,
                 business_phone_number_id=phone_number_id,
                 to=message.sender,
                 message=format_product_message(result_id, results),
                 message_id=message.id)
 
         # Send result analysis
-        whatsapp_service.send_text_message(
+        await asyncio.to_thread(
+            whatsapp_service.send_text_message,
             business_phone_number_id=phone_number_id,
             to=message.sender,
             message=response.data.result_analysis or response.data.message,
@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import Optional
+from typing import Dict, Optional
 
 from pydantic_settings import BaseSettings
 
@@ -23,6 +23,56 @@ class Settings(BaseSettings):
     debug: bool = False
     APP_ENV: str = "prod"
     LOG_ENABLED_VALUE: Optional[str] = None
+    CONVERSATION_DB_POOL_SIZE: int = 5
+    CONVERSATION_DB_MAX_OVERFLOW: int = 5
+    CONVERSATION_DB_POOL_TIMEOUT: float = 10
+    IMAGE_RECOGNITION_MODE: str = "concurrent"
+    IMAGE_RECOGNITION_TIMEOUT: float = 30.0
+    IMAGE_RECOGNITION_THRESHOLD: float = 0.5
+    TEXT2SQL_CACHE_ENABLED: bool = True
+    TEXT2SQL_CACHE_MAX_ENTRIES: int = 2048
+    TEXT2SQL_CACHE_TTL: float = 3600
+    TEXT2SQL_CACHE_SEMANTIC: bool = True
+    TEXT2SQL_CACHE_SIMILARITY: float = 0.92
+    BIGQUERY_CACHE_ENABLED: bool = True
+    BIGQUERY_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    BIGQUERY_CACHE_DEFAULT_TTL: float = 60
+    BIGQUERY_CACHE_TABLE_TTLS: Dict[str, float] = {
+        "market_place_product_nigeria_mapping_table": 6 * 3600,
+        "marketplace_product_except_nigeria_sku_aggregate_2": 6 * 3600,
+        "marketplace_product_nigeria": 300,
+        "marketplace_product_except_nigeria": 300,
+        "marketplace_product_except_nigeria_sku_aggregate": 300,
+    }
+    SUMMARY_TOKEN_BUDGET: int = 1500
+    PRODUCT_INDEX_ENABLED: bool = True
+    PRODUCT_INDEX_REFRESH_INTERVAL: float = 3600
+    REPLICA_ENABLED: bool = True
+    REPLICA_DIRECTORY: str = "replica"
+    REPLICA_REFRESH_INTERVAL: float = 900
+    REPLICA_MAX_AGE: float = 3600
+    BIGQUERY_COST_GUARD_ENABLED: bool = True
+    BIGQUERY_MAX_BYTES_PER_REQUEST: int = 2 * 1024 * 1024 * 1024
+    BIGQUERY_SLOW_QUERY_SECONDS: float = 2.0
+    PROJECTION_PUSHDOWN_ENABLED: bool = True
+    BULK_GTIN_MAX_ITEMS: int = 1000
+    BIGQUERY_MAX_CONCURRENT_JOBS: int = 10
+    BIGQUERY_QUEUE_DEADLINES: Dict[str, float] = {
+        "flow": 8,
+        "webhook": 20,
+        "web": 30,
+        "categories": 30,
+    }
+    CATEGORY_MAX_PAGE_SIZE: int = 500
+    CATEGORY_STREAM_CHUNK_SIZE: int = 100
+    SINGLE_FLIGHT_ENABLED: bool = True
+    INTENT_ROUTER_ENABLED: bool = True
+    INTENT_MIN_CONFIDENCE: float = 0.8
+    QUERY_FAST_PATH_ENABLED: bool = True
+    QUERY_PLAN_ENABLED: bool = True
+    SUMMARY_MODE: str = "llm"
+    SUMMARY_LLM_MIN_PRODUCTS: int = 25
+    SUMMARY_STORE_MAX_ENTRIES: int = 1024
 
     @property
     def log_enabled(self):
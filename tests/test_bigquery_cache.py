@@ -0,0 +1,84 @@
+import pyarrow as pa
+from google.cloud.bigquery import ScalarQueryParameter
+
+from routers.nlq.bigquery_cache import BigQueryResultCache, CachedQueryJob
+
+MOCK_ROWS = [{"SKU": "BNE-021", "Product Price": 500.0}, {"SKU": "DTS-058", "Product Price": 750.0}]
+
+
+def make_job(rows=MOCK_ROWS):
+    return CachedQueryJob(pa.Table.from_pylist(rows))
+
+
+def test_equivalent_queries_share_a_key():
+    """
+    Test that formatting and predicate order do not change the cache key, but parameters do.
+    """
+    key = BigQueryResultCache.make_key("SELECT *\n   FROM t WHERE b = 2 AND a = 1  LIMIT 10;")
+    assert key == BigQueryResultCache.make_key("select * from `t` where (a=1) and b=2 limit 10")
+    limit = ScalarQueryParameter("limit", "INT64", 10)
+    assert key != BigQueryResultCache.make_key("SELECT * FROM t WHERE b = 2 AND a = 1 LIMIT @limit", [limit])
+
+
+def test_cached_job_behaves_like_query_job():
+    """
+    Test that callers can keep using result() and to_dataframe().
+    """
+    job = make_job()
+    assert [dict(row) for row in job.result()] == MOCK_ROWS
+    assert job.to_dataframe()["SKU"].tolist() == ["BNE-021", "DTS-058"]
+    assert job.to_dataframe().to_dict(orient="records") == MOCK_ROWS
+    job.result()[0]["SKU"] = "mutated"
+    assert job.result()[0]["SKU"] == "BNE-021"
+    dataframe = job.to_dataframe()
+    dataframe["SKU"] = "replaced"
+    assert job.to_dataframe()["SKU"].tolist() == ["BNE-021", "DTS-058"]
+
+
+def test_repeated_strings_are_categorical():
+    """
+    Test that repeated string columns are dictionary encoded and the rest stay Arrow-backed.
+    """
+    job = CachedQueryJob(pa.Table.from_pylist([{"Country": "Nigeria", "SKU": "BNE-021", "Product Price": None}]))
+    dataframe = job.to_dataframe()
+    assert str(dataframe["Country"].dtype) == "category"
+    assert str(dataframe["Product Price"].dtype).endswith("[pyarrow]")
+    assert job.result() == [{"Country": "Nigeria", "SKU": "BNE-021", "Product Price": None}]
+
+
+def test_hit_miss_and_per_table_ttl():
+    """
+    Test cache hits and that the shortest TTL of the referenced tables applies.
+    """
+    cache = BigQueryResultCache(
+        max_bytes=10 * 1024 * 1024,
+        default_ttl=60,
+        table_ttls={"marketplace_product_nigeria": 0, "market_place_product_nigeria_mapping_table": 3600},
+    )
+    mapping_key = cache.make_key("SELECT * FROM `market_place_product_nigeria_mapping_table` WHERE Mapping = 'x'")
+    product_key = cache.make_key("SELECT * FROM `marketplace_product_nigeria` WHERE SKU = 'x'")
+
+    assert cache.get(mapping_key) is None
+    cache.set(mapping_key, make_job())
+    cache.set(product_key, make_job())
+
+    hit = cache.get(mapping_key)
+    assert hit.cache_hit
+    assert hit.result() == MOCK_ROWS
+    assert cache.get(product_key) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_byte_budget_evicts_least_recently_used():
+    """
+    Test that entries are evicted once the byte budget is exceeded.
+    """
+    job = make_job()
+    cache = BigQueryResultCache(max_bytes=job.nbytes * 2, default_ttl=60)
+    keys = [cache.make_key(f"SELECT {i}") for i in range(3)]
+    for key in keys:
+        cache.set(key, make_job())
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) is not None
+    assert cache.stats()["bytes"] <= cache.max_bytes
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+from routers.nlq.cost_guard import MIN_BYTES_BILLED, ByteBudget, QueryCostStats, narrow_projection
+
+
+def test_byte_budget():
+    """
+    Test that the budget shrinks with billed bytes and refuses estimates beyond it.
+    """
+    budget = ByteBudget(100 * MIN_BYTES_BILLED)
+    assert budget.allows(50 * MIN_BYTES_BILLED)
+    budget.charge(60 * MIN_BYTES_BILLED)
+    budget.charge(None)
+    assert budget.remaining == 40 * MIN_BYTES_BILLED
+    assert not budget.allows(50 * MIN_BYTES_BILLED)
+
+    budget.charge(40 * MIN_BYTES_BILLED - 1)
+    assert not budget.allows(0)
+
+
+def test_narrow_projection():
+    """
+    Test that SELECT * is narrowed to the listed columns and other queries are left alone.
+    """
+    narrowed = narrow_projection(
+        "SELECT * FROM `marketplace_product_except_nigeria` WHERE `Product Price` < 500 LIMIT 10",
+        ["SKU", "Product Name"],
+    )
+    assert narrowed.startswith("SELECT `SKU`, `Product Name` FROM")
+    assert "WHERE `Product Price` < 500 LIMIT 10" in narrowed
+    assert narrow_projection("SELECT SKU FROM `marketplace_product_nigeria`") is None
+    assert narrow_projection("DELETE FROM `marketplace_product_nigeria` WHERE TRUE") is None
+
+
+def test_query_cost_stats():
+    """
+    Test that bytes, slot time and cache hits are accumulated per job.
+    """
+    cost_stats = QueryCostStats(recent=1)
+    cost_stats.record(SimpleNamespace(
+        job_id="a", total_bytes_processed=1000, total_bytes_billed=MIN_BYTES_BILLED, slot_millis=250, cache_hit=False
+    ))
+    job = cost_stats.record(SimpleNamespace(
+        job_id="b", total_bytes_processed=None, total_bytes_billed=None, slot_millis=None, cache_hit=True
+    ))
+    assert job == {
+        "job_id": "b",
+        "fingerprint": None,
+        "elapsed": 0.0,
+        "bytes_processed": 0,
+        "bytes_billed": 0,
+        "slot_millis": 0,
+        "cache_hit": True,
+    }
+
+    stats = cost_stats.stats()
+    assert stats["jobs"] == 2
+    assert stats["cache_hits"] == 1
+    assert stats["bytes_billed"] == MIN_BYTES_BILLED
+    assert stats["slot_millis"] == 250
+    assert [recent["job_id"] for recent in stats["recent_jobs"]] == ["b"]
+
+
+def test_slow_query_log():
+    """
+    Test that slow jobs are grouped by the shape of their SQL, whatever the literals.
+    """
+    cost_stats = QueryCostStats(slow_query_seconds=1.0)
+    for price, elapsed in ((500, 3.0), (750, 1.5), (900, 0.1)):
+        cost_stats.record(
+            SimpleNamespace(
+                job_id=str(price), total_bytes_processed=100, total_bytes_billed=0, slot_millis=0, cache_hit=False
+            ),
+            f"SELECT * FROM t WHERE `Product Price` < {price}",
+            elapsed,
+        )
+
+    slow_queries = cost_stats.stats()["slow_queries"]
+    assert len(slow_queries) == 1
+    slow_query = next(iter(slow_queries.values()))
+    assert slow_query["query"] == "SELECT * FROM `t` WHERE `Product Price` < ?"
+    assert slow_query["count"] == 2
+    assert slow_query["max_seconds"] == 3.0
+    assert slow_query["bytes_processed"] == 200
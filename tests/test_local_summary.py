@@ -0,0 +1,111 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pandas as pd
+
+from routers.nlq import async_helpers
+from routers.nlq.local_summary import analyze_results, render_summary
+
+RESULTS = pd.DataFrame({
+    "SKU": ["CC-050", "CC-050", "FT-050", "SP-100"],
+    "Product Name": ["Coke 50cl", "Coke 50cl", "Fanta 50cl", "Sprite 1L"],
+    "Brand": ["Coca-Cola"] * 4,
+    "Category Name": ["Fizzy Drinks"] * 4,
+    "Product Price": [300.0, 350.0, 280.5, 1200.0],
+    "Seller Name": ["Ade Stores", "Bola Mart", "Ade Stores", "Chi Depot"],
+    "Stock Status": ["In Stock", "Out of Stock", "Out of Stock", "In Stock"],
+})
+
+
+def test_results_are_summarized_locally():
+    """
+    Test that price ranges, sellers, stock and the cheapest listing are computed and rendered.
+    """
+    analytics = analyze_results(RESULTS)
+    assert (analytics.listings, analytics.products, analytics.sellers, analytics.in_stock) == (4, 3, 3, 2)
+    assert (analytics.min_price, analytics.max_price, analytics.median_price) == (280.5, 1200.0, 325.0)
+    assert analytics.cheapest == ("Fanta 50cl", 280.5, "Ade Stores")
+
+    summary = render_summary(analytics, "Nigeria")
+    assert summary["data_summary"] == (
+        "I found 3 products from 3 sellers. Prices range from NGN280.50 to NGN1,200, with a median of NGN325. "
+        "The cheapest is Fanta 50cl at NGN280.50 from Ade Stores. 2 of them are in stock. "
+        "All of them are in Fizzy Drinks."
+    )
+    assert summary["suggested_queries"] == ["cheapest fizzy drinks", "fizzy drinks in stock", "fizzy drinks under 330"]
+
+
+def test_summaries_follow_the_country_and_the_columns():
+    """
+    Test that summaries use the country's language and currency and skip the columns a result lacks.
+    """
+    summary = render_summary(analyze_results(RESULTS), "Brazil")
+    assert summary["data_summary"].startswith("Encontrei 3 produtos de 3 vendedores. Os preços vão de BRL280,50 a")
+    assert summary["suggested_queries"][0] == "fizzy drinks mais barato"
+
+    whatsapp_columns = RESULTS[["Product Name", "Product Price", "Seller Name", "Brand"]].iloc[:1]
+    summary = render_summary(analyze_results(whatsapp_columns), "Kenya")
+    assert summary == {
+        "data_summary": "I found 1 product from 1 seller. It costs KES300.",
+        "suggested_queries": ["cheapest coca-cola", "coca-cola in stock", "coca-cola under 300"],
+    }
+    assert render_summary(analyze_results(RESULTS.iloc[:0]), "Mexico")["suggested_queries"] == []
+
+
+def test_summary_modes():
+    """
+    Test that the summary mode decides when the model is called and that async mode stores its rewrite later.
+    """
+    completion = AsyncMock(return_value={"data_summary": "Polished", "suggested_queries": ["cheap coke"]})
+
+    async def run():
+        with patch.object(async_helpers, "_chat_completion", new=completion), \
+                patch.object(async_helpers, "update_message", new=AsyncMock()) as mock_update, \
+                patch.object(async_helpers.summary_store, "saver", new=AsyncMock()), \
+                patch.object(async_helpers.settings, "SUMMARY_LLM_MIN_PRODUCTS", 3):
+            with patch.object(async_helpers.settings, "SUMMARY_MODE", "threshold"):
+                assert (await async_helpers.summarize_results(RESULTS, "coke"))["data_summary"] == "Polished"
+                summary = await async_helpers.summarize_results(RESULTS.iloc[:2], "coke")
+                assert summary["data_summary"] == (
+                    "I found 1 product from 2 sellers. Prices range from NGN300 to NGN350, with a median of NGN325. "
+                    "It is in stock. It is in Fizzy Drinks."
+                )
+                assert await async_helpers.schedule_summary_polish(summary, "c1", "m1") is None
+            assert completion.await_count == 1
+
+            with patch.object(async_helpers.settings, "SUMMARY_MODE", "async"):
+                summary = await async_helpers.summarize_results(RESULTS, "coke", country="Nigeria")
+                assert summary["data_summary"].startswith("I found 3 products")
+                assert completion.await_count == 1
+                summary_id = await async_helpers.schedule_summary_polish(summary, "c1", "m1")
+                assert (await async_helpers.summary_store.get(summary_id))["status"] == "pending"
+                await asyncio.gather(*async_helpers.polish_tasks)
+            assert completion.await_count == 2
+            mock_update.assert_awaited_once_with("m1", "Polished")
+            assert await async_helpers.summary_store.get(summary_id) == {
+                "status": "ready",
+                "result_analysis": "Polished",
+                "analytics_queries": ["cheap coke"],
+                "conversation_id": "c1",
+            }
+
+    asyncio.run(run())
+
+
+def test_failed_polish_keeps_the_local_summary():
+    """
+    Test that a failed rewrite leaves the saved message alone and completes its poll with the local summary.
+    """
+    async def run():
+        with patch.object(async_helpers, "_chat_completion", new=AsyncMock(side_effect=TimeoutError)), \
+                patch.object(async_helpers, "update_message", new=AsyncMock()) as mock_update, \
+                patch.object(async_helpers.summary_store, "saver", new=AsyncMock()), \
+                patch.object(async_helpers.settings, "SUMMARY_MODE", "async"):
+            summary = await async_helpers.summarize_results(RESULTS.iloc[:1], "coke")
+            summary_id = await async_helpers.schedule_summary_polish(summary, "c1", "m1")
+            await asyncio.gather(*async_helpers.polish_tasks)
+            mock_update.assert_not_awaited()
+            polled = await async_helpers.summary_store.get(summary_id)
+            assert polled["result_analysis"] == summary["data_summary"]
+
+    asyncio.run(run())
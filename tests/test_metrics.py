@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+from routers.nlq.metrics import CompletionUsageStats, collect_stats, register_stats
+
+
+def make_usage(prompt_tokens, cached_tokens, completion_tokens=10):
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+    )
+
+
+def test_completion_usage_stats():
+    """
+    Test that cached prompt tokens are accumulated per prompt.
+    """
+    usage_stats = CompletionUsageStats()
+    assert usage_stats.record("nlq", make_usage(4000, 0)) == 0
+    assert usage_stats.record("nlq", make_usage(4000, 3840)) == 3840
+    assert usage_stats.record("chat", None) == 0
+
+    stats = usage_stats.stats()
+    assert stats["nlq"]["completions"] == 2
+    assert stats["nlq"]["cached_tokens"] == 3840
+    assert stats["nlq"]["cached_ratio"] == 0.48
+    assert "chat" not in stats
+
+
+def test_usage_without_prompt_details():
+    """
+    Test that usage objects without prompt_tokens_details count as uncached.
+    """
+    usage_stats = CompletionUsageStats()
+    usage = SimpleNamespace(prompt_tokens=100, completion_tokens=5, prompt_tokens_details=None)
+    assert usage_stats.record("sku", usage) == 0
+    assert usage_stats.stats()["sku"]["prompt_tokens"] == 100
+
+
+def test_collect_stats():
+    """
+    Test that registered providers are reported under their names.
+    """
+    register_stats("test_component", lambda: {"hits": 1})
+    assert collect_stats()["test_component"] == {"hits": 1}
@@ -1,10 +1,16 @@
-from unittest.mock import MagicMock, patch
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import pyarrow as pa
 import pytest
 from dotenv import load_dotenv
 from fastapi.testclient import TestClient
 
 from app import app
+from routers.nlq.async_helpers import category_page_label, query_shape_parser, summary_store
+from routers.nlq.bigquery_cache import CachedQueryJob
+from routers.nlq.intent import Intent
+from routers.nlq.pagination import PageCursor, Snapshot, decode_cursor, encode_cursor
 from tests.constants import image_to_base64
 
 load_dotenv()
@@ -26,10 +32,8 @@ MOCK_QUERIES = [
 # Fixtures for mock objects
 @pytest.fixture
 def mock_bigquery_client():
-    with patch("routers.nlq.nlq_router.bigquery.Client") as mock:
-        mock_instance = MagicMock()
-        mock.return_value = mock_instance
-        yield mock_instance
+    with patch("routers.nlq.pipeline.execute_bigquery", new=AsyncMock(return_value=None)) as mock:
+        yield mock
 
 
 @pytest.fixture
@@ -39,23 +43,24 @@ def mock_helpers():
     ) as mock_process:
         with patch(
             "routers.nlq.nlq_router.detect_text",
-            return_value={"responses": [{"fullTextAnnotation": {"text": "coca cola"}}]},
-        ):
+            new=AsyncMock(return_value={"responses": [{"fullTextAnnotation": {"text": "coca cola"}}]}),
+        ) as mock_detect_text:
             with patch(
-                "routers.nlq.nlq_router.request_image_inference",
-                return_value={"label": "coca cola"},
-            ):
+                "routers.nlq.nlq_router.azure_vision_service",
+                new=AsyncMock(return_value={"label": "coca cola"}),
+            ) as mock_inference:
                 with patch(
-                    "routers.nlq.nlq_router.parse_nlq_search_query",
-                    return_value={
+                    "routers.nlq.pipeline.plan_query",
+                    new=AsyncMock(return_value={
                         "sql_query": MOCK_BIQQUERY,
                         "suggested_queries": MOCK_QUERIES,
-                    },
-                ):
+                    }),
+                ), patch("routers.nlq.pipeline.search_product_index", return_value=[]), \
+                        patch("routers.nlq.pipeline.parse_sku_clause", new=AsyncMock(return_value=None)):
                     yield {
                         "mock_process_product_image": mock_process,
-                        "mock_detect_text": mock_process,
-                        "mock_request_inference": mock_process,
+                        "mock_detect_text": mock_detect_text,
+                        "mock_request_inference": mock_inference,
                     }
 
 
@@ -74,7 +79,7 @@ def test_nlq_success_with_query(mock_bigquery_client, mock_helpers, valid_reques
     """
     Test the endpoint with a valid natural language query.
     """
-    response = client.post("/api/nlq", json=valid_request_body)
+    response = client.post("/api/web", json=valid_request_body)
     assert response.status_code == 200
     json_response = response.json()
     assert "query" in json_response
@@ -87,7 +92,7 @@ def test_nlq_success_with_image(mock_bigquery_client, mock_helpers):
     Test the endpoint with a valid product image.
     """
     response = client.post(
-        "/api/nlq",
+        "/api/web",
         json={"query": None, "product_image": BASE_64_IMG},
     )
     assert response.status_code == 200
@@ -101,7 +106,7 @@ def test_nlq_empty_request():
     """
     Test the endpoint with an empty request body.
     """
-    response = client.post("/api/nlq", json={})
+    response = client.post("/api/web", json={})
     assert response.status_code == 400
     assert response.json()["detail"] == "No image or query submitted."
 
@@ -110,7 +115,7 @@ def test_nlq_invalid_limit():
     """
     Test the endpoint with an invalid limit parameter.
     """
-    response = client.post("/api/nlq?limit=-1", json={"query": "Test"})
+    response = client.post("/api/web?limit=-1", json={"query": "Test"})
     assert response.status_code == 400
     assert response.json()["detail"] == "Limit must be greater than zero."
 
@@ -119,51 +124,430 @@ def test_nlq_invalid_limit():
 #     """
 #     Test the endpoint when BigQuery encounters an error.
 #     """
-#     mock_bigquery_client.query.side_effect = Exception("BigQuery error")
-#     response = client.post("/api/nlq", json={"query": "Test"})
+#     mock_bigquery_client.side_effect = Exception("BigQuery error")
+#     response = client.post("/api/web", json={"query": "Test"})
 #     assert response.status_code == 500
 #     assert "BigQuery error" in response.json()["detail"]
 
 
-def test_nlq_image_inference_failure(mock_helpers):
+def test_nlq_image_inference_failure(mock_bigquery_client, mock_helpers):
     """
     Test the endpoint when image inference fails.
     """
     with patch(
-        "routers.nlq.nlq_router.request_image_inference",
-        side_effect=Exception("Inference failed"),
+        "routers.nlq.nlq_router.azure_vision_service",
+        new=AsyncMock(side_effect=Exception("Inference failed")),
     ):
-        response = client.post("/api/nlq", json={"product_image": "BASE_64_IMG"})
+        response = client.post("/api/web", json={"product_image": "BASE_64_IMG"})
         assert response.status_code == 200
         assert "query" in response.json()
         assert "results" in response.json()
+    mock_helpers["mock_detect_text"].assert_awaited_once()
 
 
-def test_nlq_query_parsing_failure(mock_helpers):
+def test_nlq_query_parsing_failure(mock_bigquery_client, mock_helpers):
     """
     Test the endpoint when query parsing fails.
     """
-    with patch("routers.nlq.nlq_router.parse_nlq_search_query", return_value=None):
+    chat = {"data_summary": "What are you looking for?", "suggested_queries": [], "user_message": {"content": "q"}}
+    with patch("routers.nlq.pipeline.plan_query", new=AsyncMock(return_value=None)), \
+            patch("routers.nlq.nlq_router.regular_chat", new=AsyncMock(return_value=chat)), \
+            patch("routers.nlq.nlq_router.create_conversation", new=AsyncMock(return_value=MagicMock(chat_id="c1"))):
         response = client.post(
-            "/api/nlq", json={"query": "products cheaper than 10 bucks"}
+            "/api/web", json={"query": "products cheaper than 10 bucks"}
         )
         assert response.status_code == 200
         assert "success" == response.json()["message"]
+    mock_bigquery_client.assert_not_awaited()
 
 
-def test_nlq_detect_text_called(mock_helpers):
+def test_nlq_detect_text_called(mock_bigquery_client, mock_helpers):
     """
     Test that detect_text is called when processing an image.
     """
-    response = client.post("/api/nlq", json={"product_image": BASE_64_IMG})
+    response = client.post("/api/web", json={"product_image": BASE_64_IMG})
     assert response.status_code == 200
-    mock_helpers["mock_detect_text"].assert_called_once()
+    mock_helpers["mock_detect_text"].assert_awaited_once()
 
 
-def test_nlq_process_product_image_called(mock_helpers):
+def test_nlq_process_product_image_called(mock_bigquery_client, mock_helpers):
     """
     Test that process_product_image is called when an image is provided.
     """
-    response = client.post("/api/nlq", json={"product_image": BASE_64_IMG})
+    response = client.post("/api/web", json={"product_image": BASE_64_IMG})
     assert response.status_code == 200
     mock_helpers["mock_process_product_image"].assert_called_once()
+
+
+def test_bulk_gtins_empty_request():
+    """
+    Test the bulk GTIN endpoint without any GTINs.
+    """
+    response = client.post("/api/gtins", json={"gtins": [" ", "''"]})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "No GTINs submitted."
+
+
+def test_bulk_gtins_grouped_results():
+    """
+    Test that labels and GTINs are resolved in one query and grouped by GTIN.
+    """
+    rows = pa.Table.from_pylist([
+        {"Mapping": "'5449000000996", "SKU": "CC-050", "Product Price": 300.0},
+        {"Mapping": "'5449000000996", "SKU": "CC-051", "Product Price": 310.0},
+    ])
+    with patch(
+        "routers.nlq.nlq_router.execute_bigquery", new=AsyncMock(return_value=CachedQueryJob(rows))
+    ) as mock_execute:
+        response = client.post(
+            "/api/gtins", json={"gtins": ["Coke_5449000000996", "5449000000996", "6001240100011"]}
+        )
+    assert response.status_code == 200
+    mock_execute.assert_awaited_once()
+    json_response = response.json()
+    assert [group["gtin"] for group in json_response["results"]] == ["5449000000996"]
+    assert [product["sku"] for product in json_response["results"][0]["results"]] == ["CC-050", "CC-051"]
+    assert json_response["not_found"] == ["6001240100011"]
+
+
+class FakeRows:
+    def __init__(self, *pages):
+        self.pages = iter(pages)
+
+
+def test_paginated_categories():
+    """
+    Test that the first page runs the category query once and later pages read its snapshot.
+    """
+    snapshot = Snapshot("job_1", "US", "project._anon.results", 3)
+    first_page = FakeRows([{"Product ID": 1, "SKU": "CK-1"}, {"Product ID": 2, "SKU": "CK-2"}])
+    with patch("routers.nlq.async_helpers.helpers.run_query_snapshot", return_value=snapshot) as mock_run, \
+            patch("routers.nlq.async_helpers.helpers.snapshot_rows", return_value=first_page) as mock_rows:
+        response = client.post("/api/categories?page_size=2", json={"category": "Cookies"})
+    assert response.status_code == 200
+    assert [product["sku"] for product in response.json()["results"]] == ["CK-1", "CK-2"]
+    mock_run.assert_called_once()
+    mock_rows.assert_called_once_with(snapshot, 0, 2)
+    cursor = response.json()["next_cursor"]
+    assert decode_cursor(cursor) == PageCursor(category_page_label("Cookies", "Nigeria"), "job_1", "US", 2, 2)
+
+    with patch("routers.nlq.async_helpers.helpers.find_snapshot", return_value=snapshot) as mock_find, \
+            patch("routers.nlq.async_helpers.helpers.run_query_snapshot") as mock_run, \
+            patch("routers.nlq.async_helpers.helpers.snapshot_rows", return_value=FakeRows([
+                {"Product ID": 3, "SKU": "CK-3"}
+            ])) as mock_rows:
+        response = client.post(f"/api/categories?page_size=2&cursor={cursor}", json={"category": "Cookies"})
+    assert response.status_code == 200
+    assert [product["sku"] for product in response.json()["results"]] == ["CK-3"]
+    assert response.json()["next_cursor"] is None
+    assert mock_find.call_args.args[:2] == ("job_1", "US")
+    mock_run.assert_not_called()
+    mock_rows.assert_called_once_with(snapshot, 2, 2)
+
+
+def test_paginated_categories_resume_after_the_snapshot_expired():
+    """
+    Test that an expired snapshot is replaced by a new query starting after the last Product ID served.
+    """
+    cursor = encode_cursor(PageCursor(category_page_label("Cookies", "Nigeria"), "job_1", "US", 2, 2))
+    snapshot = Snapshot("job_2", "US", "project._anon.rest", 1)
+    with patch("routers.nlq.async_helpers.helpers.find_snapshot", return_value=None), \
+            patch("routers.nlq.async_helpers.helpers.run_query_snapshot", return_value=snapshot) as mock_run, \
+            patch("routers.nlq.async_helpers.helpers.snapshot_rows", return_value=FakeRows([
+                {"Product ID": 3, "SKU": "CK-3"}
+            ])) as mock_rows:
+        response = client.post(f"/api/categories/stream?page_size=2&cursor={cursor}", json={"category": "Cookies"})
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["event"] for event in events] == ["results", "page"]
+    assert events[0]["data"]["results"][0]["sku"] == "CK-3"
+    assert events[1]["data"]["next_cursor"] is None
+    query_parameters = {parameter.name: parameter.value for parameter in mock_run.call_args.args[1]}
+    assert query_parameters == {"category": "cookies", "after": 2}
+    mock_rows.assert_called_once_with(snapshot, 0, 2)
+
+
+def test_paginated_categories_invalid_cursor():
+    """
+    Test that invalid cursors and page sizes are rejected.
+    """
+    response = client.post("/api/categories?cursor=garbage", json={"category": "Cookies"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor."
+
+    response = client.post("/api/categories/stream?page_size=0", json={"category": "Cookies"})
+    assert response.status_code == 400
+
+
+def test_paginated_categories_reject_cursors_of_other_categories():
+    """
+    Test that a cursor is rejected for another category or country instead of resuming from its Product ID.
+    """
+    cursor = encode_cursor(PageCursor(category_page_label("Cookies", "Nigeria"), "job_1", "US", 2, 2))
+    with patch("routers.nlq.async_helpers.helpers.find_snapshot") as mock_find, \
+            patch("routers.nlq.async_helpers.helpers.run_query_snapshot") as mock_run:
+        for path, body in (
+            ("/api/categories", {"category": "Bar Soap"}),
+            ("/api/categories/stream", {"category": "Bar Soap"}),
+            ("/api/categories", {"category": "Cookies", "country": "Ghana"}),
+        ):
+            response = client.post(f"{path}?page_size=2&cursor={cursor}", json=body)
+            assert response.status_code == 400
+            assert response.json()["detail"] == "Cursor does not match this category."
+    mock_find.assert_not_called()
+    mock_run.assert_not_called()
+
+
+def test_categories_keeps_its_own_errors():
+    """
+    Test that the unpaginated category endpoint returns its own errors unchanged.
+    """
+    with patch("routers.nlq.nlq_router.execute_bigquery", new=AsyncMock(return_value=None)):
+        response = client.post("/api/categories", json={"category": "Cookies"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Sorry, we could not access the data you requested. Please try again later."
+
+
+def test_chit_chat_skips_text2sql():
+    """
+    Test that chit-chat is answered with one chat call and no query plan.
+    """
+    chat = {"data_summary": "Hello! Looking for something?", "suggested_queries": [], "user_message": {"content": "hi"}}
+    with patch("routers.nlq.pipeline.plan_query", new=AsyncMock()) as mock_plan, \
+            patch("routers.nlq.nlq_router.regular_chat", new=AsyncMock(return_value=chat)) as mock_chat, \
+            patch("routers.nlq.nlq_router.create_conversation", new=AsyncMock(return_value=MagicMock(chat_id="c1"))):
+        response = client.post("/api/web", json={"query": "Hi, how are you?"})
+    assert response.status_code == 200
+    assert response.json()["result_analysis"] == "Hello! Looking for something?"
+    mock_plan.assert_not_awaited()
+    mock_chat.assert_awaited_once()
+
+
+def test_malicious_queries_get_no_llm_call():
+    """
+    Test that malicious queries are answered without any LLM call.
+    """
+    with patch("routers.nlq.pipeline.plan_query", new=AsyncMock()) as mock_plan, \
+            patch("routers.nlq.nlq_router.regular_chat", new=AsyncMock()) as mock_chat:
+        response = client.post("/api/web", json={"query": "'; DROP TABLE users; --"})
+    assert response.status_code == 200
+    assert response.json()["results"] == []
+    assert response.json()["suggested_queries"]
+    mock_plan.assert_not_awaited()
+    mock_chat.assert_not_awaited()
+
+
+@pytest.mark.parametrize("query", ["hello, do you sell indomie?", "good morning, can you help me find indomie"])
+def test_greetings_with_a_search_are_planned(query):
+    """
+    Test that a greeting around a catalog search goes to the query plan rather than to chat.
+    """
+    chat = {"data_summary": "Hello!", "suggested_queries": [], "user_message": {"content": query}}
+    with patch.object(query_shape_parser, "has_word", new=lambda word: word == "indomie"), \
+            patch("routers.nlq.pipeline.plan_query", new=AsyncMock(return_value=None)) as mock_plan, \
+            patch("routers.nlq.nlq_router.regular_chat", new=AsyncMock(return_value=chat)), \
+            patch("routers.nlq.nlq_router.create_conversation", new=AsyncMock(return_value=MagicMock(chat_id="c1"))):
+        response = client.post("/api/web", json={"query": query})
+    assert response.status_code == 200
+    mock_plan.assert_awaited_once()
+
+
+def known_products(phrase, country):
+    return phrase in "coke 50cl"
+
+
+def test_common_query_shapes_skip_text2sql():
+    """
+    Test that a query of a common shape is compiled locally and runs with its parameters.
+    """
+    rows = pa.Table.from_pylist([{"SKU": "CC-050", "Product Price": 300.0}])
+    summary = {"data_summary": "One product", "suggested_queries": [], "user_message": {"content": "coke"}}
+    with patch("routers.nlq.async_helpers._chat_completion", new=AsyncMock()) as mock_completion, \
+            patch.object(query_shape_parser, "products", new=known_products), \
+            patch(
+                "routers.nlq.pipeline.execute_bigquery", new=AsyncMock(return_value=CachedQueryJob(rows))
+            ) as mock_execute, \
+            patch("routers.nlq.nlq_router.summarize_results", new=AsyncMock(return_value=summary)), \
+            patch("routers.nlq.nlq_router.create_conversation", new=AsyncMock(return_value=MagicMock(chat_id="c1"))):
+        response = client.post("/api/web", json={"query": "coke under 500 naira"})
+    assert response.status_code == 200
+    assert response.json()["suggested_queries"] == ["cheapest coke", "coke under 1000", "coke in stock"]
+    mock_completion.assert_not_awaited()
+    query_parameters = {parameter.name: parameter.value for parameter in mock_execute.call_args.args[1]}
+    assert query_parameters == {"product": "%coke%", "price": 500.0, "limit": 10}
+
+
+def test_common_query_shapes_reply_to_empty_results():
+    """
+    Test that a common shape finding no products is answered with its templated reply and no LLM call.
+    """
+    empty = pa.Table.from_pylist([], schema=pa.schema([("SKU", pa.string())]))
+    with patch("routers.nlq.async_helpers._chat_completion", new=AsyncMock()) as mock_completion, \
+            patch.object(query_shape_parser, "products", new=known_products), \
+            patch("routers.nlq.nlq_router.regular_chat", new=AsyncMock()) as mock_chat, \
+            patch("routers.nlq.pipeline.execute_bigquery", new=AsyncMock(return_value=CachedQueryJob(empty))), \
+            patch("routers.nlq.nlq_router.create_conversation", new=AsyncMock(return_value=MagicMock(chat_id="c1"))):
+        response = client.post("/api/web", json={"query": "coke under 50 naira"})
+    assert response.status_code == 200
+    assert response.json()["result_analysis"] == "I could not find any products for this search."
+    mock_completion.assert_not_awaited()
+    mock_chat.assert_not_awaited()
+
+
+def test_unknown_subjects_are_planned():
+    """
+    Test that a shaped query whose subject is no category, brand or product name goes to the query plan.
+    """
+    completion = plan_completion("search", MOCK_BIQQUERY, "No matching products were found.")
+    with patch("routers.nlq.async_helpers._chat_completion", new=completion), \
+            patch.object(query_shape_parser, "products", new=known_products), \
+            patch("routers.nlq.async_helpers.settings.TEXT2SQL_CACHE_ENABLED", False), \
+            patch("routers.nlq.pipeline.classify_intent", return_value=Intent.SEARCH), \
+            patch("routers.nlq.pipeline.execute_bigquery", new=AsyncMock(return_value=None)):
+        response = client.post("/api/web", json={"query": "drinks for my party under 5000"})
+    assert response.status_code == 200
+    assert response.json()["sql_query"] == MOCK_BIQQUERY
+    completion.assert_awaited_once()
+
+
+def plan_completion(intent, sql_query, data_summary):
+    return AsyncMock(return_value={
+        "intent": intent,
+        "sql_query": sql_query,
+        "data_summary": data_summary,
+        "suggested_queries": ["Cheapest Coca-Cola 50cl"],
+        "ai_context": {},
+        "user_message": {},
+    })
+
+
+def test_query_plan_without_sql_answers_in_one_call():
+    """
+    Test that a query the plan finds no SQL for is answered with the plan's reply and no second LLM call.
+    """
+    completion = plan_completion("chat", "SELECT 1", "We deliver within 48 hours.")
+    with patch("routers.nlq.async_helpers._chat_completion", new=completion), \
+            patch("routers.nlq.async_helpers.settings.TEXT2SQL_CACHE_ENABLED", False), \
+            patch("routers.nlq.pipeline.classify_intent", return_value=Intent.SEARCH), \
+            patch("routers.nlq.nlq_router.regular_chat", new=AsyncMock()) as mock_chat, \
+            patch("routers.nlq.pipeline.execute_bigquery", new=AsyncMock()) as mock_execute, \
+            patch(
+                "routers.nlq.nlq_router.create_conversation", new=AsyncMock(return_value=MagicMock(chat_id="c1"))
+            ) as mock_create:
+        response = client.post("/api/web", json={"query": "when will my order from last week arrive"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["sql_query"] is None
+    assert body["result_analysis"] == "We deliver within 48 hours."
+    assert body["analytics_queries"] == ["Cheapest Coca-Cola 50cl"]
+    assert body["conversation_id"] == "c1"
+    completion.assert_awaited_once()
+    mock_chat.assert_not_awaited()
+    mock_execute.assert_not_awaited()
+    mock_create.assert_awaited_once_with("when will my order from last week arrive", "We deliver within 48 hours.")
+
+
+def test_query_plan_reply_covers_empty_results():
+    """
+    Test that a search finding no products is answered with the plan's reply and no second LLM call.
+    """
+    completion = plan_completion("search", MOCK_BIQQUERY, "No matching products were found.")
+    empty = pa.Table.from_pylist([], schema=pa.schema([("SKU", pa.string())]))
+    with patch("routers.nlq.async_helpers._chat_completion", new=completion), \
+            patch("routers.nlq.async_helpers.settings.TEXT2SQL_CACHE_ENABLED", False), \
+            patch("routers.nlq.pipeline.classify_intent", return_value=Intent.SEARCH), \
+            patch("routers.nlq.nlq_router.regular_chat", new=AsyncMock()) as mock_chat, \
+            patch("routers.nlq.nlq_router.summarize_results", new=AsyncMock()) as mock_summarize, \
+            patch("routers.nlq.pipeline.execute_bigquery", new=AsyncMock(return_value=CachedQueryJob(empty))), \
+            patch("routers.nlq.nlq_router.create_conversation", new=AsyncMock(return_value=MagicMock(chat_id="c1"))):
+        response = client.post("/api/web", json={"query": "golden retriever puppies for sale"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["sql_query"] == MOCK_BIQQUERY
+    assert body["results"] == []
+    assert body["result_analysis"] == "No matching products were found."
+    completion.assert_awaited_once()
+    mock_chat.assert_not_awaited()
+    mock_summarize.assert_not_awaited()
+
+
+def test_deferred_summary_is_polled():
+    """
+    Test that a deferred summary returns the results at once and its analysis from the summary endpoint.
+    """
+    rows = pa.Table.from_pylist([{"SKU": "CC-050", "Product Price": 300.0}])
+    summary = {
+        "data_summary": "One product",
+        "suggested_queries": ["cheapest coke"],
+        "user_message": {"content": "coke"},
+    }
+    with patch("routers.nlq.pipeline.execute_bigquery", new=AsyncMock(return_value=CachedQueryJob(rows))), \
+            patch.object(query_shape_parser, "products", new=known_products), \
+            patch("routers.nlq.nlq_router.summarize_results", new=AsyncMock(return_value=summary)), \
+            patch("routers.nlq.nlq_router.create_conversation", new=AsyncMock(return_value=MagicMock(chat_id="c1"))), \
+            patch.object(summary_store, "saver", new=AsyncMock()), \
+            patch.object(summary_store, "loader", new=AsyncMock(return_value=None)):
+        response = client.post("/api/web?defer_summary=true", json={"query": "coke under 500 naira"})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["results"][0]["sku"] == "CC-050"
+        assert body["result_analysis"] is None
+        assert body["summary_id"]
+
+        response = client.get(f"/api/web/summary/{body['summary_id']}")
+        assert response.status_code == 200
+        assert response.json() == {
+            "summary_id": body["summary_id"],
+            "status": "ready",
+            "message": None,
+            "result_analysis": "One product",
+            "analytics_queries": ["cheapest coke"],
+            "conversation_id": "c1",
+        }
+
+        assert client.get("/api/web/summary/unknown").status_code == 404
+
+
+def test_deferred_summary_is_polished_before_it_is_polled():
+    """
+    Test that a deferred local summary is rewritten by the model before it is saved and completed for polling.
+    """
+    rows = pa.Table.from_pylist([{"SKU": "CC-050", "Product Price": 300.0}])
+    summary = {
+        "data_summary": "One product",
+        "suggested_queries": ["cheapest coke"],
+        "user_message": {"content": "coke"},
+        "polish": True,
+    }
+    polished = {"data_summary": "Coke 50cl costs NGN300", "suggested_queries": ["coke in stock"]}
+    polished["user_message"] = summary["user_message"]
+    with patch("routers.nlq.pipeline.execute_bigquery", new=AsyncMock(return_value=CachedQueryJob(rows))), \
+            patch.object(query_shape_parser, "products", new=known_products), \
+            patch("routers.nlq.nlq_router.summarize_results", new=AsyncMock(return_value=summary)), \
+            patch("routers.nlq.async_helpers._chat_completion", new=AsyncMock(return_value=polished)), \
+            patch("routers.nlq.nlq_router.create_conversation", new=AsyncMock(return_value=MagicMock(chat_id="c1"))) \
+            as mock_create, \
+            patch.object(summary_store, "saver", new=AsyncMock()), \
+            patch.object(summary_store, "loader", new=AsyncMock(return_value=None)):
+        response = client.post("/api/web?defer_summary=true", json={"query": "coke under 500 naira"})
+        assert response.status_code == 200
+        summary_id = response.json()["summary_id"]
+
+        response = client.get(f"/api/web/summary/{summary_id}")
+        assert response.json()["status"] == "ready"
+        assert response.json()["result_analysis"] == "Coke 50cl costs NGN300"
+        assert response.json()["analytics_queries"] == ["coke in stock"]
+    mock_create.assert_awaited_once_with("coke", "Coke 50cl costs NGN300")
+
+
+def test_image_text_without_words_is_unrecognized():
+    """
+    Test that recognized image text without a single word is reported as unrecognized instead of searched.
+    """
+    with patch("routers.nlq.nlq_router.process_product_image", return_value="processed_image"), \
+            patch("routers.nlq.pipeline.recognize_image", new=AsyncMock(return_value=(" , ", False))), \
+            patch("routers.nlq.pipeline.execute_bigquery", new=AsyncMock()) as mock_execute:
+        response = client.post("/api/web", json={"product_image": BASE_64_IMG})
+    assert response.status_code == 200
+    assert response.json()["message"].startswith("Sorry, we could not recognize the product")
+    mock_execute.assert_not_awaited()
@@ -0,0 +1,44 @@
+import pytest
+
+from routers.nlq.pagination import PageCursor, decode_cursor, encode_cursor, snapshot_label
+
+
+def test_cursor_round_trip():
+    """
+    Test that a cursor survives encoding into an opaque, URL-safe token.
+    """
+    cursor = PageCursor("3f2a9c0d1e4b5a67", "job_123", "EU", 200, 48213)
+    token = encode_cursor(cursor)
+    assert "job_123" not in token
+    assert all(character.isalnum() or character in "-_" for character in token)
+    assert decode_cursor(token) == cursor
+
+    cursor = PageCursor("3f2a9c0d1e4b5a67", None, None, 0, 48213)
+    assert decode_cursor(encode_cursor(cursor)) == cursor
+
+
+@pytest.mark.parametrize("token", [
+    "not a cursor",
+    "bm90IGpzb24",  # "not json"
+    "WyJqb2IiXQ",  # ["job"]
+    "WyJsYWJlbCIsImpvYiIsbnVsbCwtMSxudWxsXQ",  # ["label","job",null,-1,null]
+    "WyJsYWJlbCIsImpvYiIsbnVsbCwiMSIsbnVsbF0",  # ["label","job",null,"1",null]
+    "W251bGwsImpvYiIsbnVsbCwxLG51bGxd",  # [null,"job",null,1,null]
+])
+def test_invalid_cursors(token):
+    """
+    Test that tokens that are not cursors are rejected.
+    """
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+def test_snapshot_label():
+    """
+    Test that the snapshots of different categories are labelled differently.
+    """
+    sql_query = "SELECT * FROM `marketplace_product_nigeria` WHERE LOWER(`Category Name`) = @category"
+    label = snapshot_label(sql_query, "cookies")
+    assert label == snapshot_label(sql_query, "cookies")
+    assert label != snapshot_label(sql_query, "bar soap")
+    assert len(label) == 16
@@ -0,0 +1,71 @@
+from routers.nlq.product_index import ProductNameIndex, tokenize
+
+MAPPING_ROWS = [
+    {"Product Name": "Coca Cola Soft Drink 50cl", "Mapping": "5449000000996", "SKU_STRING": "CC-050,CC-051"},
+    {"Product Name": "Fanta Orange Soft Drink 50cl", "Mapping": "5449000011527", "SKU_STRING": "FT-050"},
+    {"Product Name": "Peak Milk Powder 400g", "Mapping": "8710400000000", "SKU_STRING": "PK-400"},
+    {"Product Name": "Sprite Lemon Soft Drink 50cl", "Mapping": "5449000014535", "SKU_STRING": "SP-050"},
+    {"Product Name": None, "Mapping": "0", "SKU_STRING": "NONE"},
+]
+
+
+def build_index():
+    index = ProductNameIndex()
+    index.build(MAPPING_ROWS)
+    return index
+
+
+def test_tokenize():
+    """
+    Test that text is lowercased, split on non-alphanumerics and stripped of single characters.
+    """
+    assert tokenize("Coca-Cola 50cl, x!") == ["coca", "cola", "50cl"]
+    assert tokenize(None) == []
+
+
+def test_rare_words_outrank_common_words():
+    """
+    Test that a rare brand word outweighs words shared by many products in noisy OCR text.
+    """
+    results = build_index().search("SOFT DRINK 50cl fanta refreshing taste best before", limit=2)
+    assert results[0]["SKU_STRING"] == "FT-050"
+    assert len(results) == 2
+
+
+def test_no_match_and_empty_index():
+    """
+    Test that unknown words return nothing and an unbuilt index is not ready.
+    """
+    index = build_index()
+    assert index.search("zzz qqq") == []
+    assert index.stats()["searches"] == 1
+    assert index.stats()["hits"] == 0
+    assert index.stats()["rows"] == 4
+    assert not ProductNameIndex().ready
+    assert ProductNameIndex().search("coca") == []
+
+
+def test_rebuild_replaces_rows():
+    """
+    Test that a rebuild replaces the previously indexed rows.
+    """
+    index = build_index()
+    index.build([{"Product Name": "Milo Chocolate Drink", "Mapping": "1", "SKU_STRING": "ML-1"}])
+    assert index.search("coca cola") == []
+    assert index.search("milo")[0]["SKU_STRING"] == "ML-1"
+
+
+def test_contains_phrase():
+    """
+    Test that a phrase is found only when a product name contains it, plural names included.
+    """
+    index = build_index()
+    assert index.contains("coca cola")
+    assert index.contains("soft drink")
+    assert index.contains("fanta orange")
+    assert not index.contains("orange soft drink for my party")
+    assert not index.contains("cola coca")
+    assert not index.contains("")
+
+    index.build([{"Product Name": "McVities Digestive Biscuits 400g", "Mapping": "1", "SKU_STRING": "MV-1"}])
+    assert index.contains("digestive biscuit")
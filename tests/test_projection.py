@@ -0,0 +1,65 @@
+from routers.nlq.projection import PRODUCT_RESPONSE_COLUMNS, model_columns, project_columns
+from routers.nlq.query_builder import external_mapping_query, sku_query
+from routers.nlq.schemas import MarketplaceProductNigeria
+
+TABLE_COLUMNS = {
+    "marketplace_product_nigeria": {"SKU", "Product Name", "Product Price", "Internal Notes"},
+}
+
+
+def test_model_columns():
+    """
+    Test that the response model's aliases are the columns it reads.
+    """
+    assert model_columns(MarketplaceProductNigeria) == PRODUCT_RESPONSE_COLUMNS
+    assert "Product Price" in PRODUCT_RESPONSE_COLUMNS
+    assert "product_price" not in PRODUCT_RESPONSE_COLUMNS
+
+
+def test_star_is_narrowed_to_the_columns_the_table_has():
+    """
+    Test that SELECT * selects the wanted columns the view has, in the order they are wanted.
+    """
+    projected = project_columns(
+        "SELECT * FROM `marketplace_product_nigeria` WHERE `Product Price` < 500 LIMIT 10",
+        ["Product Price", "SKU", "Seller Name"],
+        TABLE_COLUMNS.get,
+    )
+    assert projected == (
+        "SELECT `Product Price`, `SKU` FROM `marketplace_product_nigeria` WHERE `Product Price` < 500 LIMIT 10"
+    )
+
+
+def test_builder_queries_are_narrowed():
+    """
+    Test that the SKU and external-id queries keep their parameters and only read the wanted columns.
+    """
+    query = sku_query(["CC-050"], "Nigeria", "AND `Product Price` < 500")
+    projected = project_columns(query.sql, ["SKU", "Product Name"], TABLE_COLUMNS.get)
+    assert projected.startswith("SELECT `SKU`, `Product Name` FROM `marketplace_product_nigeria`")
+    assert "UNNEST(@skus)" in projected
+
+    query = external_mapping_query({"5449000000996": ["CC-050"]}, "Nigeria")
+    projected = project_columns(query.sql, ["external_id", "SKU", "Product Price"], TABLE_COLUMNS.get)
+    assert "em.external_id, `p`.`SKU`, `p`.`Product Price` FROM" in projected
+    assert "SELECT mapping.external_id, mapping.SKU FROM UNNEST(@external_mapping)" in projected
+
+
+def test_stars_that_are_left_alone():
+    """
+    Test that stars whose columns are unknown or that a projection would change are not rewritten.
+    """
+    columns = ["SKU"]
+    assert project_columns("SELECT SKU FROM `marketplace_product_nigeria`", columns, TABLE_COLUMNS.get) is None
+    assert project_columns("SELECT * FROM `unknown_view`", columns, TABLE_COLUMNS.get) is None
+    assert project_columns("SELECT DISTINCT * FROM `marketplace_product_nigeria`", columns, TABLE_COLUMNS.get) is None
+    assert project_columns(
+        "SELECT * EXCEPT (`Internal Notes`) FROM `marketplace_product_nigeria`", columns, TABLE_COLUMNS.get
+    ) is None
+    assert project_columns("SELECT COUNT(*) FROM `marketplace_product_nigeria`", columns, TABLE_COLUMNS.get) is None
+    assert project_columns("SELECT * FROM `marketplace_product_nigeria`", ["Seller Name"], TABLE_COLUMNS.get) is None
+
+    projected = project_columns(
+        "WITH cheap AS (SELECT * FROM `marketplace_product_nigeria`) SELECT * FROM cheap", columns, TABLE_COLUMNS.get
+    )
+    assert projected == "WITH cheap AS (SELECT `SKU` FROM `marketplace_product_nigeria`) SELECT * FROM cheap"
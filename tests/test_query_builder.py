@@ -0,0 +1,104 @@
+from routers.nlq.query_builder import (
+    bulk_gtin_query,
+    category_page_query,
+    external_mapping_query,
+    gtin_query,
+    product_name_query,
+    product_name_words,
+    sku_query,
+)
+
+
+def parameter_values(query):
+    return {parameter.name: parameter.to_api_repr()["parameterValue"] for parameter in query.parameters}
+
+
+def test_product_name_words():
+    """
+    Test that product names are split into distinct lowercase words.
+    """
+    assert product_name_words("Coca-Cola, Zero:coca") == ["coca", "cola", "zero"]
+
+
+def test_values_are_not_in_the_sql():
+    """
+    Test that searched values are passed as parameters and not pasted into the SQL text.
+    """
+    query = gtin_query('5449000000996" OR 1=1 --', "Nigeria")
+    assert "5449000000996" not in query.sql
+    assert "@gtin" in query.sql
+    assert "market_place_product_nigeria_mapping_table" in query.sql
+
+    query = product_name_query("Peak Milk", "Ghana", limit=5)
+    assert "peak" not in query.sql.lower()
+    assert "marketplace_product_except_nigeria_sku_aggregate_2" in query.sql
+
+
+def test_same_logical_query_same_sql():
+    """
+    Test that queries differing only in their values share the same SQL text.
+    """
+    first = sku_query(["A-1", "B-2"], "Nigeria", "AND `Product Price` < 500", limit=10)
+    second = sku_query(["C-3"] * 200, "Nigeria", "AND `Product Price` < 500", limit=10)
+    assert first.sql == second.sql
+    assert sku_query(["B-2", "A-1"], "Nigeria").parameters[0] == sku_query(["A-1", "B-2"], "Nigeria").parameters[0]
+    assert parameter_values(second)["skus"] == {"arrayValues": [{"value": "C-3"}]}
+
+
+def test_sku_query_clause():
+    """
+    Test that the Text2SQL clause refines the SKU filter and the limit is a parameter.
+    """
+    query = sku_query(["A-1"], "Nigeria", "WHERE AND `Product Price` < 500;", limit=10)
+    assert "WHERE SKU IN UNNEST(@skus) AND `Product Price` < 500 LIMIT @limit" in query.sql
+    assert "marketplace_product_nigeria" in query.sql
+    assert parameter_values(query)["limit"] == {"value": "10"}
+
+
+def test_external_mapping_query():
+    """
+    Test that the external id mapping is an ARRAY<STRUCT> parameter and the clause precedes ORDER BY.
+    """
+    query = external_mapping_query({"p2": ["B-2"], "p1": ["A-1", "A-2"]}, "Nigeria", "AND Quantity > 5")
+    assert "UNNEST(@external_mapping)" in query.sql
+    assert query.sql.index("AND Quantity > 5") < query.sql.index("ORDER BY em.external_id")
+    mapping = parameter_values(query)["external_mapping"]["arrayValues"]
+    assert mapping[0]["structValues"] == {"external_id": {"value": "p1"}, "SKU": {"value": "A-1"}}
+    assert len(mapping) == 3
+
+    ordered = external_mapping_query({"p1": ["A-1"]}, "Nigeria", "AND Quantity > 5 ORDER BY `Product Price`")
+    assert "ORDER BY em.external_id" not in ordered.sql
+    assert external_mapping_query({}, "Nigeria").parameters[0].to_api_repr()["parameterValue"] == {"arrayValues": []}
+
+
+def test_bulk_gtin_query():
+    """
+    Test that all GTINs go in one array parameter, in both stored spellings, with a per-GTIN limit.
+    """
+    query = bulk_gtin_query(["5449000000996", "6001240100011", "5449000000996"], "Ghana", limit=3)
+    assert "marketplace_product_except_nigeria_sku_aggregate_2" in query.sql
+    assert "JOIN `marketplace_product_except_nigeria_sku_aggregate` p" in query.sql
+    assert "5449000000996" not in query.sql
+    assert parameter_values(query)["mappings"] == {"arrayValues": [
+        {"value": "'5449000000996"},
+        {"value": "'6001240100011"},
+        {"value": "5449000000996"},
+        {"value": "6001240100011"},
+    ]}
+    assert parameter_values(query)["limit"] == {"value": "3"}
+
+
+def test_category_page_query():
+    """
+    Test that category pages are queried in Product ID order and resume after the last Product ID.
+    """
+    query = category_page_query("Cookies", "Nigeria")
+    assert "FROM `marketplace_product_nigeria`" in query.sql
+    assert "ORDER BY `Product ID`" in query.sql
+    assert "LIMIT" not in query.sql
+    assert parameter_values(query) == {"category": {"value": "cookies"}, "after": {"value": None}}
+
+    resumed = category_page_query("Cookies", "Ghana", after=48213)
+    assert "FROM `marketplace_product_except_nigeria`" in resumed.sql
+    assert parameter_values(resumed)["after"] == {"value": "48213"}
+    assert resumed.sql.replace("marketplace_product_except_nigeria", "marketplace_product_nigeria") == query.sql
@@ -0,0 +1,74 @@
+from routers.nlq.query_shapes import QueryShapeParser
+
+CATEGORIES = ["Biscuits", "Fizzy Drinks", "Mobile Phones", "Rice"]
+BRANDS = ["Coca-Cola", "Golden Penny"]
+PRODUCT_NAMES = ["coke 50cl", "digestive biscuit 400g"]
+
+
+def known_products(phrase, country):
+    return any(phrase in name for name in PRODUCT_NAMES)
+
+
+def parameter_values(parsed):
+    return {parameter.name: parameter.value for parameter in parsed["query_parameters"]}
+
+
+def test_price_shapes():
+    """
+    Test that "<product> under <N>" and its variants compile to parameterized SQL.
+    """
+    parser = QueryShapeParser(CATEGORIES, BRANDS, known_products)
+    parsed = parser.parse("Show me coke under ₦1,500 please", "Nigeria", 10)
+    assert "FROM `marketplace_product_nigeria`" in parsed["sql_query"]
+    assert "`Product Price` < @price" in parsed["sql_query"]
+    assert parameter_values(parsed) == {"product": "%coke%", "price": 1500.0, "limit": 10}
+    assert parsed["suggested_queries"] == ["cheapest coke", "coke under 3000", "coke in stock"]
+
+    parsed = parser.parse("Find products priced below 1500 bucks", "Ghana", 5)
+    assert "FROM `marketplace_product_except_nigeria`" in parsed["sql_query"]
+    assert parameter_values(parsed) == {"price": 1500.0, "limit": 5}
+
+    parsed = parser.parse("fizzy drinks between 2k and n500", "Nigeria", 10)
+    assert "BETWEEN @low AND @high" in parsed["sql_query"]
+    assert parameter_values(parsed) == {"category": "fizzy drinks", "low": 500.0, "high": 2000.0, "limit": 10}
+
+
+def test_order_and_stock_shapes():
+    """
+    Test that "cheapest <category>" and "<brand> in stock" compile to SQL.
+    """
+    parser = QueryShapeParser(CATEGORIES, BRANDS)
+    parsed = parser.parse("cheapest biscuit", "Nigeria", 10)
+    assert "ORDER BY `Product Price` ASC" in parsed["sql_query"]
+    assert parameter_values(parsed) == {"category": "biscuits", "limit": 10}
+
+    parsed = parser.parse("Top 3 most expensive mobile phones?", "Nigeria", 10)
+    assert "ORDER BY `Product Price` DESC" in parsed["sql_query"]
+
+    parsed = parser.parse("Coca Cola products in stock", "Nigeria", 10)
+    assert "LOWER(`Stock Status`) = 'in stock'" in parsed["sql_query"]
+    assert parameter_values(parsed) == {"brand": "coca-cola", "limit": 10}
+
+
+def test_unknown_shapes_fall_back():
+    """
+    Test that queries of no known shape, or whose subject is no category, brand or product name, are left
+    to the LLM and counted.
+    """
+    parser = QueryShapeParser(CATEGORIES, BRANDS)
+    assert parser.parse("what is the best soap for dry skin", "Nigeria", 10) is None
+    assert parser.parse("indomie in stock", "Nigeria", 10) is None
+    assert parser.parse("coke under 500", "Nigeria", 10) is None
+
+    parser = QueryShapeParser(CATEGORIES, BRANDS, known_products)
+    assert parser.parse("coke under 500", "Nigeria", 10)
+    assert parser.parse("drinks for my party under 5000", "Nigeria", 10) is None
+    assert parser.parse("soda under 500", "Nigeria", 10) is None
+
+    parser.set_brands(["Indomie", None])
+    assert parser.parse("indomie in stock", "Nigeria", 10)
+
+    stats = parser.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["hit_rate"] == 0.5
+    assert stats["shapes"]["in_stock"] == 1
@@ -0,0 +1,100 @@
+import os
+
+import pyarrow as pa
+from google.cloud.bigquery import ScalarQueryParameter
+
+from routers.nlq.query_builder import bulk_gtin_query, external_mapping_query, gtin_query, sku_query
+from routers.nlq.replica import ProductReplica, duckdb_parameters, to_duckdb
+
+PRODUCTS = pa.table({
+    "SKU": ["CC-050", "FT-050", "PK-400"],
+    "Product Name": ["Coca Cola 50cl", "Fanta Orange 50cl", "Peak Milk 400g"],
+    "Product Price": [300.0, 280.0, 1500.0],
+    "Quantity": [10.0, 3.0, 8.0],
+})
+MAPPINGS = pa.table({
+    "Product Name": ["Coca Cola 50cl"],
+    "Mapping": ["5449000000996"],
+    "SKU_STRING": ["CC-050,CC-051"],
+})
+
+
+def make_replica(tmp_path, max_age=3600):
+    replica = ProductReplica(
+        str(tmp_path),
+        ["marketplace_product_nigeria", "market_place_product_nigeria_mapping_table"],
+        max_age=max_age,
+    )
+    replica.export("marketplace_product_nigeria", PRODUCTS)
+    replica.export("market_place_product_nigeria_mapping_table", MAPPINGS)
+    return replica
+
+
+def test_to_duckdb():
+    """
+    Test that BigQuery SELECTs are translated and their tables, not CTEs, are reported.
+    """
+    sql, tables = to_duckdb(external_mapping_query({"a": ["CC-050"]}, "Nigeria").sql)
+    assert tables == {"marketplace_product_nigeria"}
+    assert "$external_mapping" in sql
+    assert to_duckdb("DELETE FROM `marketplace_product_nigeria` WHERE TRUE") is None
+    assert to_duckdb("SELECT * FROM (") is None
+
+
+def test_duckdb_parameters():
+    """
+    Test that ARRAY<STRUCT> parameters become lists of dicts.
+    """
+    parameters = duckdb_parameters(external_mapping_query({"a": ["CC-050"]}, "Nigeria").parameters)
+    assert parameters == {"external_mapping": [{"external_id": "a", "SKU": "CC-050"}]}
+
+
+def test_replica_answers_lookups(tmp_path):
+    """
+    Test that SKU, GTIN and external id lookups are answered from the snapshots.
+    """
+    replica = make_replica(tmp_path)
+    assert os.path.exists(tmp_path / "marketplace_product_nigeria.parquet")
+
+    rows = replica.query(*sku_query(["CC-050", "FT-050"], "Nigeria", "AND `Product Price` < 290")).to_pylist()
+    assert [row["SKU"] for row in rows] == ["FT-050"]
+
+    rows = replica.query(*gtin_query("5449000000996", "Nigeria")).to_pylist()
+    assert rows[0]["SKU_STRING"] == "CC-050,CC-051"
+
+    rows = replica.query(*external_mapping_query({"b": ["PK-400"], "a": ["CC-050"]}, "Nigeria")).to_pylist()
+    assert [(row["external_id"], row["SKU"]) for row in rows] == [("a", "CC-050"), ("b", "PK-400")]
+
+    rows = replica.query(*bulk_gtin_query(["5449000000996", "0000000000000"], "Nigeria")).to_pylist()
+    assert [(row["Mapping"], row["SKU"]) for row in rows] == [("5449000000996", "CC-050")]
+    assert replica.stats()["hits"] == 4
+
+
+def test_replica_falls_back(tmp_path):
+    """
+    Test that unparameterized, unreplicated, failing and stale lookups are left to BigQuery.
+    """
+    replica = make_replica(tmp_path)
+    assert replica.query("SELECT * FROM `marketplace_product_nigeria`") is None
+    assert replica.query(*sku_query(["CC-050"], "Ghana")) is None
+    assert replica.query(
+        "SELECT * FROM `marketplace_product_nigeria` WHERE missing_column = @value",
+        [ScalarQueryParameter("value", "STRING", "x")],
+    ) is None
+    assert replica.stats()["errors"] == 1
+    assert replica.stats()["hit_ratio"] == 0.0
+
+    stale = make_replica(tmp_path, max_age=-1)
+    assert stale.query(*gtin_query("5449000000996", "Nigeria")) is None
+
+
+def test_load_all_restores_snapshots(tmp_path):
+    """
+    Test that a new replica loads the snapshots left on disk.
+    """
+    make_replica(tmp_path)
+    replica = ProductReplica(str(tmp_path), ["marketplace_product_nigeria", "missing_table"], max_age=3600)
+    replica.load_all()
+    assert replica.snapshot_age("marketplace_product_nigeria") is not None
+    assert replica.snapshot_age("missing_table") is None
+    assert replica.query(*sku_query(["PK-400"], "Nigeria")).num_rows == 1
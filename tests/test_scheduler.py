@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+
+from routers.nlq.scheduler import QueryPriority, QueryRejected, QueryScheduler, set_query_priority
+
+
+def run_job(scheduler, priority, order, hold=None):
+    """Runs a job of the given priority in its own context, recording when it is admitted."""
+    def job():
+        set_query_priority(priority)
+        try:
+            with scheduler.admit():
+                order.append(priority)
+                if hold:
+                    hold.wait(5)
+        except QueryRejected:
+            order.append(None)
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(job,))
+    thread.start()
+    return thread
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_jobs_are_admitted_by_priority():
+    """
+    Test that a full pool admits queued jobs by priority, not by arrival.
+    """
+    scheduler = QueryScheduler(max_concurrency=1)
+    order = []
+    release = threading.Event()
+    blocker = run_job(scheduler, QueryPriority.WEB, order, hold=release)
+    wait_for(lambda: scheduler.in_flight == 1)
+
+    queued = []
+    for priority in (QueryPriority.CATEGORIES, QueryPriority.WEB, QueryPriority.FLOW, QueryPriority.WEBHOOK):
+        queued.append(run_job(scheduler, priority, order))
+        wait_for(lambda: scheduler.stats()["queued"] == len(queued))
+    release.set()
+    for thread in [blocker, *queued]:
+        thread.join(5)
+
+    assert order == [
+        QueryPriority.WEB, QueryPriority.FLOW, QueryPriority.WEBHOOK, QueryPriority.WEB, QueryPriority.CATEGORIES
+    ]
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 0
+    assert stats["priorities"]["categories"]["admitted"] == 1
+    assert stats["priorities"]["categories"]["max_wait"] > 0
+
+
+def test_jobs_that_would_miss_their_deadline_are_rejected():
+    """
+    Test that a job is rejected at once when the estimated wait exceeds its deadline.
+    """
+    scheduler = QueryScheduler(max_concurrency=1, deadlines={QueryPriority.FLOW: 0.5}, initial_job_seconds=10)
+    order = []
+    release = threading.Event()
+    blocker = run_job(scheduler, QueryPriority.WEB, order, hold=release)
+    wait_for(lambda: scheduler.in_flight == 1)
+
+    started = time.monotonic()
+    run_job(scheduler, QueryPriority.FLOW, order).join(5)
+    assert time.monotonic() - started < 0.5
+    assert order == [QueryPriority.WEB, None]
+    assert scheduler.stats()["priorities"]["flow"]["rejected"] == 1
+    assert scheduler.stats()["queued"] == 0
+
+    release.set()
+    blocker.join(5)
+
+
+def test_background_jobs_have_no_deadline():
+    """
+    Test that jobs outside a request run as background jobs without a deadline.
+    """
+    scheduler = QueryScheduler(max_concurrency=2, deadlines={QueryPriority.BACKGROUND: 0.001})
+    with scheduler.admit():
+        assert scheduler.in_flight == 1
+    assert scheduler.stats()["priorities"]["background"]["admitted"] == 1
+
+    set_query_priority(QueryPriority.WEB)
+    with pytest.raises(ZeroDivisionError), scheduler.admit():
+        1 / 0
+    assert scheduler.in_flight == 0
+
+
+def test_async_jobs_wait_on_the_event_loop_by_priority():
+    """
+    Test that coroutines queue for a slot without holding threads and are admitted by priority.
+    """
+    scheduler = QueryScheduler(max_concurrency=1)
+    order = []
+
+    async def job(priority, hold=None):
+        set_query_priority(priority)
+        async with scheduler.admit_async():
+            order.append(priority)
+            if hold:
+                await hold.wait()
+
+    async def main():
+        release = asyncio.Event()
+        blocker = asyncio.create_task(job(QueryPriority.WEB, release))
+        await asyncio.sleep(0)
+        threads = threading.active_count()
+        queued = [
+            asyncio.create_task(job(priority))
+            for priority in (QueryPriority.CATEGORIES, QueryPriority.WEB, QueryPriority.FLOW)
+        ]
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["queued"] == 3
+        assert threading.active_count() == threads
+
+        # A waiter that goes away leaves the queue without taking a slot
+        cancelled = asyncio.create_task(job(QueryPriority.FLOW))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert scheduler.stats()["queued"] == 3
+
+        release.set()
+        await asyncio.gather(blocker, *queued)
+
+    asyncio.run(main())
+    assert order == [QueryPriority.WEB, QueryPriority.FLOW, QueryPriority.WEB, QueryPriority.CATEGORIES]
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_threads_inside_an_async_slot_are_not_queued_again():
+    """
+    Test that a job handed to a worker thread after admit_async does not wait for a second slot.
+    """
+    scheduler = QueryScheduler(max_concurrency=1)
+
+    def run_job():
+        with scheduler.admit():
+            return scheduler.in_flight
+
+    async def main():
+        async with scheduler.admit_async():
+            return await asyncio.to_thread(run_job)
+
+    assert asyncio.run(main()) == 1
+    assert sum(stats["admitted"] for stats in scheduler.stats()["priorities"].values()) == 1
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from routers.nlq.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    """
+    Test that concurrent calls with the same key run once and each get their own copy of the result.
+    """
+    single_flight = SingleFlight()
+    calls = []
+
+    @single_flight.coalesce("nlq", lambda query, country="Nigeria": (query.lower(), country), copy_result=True)
+    async def parse(query, country="Nigeria"):
+        calls.append(query)
+        await asyncio.sleep(0.01)
+        return {"sql_query": f"-- {query}"}
+
+    async def run():
+        results = await asyncio.gather(parse("Coke"), parse("coke"), parse("coke", country="Nigeria"), parse("Fanta"))
+        assert len(calls) == 2
+        assert results[0] == results[1] == {"sql_query": "-- Coke"}
+        assert results[0] is not results[1]
+
+        await parse("coke")
+        assert len(calls) == 3
+
+    asyncio.run(run())
+    assert single_flight.stats() == {"in_flight": 0, "stages": {"nlq": {"executions": 3, "coalesced": 2}}}
+
+
+def test_exceptions_and_unshared_calls():
+    """
+    Test that every waiter gets the exception of the shared execution and that calls keyed None run alone.
+    """
+    single_flight = SingleFlight()
+    calls = []
+
+    @single_flight.coalesce("chat", lambda query, conversations: None if conversations else query)
+    async def chat(query, conversations):
+        calls.append(query)
+        await asyncio.sleep(0.01)
+        if query == "fail":
+            raise RuntimeError("rate limited")
+        return query
+
+    async def run():
+        results = await asyncio.gather(chat("fail", None), chat("fail", None), return_exceptions=True)
+        assert [str(result) for result in results] == ["rate limited", "rate limited"]
+        assert len(calls) == 1
+
+        await asyncio.gather(chat("hi", ["earlier"]), chat("hi", ["earlier"]))
+        assert len(calls) == 3
+
+    asyncio.run(run())
+
+
+def test_cancelled_callers():
+    """
+    Test that a cancelled caller does not cancel the work others await, and the last one cancels it.
+    """
+    single_flight = SingleFlight()
+    finished = []
+
+    @single_flight.coalesce("vision", lambda image: image)
+    async def recognize(image):
+        await asyncio.sleep(0.05)
+        finished.append(image)
+        return image
+
+    async def run():
+        first = asyncio.create_task(recognize("photo"))
+        second = asyncio.create_task(recognize("photo"))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "photo"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        alone = asyncio.create_task(recognize("other"))
+        await asyncio.sleep(0)
+        alone.cancel()
+        await asyncio.sleep(0.1)
+        assert finished == ["photo"]
+        assert single_flight.stats()["in_flight"] == 0
+
+    asyncio.run(run())
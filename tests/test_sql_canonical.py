@@ -0,0 +1,60 @@
+from routers.nlq.sql_canonical import canonical_sql, canonicalize_sql, sql_fingerprint
+
+
+def test_canonical_sql():
+    """
+    Test that whitespace and trailing semicolons are dropped without parsing.
+    """
+    assert canonical_sql("SELECT *\n   FROM t  LIMIT 10;") == "SELECT * FROM t LIMIT 10"
+
+
+def test_equivalent_queries_are_canonicalized_alike():
+    """
+    Test that casing, quoting, predicate order, IN lists, parentheses and literals are normalized.
+    """
+    first = canonicalize_sql(
+        "select *  from `marketplace_product_nigeria` where (Brand = 'Indomie' or `Category Name` like '%noodle%')"
+        " and 500.00 > `Product Price` and SKU in ('b', 'a') limit 10;"
+    )
+    second = canonicalize_sql(
+        "SELECT * FROM marketplace_product_nigeria WHERE `Product Price` < 500.0 "
+        "AND ((`Category Name` LIKE '%noodle%') OR `Brand` = 'Indomie') AND SKU IN ('a', 'b', 'a') LIMIT 10"
+    )
+    assert first == second
+    assert first == (
+        "SELECT * FROM `marketplace_product_nigeria` WHERE (`Brand` = 'Indomie' OR `Category Name` LIKE '%noodle%') "
+        "AND `Product Price` < 500.0 AND `SKU` IN ('a', 'b') LIMIT 10"
+    )
+    assert sql_fingerprint(first) == sql_fingerprint(second)
+
+
+def test_meaningful_differences_are_kept():
+    """
+    Test that values, precedence and column order still tell queries apart.
+    """
+    assert canonicalize_sql("SELECT * FROM t WHERE a = 1") != canonicalize_sql("SELECT * FROM t WHERE a = 2")
+    assert canonicalize_sql("SELECT a, b FROM t") != canonicalize_sql("SELECT b, a FROM t")
+    assert canonicalize_sql("SELECT * FROM t WHERE (x + 1) * 2 > 3") == "SELECT * FROM `t` WHERE (`x` + 1) * 2 > 3"
+    assert canonicalize_sql("SELECT * FROM t WHERE NOT (b = 2 AND a = 1)") == (
+        "SELECT * FROM `t` WHERE NOT (`a` = 1 AND `b` = 2)"
+    )
+
+
+def test_strip_literals():
+    """
+    Test that queries of the same shape share a fingerprint once literals are stripped.
+    """
+    assert canonicalize_sql("SELECT * FROM t WHERE a = 1 AND b IN (1, 2) LIMIT 5", strip_literals=True) == (
+        "SELECT * FROM `t` WHERE `a` = ? AND `b` IN (?) LIMIT ?"
+    )
+    assert sql_fingerprint("SELECT * FROM t WHERE a < 100", strip_literals=True) == sql_fingerprint(
+        "select * from t where 5 > a", strip_literals=True
+    )
+
+
+def test_unparseable_sql_falls_back_to_whitespace():
+    """
+    Test that text sqlglot cannot parse still gets a stable key.
+    """
+    assert canonicalize_sql("SELECT 1;  SELECT 2") == "SELECT 1; SELECT 2"
+    assert canonicalize_sql("not   sql ((") == "not sql (("
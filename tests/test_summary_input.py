@@ -0,0 +1,65 @@
+import pandas as pd
+
+from routers.nlq.summary_input import aggregate_products, build_summary_input, estimate_tokens
+
+
+def make_listings(products=12, sellers=5):
+    return pd.DataFrame([
+        {
+            "SKU": f"SKU-{index % products}",
+            "Product ID": index,
+            "Product Name": f"Coca Cola {index % products}",
+            "Brand": "Coca-Cola",
+            "Category Name": "Soft Drinks",
+            "Product Price": 100.0 + index,
+            "Salable Quantity": 2.0,
+            "Seller Name": f"Seller {index % sellers}",
+            "Last Price Update At": pd.Timestamp("2024-01-01"),
+        }
+        for index in range(products * sellers)
+    ])
+
+
+def test_aggregate_products():
+    """
+    Test that seller rows collapse into one row per product with price and seller aggregates.
+    """
+    products = aggregate_products(make_listings())
+    assert len(products) == 12
+    first = products.iloc[0]
+    assert first["Product Name"] == "Coca Cola 0"
+    assert first["min_price"] == 100.0
+    assert first["max_price"] == 148.0
+    assert first["sellers"] == 5
+    assert first["salable_quantity"] == 10.0
+    assert "Last Price Update At" not in products.columns
+
+
+def test_summary_input_hoists_constant_columns():
+    """
+    Test that values shared by every product are stated once and IDs are dropped.
+    """
+    summary_input = build_summary_input(make_listings())
+    assert "Brand: Coca-Cola (all products)" in summary_input
+    assert summary_input.count("Coca-Cola") == 1
+    assert "Product ID" not in summary_input
+    assert "60 listings of 12 products." in summary_input
+
+
+def test_summary_input_respects_token_budget():
+    """
+    Test that products beyond the token budget are omitted and counted.
+    """
+    summary_input = build_summary_input(make_listings(products=200), token_budget=300)
+    assert estimate_tokens(summary_input) <= 320
+    assert "more products omitted." in summary_input
+    assert "Price range: 100 - 1099." in summary_input
+
+
+def test_summary_input_without_sku():
+    """
+    Test that results without a SKU column are grouped by product name.
+    """
+    listings = make_listings()[["Product Name", "Product Price", "Seller Name"]]
+    assert "Product Name,listings,min_price" in build_summary_input(listings)
+    assert build_summary_input(listings.iloc[:0]) == "No products."
@@ -0,0 +1,67 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+from routers.nlq.summary_store import SummaryStore
+
+
+def test_summaries_are_written_through():
+    """
+    Test that a summary is pending until it completes or fails and that every change is saved.
+    """
+    saver = AsyncMock()
+    store = SummaryStore(saver=saver)
+
+    async def run():
+        summary_id = await store.create()
+        assert await store.get(summary_id) == {"status": "pending"}
+        await store.complete(summary_id, "3 products", ["cheapest coke"], "c1")
+        assert await store.get(summary_id) == {
+            "status": "ready",
+            "result_analysis": "3 products",
+            "analytics_queries": ["cheapest coke"],
+            "conversation_id": "c1",
+        }
+
+        failed_id = await store.create()
+        await store.fail(failed_id, "Sorry! Could not generate analysis")
+        assert (await store.get(failed_id))["status"] == "failed"
+        return summary_id
+
+    summary_id = asyncio.run(run())
+    assert saver.await_count == 4
+    assert saver.await_args_list[1].args == (summary_id, {
+        "status": "ready",
+        "result_analysis": "3 products",
+        "analytics_queries": ["cheapest coke"],
+        "conversation_id": "c1",
+    })
+
+
+def test_evicted_summaries_are_loaded():
+    """
+    Test that the store keeps a bounded number of summaries and loads the others from the database.
+    """
+    stored = {}
+
+    async def saver(summary_id, summary):
+        stored[summary_id] = dict(summary)
+
+    async def loader(summary_id):
+        return stored.get(summary_id)
+
+    store = SummaryStore(max_entries=2, saver=saver, loader=loader)
+
+    async def run():
+        first, second, third = [await store.create() for _ in range(3)]
+        assert len(store._entries) == 2
+        assert await store.get(first) == {"status": "pending"}
+        # Another worker finishes the summary; a pending summary is never served from memory
+        stored[first] = {"status": "ready", "result_analysis": "Done"}
+        assert (await store.get(first))["result_analysis"] == "Done"
+        assert await store.get("unknown") is None
+        return first
+
+    first = asyncio.run(run())
+    stats = store.stats()
+    assert (stats["loads"], stats["misses"], stats["evictions"]) == (2, 1, 2)
+    assert first in store._entries
@@ -0,0 +1,97 @@
+import asyncio
+
+from routers.nlq.text2sql_cache import Text2SQLCache, normalize_query
+
+MOCK_SQL = {"sql_query": "SELECT * FROM marketplace_product_nigeria LIMIT 10", "suggested_queries": []}
+
+
+def fake_embedder(vectors):
+    async def embed(text):
+        return vectors[text]
+
+    return embed
+
+
+def test_normalize_query():
+    """
+    Test that case, punctuation and spacing do not change the cache key.
+    """
+    assert normalize_query("  Coke UNDER 500!! ") == "coke under 500"
+    assert normalize_query(None) == ""
+
+
+def test_exact_hit_and_miss():
+    """
+    Test exact hits, misses and the partitioning by country and limit.
+    """
+    cache = Text2SQLCache()
+
+    async def run():
+        assert await cache.get("coke under 500", "Nigeria", 10) is None
+        await cache.set("coke under 500", "Nigeria", 10, MOCK_SQL)
+        assert await cache.get("Coke under 500?", "Nigeria", 10) == MOCK_SQL
+        assert await cache.get("coke under 500", "Ghana", 10) is None
+        assert await cache.get("coke under 500", "Nigeria", 20) is None
+
+    asyncio.run(run())
+    assert cache.stats()["exact_hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+def test_semantic_hit_requires_same_numbers():
+    """
+    Test that similar queries hit only when they mention the same numbers.
+    """
+    cache = Text2SQLCache(
+        similarity_threshold=0.9,
+        embedder=fake_embedder({
+            "coke under 500": [1.0, 0.0],
+            "coca cola below 500 naira": [0.99, 0.05],
+            "coca cola below 600 naira": [0.99, 0.05],
+        }),
+    )
+
+    async def run():
+        await cache.set("coke under 500", "Nigeria", 10, MOCK_SQL)
+        assert await cache.get("coca cola below 500 naira", "Nigeria", 10) == MOCK_SQL
+        assert await cache.get("coca cola below 600 naira", "Nigeria", 10) is None
+
+    asyncio.run(run())
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_lru_eviction_and_ttl():
+    """
+    Test that the least recently used entry is evicted and expired entries miss.
+    """
+    cache = Text2SQLCache(max_entries=2)
+
+    async def run():
+        await cache.set("a", "Nigeria", 10, MOCK_SQL)
+        await cache.set("b", "Nigeria", 10, MOCK_SQL)
+        await cache.get("a", "Nigeria", 10)
+        await cache.set("c", "Nigeria", 10, MOCK_SQL)
+        assert await cache.get("b", "Nigeria", 10) is None
+        assert await cache.get("a", "Nigeria", 10) == MOCK_SQL
+
+        expired = Text2SQLCache(ttl=0)
+        await expired.set("a", "Nigeria", 10, MOCK_SQL)
+        assert await expired.get("a", "Nigeria", 10) is None
+
+    asyncio.run(run())
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cached_value_is_a_copy():
+    """
+    Test that callers mutating a cached result do not corrupt the cache.
+    """
+    cache = Text2SQLCache()
+
+    async def run():
+        await cache.set("coke", "Nigeria", 10, MOCK_SQL)
+        hit = await cache.get("coke", "Nigeria", 10)
+        hit["sql"] = "mutated"
+        assert "sql" not in await cache.get("coke", "Nigeria", 10)
+
+    asyncio.run(run())